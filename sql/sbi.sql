@@ -16,6 +16,18 @@ SET time_zone = "+00:00";
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `account_exists`
+--
+
+CREATE TABLE `account_exists` (
+  `name` varchar(50) NOT NULL,
+  `found` tinyint(1) NOT NULL,
+  `checked_at` datetime NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `accounts`
 --
@@ -69,6 +81,23 @@ CREATE TABLE `configuration` (
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `ingest_cursor`
+--
+
+CREATE TABLE `ingest_cursor` (
+  `module` varchar(50) NOT NULL,
+  `account` varchar(50) NOT NULL,
+  `block` bigint(19) DEFAULT NULL,
+  `op_acc_index` bigint(19) DEFAULT NULL,
+  `trx_in_block` int(11) DEFAULT NULL,
+  `op_in_trx` int(11) DEFAULT NULL,
+  `virtual_op` int(11) DEFAULT NULL,
+  `updated_at` datetime DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `member`
 --
@@ -153,6 +182,69 @@ CREATE TABLE `member_hist` (
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `member_share_ledger`
+--
+
+CREATE TABLE `member_share_ledger` (
+  `id` int(11) NOT NULL,
+  `index` bigint(19) NOT NULL,
+  `source` varchar(50) NOT NULL,
+  `seq` int(11) NOT NULL,
+  `account` varchar(50) NOT NULL,
+  `sponsor` varchar(50) NOT NULL,
+  `shares` int(11) NOT NULL,
+  `timestamp` datetime NOT NULL,
+  `share_type` varchar(50) NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `member_share_state`
+--
+
+CREATE TABLE `member_share_state` (
+  `account` varchar(50) NOT NULL,
+  `shares` int(11) DEFAULT NULL,
+  `original_enrollment` datetime DEFAULT NULL,
+  `latest_enrollment` datetime DEFAULT NULL,
+  `last_index` bigint(19) DEFAULT NULL,
+  `last_source` varchar(50) DEFAULT NULL,
+  `last_seq` int(11) DEFAULT NULL,
+  `share_entries` longtext DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `memo_exclusions`
+--
+
+CREATE TABLE `memo_exclusions` (
+  `account` varchar(16) NOT NULL,
+  `field` varchar(6) NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+--
+-- Dumping data for table `memo_exclusions`
+--
+
+INSERT INTO `memo_exclusions` (`account`, `field`) VALUES
+('dtube.rewards', 'sender'),
+('reward.app', 'sender'),
+('sbi2', 'to'),
+('sbi3', 'to'),
+('sbi4', 'to'),
+('sbi5', 'to'),
+('sbi6', 'to'),
+('sbi7', 'to'),
+('sbi8', 'to'),
+('sbi9', 'to'),
+('sbi10', 'to');
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `pending_refunds`
 --
@@ -274,10 +366,29 @@ CREATE TABLE `trx_backup` (
   `share_type` varchar(50) NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
 
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `trx_change`
+--
+
+CREATE TABLE `trx_change` (
+  `id` int(11) NOT NULL,
+  `index` bigint(19) DEFAULT NULL,
+  `source` varchar(50) NOT NULL,
+  `changed_at` datetime DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
 --
 -- Indexes for dumped tables
 --
 
+--
+-- Indexes for table `account_exists`
+--
+ALTER TABLE `account_exists`
+  ADD PRIMARY KEY (`name`);
+
 --
 -- Indexes for table `accounts`
 --
@@ -296,6 +407,12 @@ ALTER TABLE `blacklist`
 ALTER TABLE `configuration`
   ADD PRIMARY KEY (`id`);
 
+--
+-- Indexes for table `ingest_cursor`
+--
+ALTER TABLE `ingest_cursor`
+  ADD PRIMARY KEY (`module`,`account`);
+
 --
 -- Indexes for table `member`
 --
@@ -316,6 +433,26 @@ ALTER TABLE `member_backup`
 ALTER TABLE `member_hist`
   ADD PRIMARY KEY (`id`);
 
+--
+-- Indexes for table `member_share_ledger`
+--
+ALTER TABLE `member_share_ledger`
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `ix_member_share_ledger_index_source_seq` (`index`,`source`,`seq`),
+  ADD KEY `ix_member_share_ledger_account` (`account`);
+
+--
+-- Indexes for table `member_share_state`
+--
+ALTER TABLE `member_share_state`
+  ADD PRIMARY KEY (`account`);
+
+--
+-- Indexes for table `memo_exclusions`
+--
+ALTER TABLE `memo_exclusions`
+  ADD PRIMARY KEY (`account`,`field`);
+
 --
 -- Indexes for table `pending_refunds`
 --
@@ -332,7 +469,9 @@ ALTER TABLE `steem_keys`
 -- Indexes for table `transaction_memo`
 --
 ALTER TABLE `transaction_memo`
-  ADD PRIMARY KEY (`id`);
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `ix_transaction_memo_sender` (`sender`),
+  ADD KEY `ix_transaction_memo_to` (`to`);
 
 --
 -- Indexes for table `transaction_out`
@@ -350,7 +489,11 @@ ALTER TABLE `transfer_memos`
 -- Indexes for table `trx`
 --
 ALTER TABLE `trx`
-  ADD PRIMARY KEY (`index`,`source`);
+  ADD PRIMARY KEY (`index`,`source`),
+  ADD KEY `ix_trx_source_index` (`source`,`index`),
+  ADD KEY `ix_trx_source_account` (`source`,`account`),
+  ADD KEY `ix_trx_account_share_type` (`account`,`share_type`),
+  ADD KEY `ix_trx_share_type_index` (`share_type`,`index`);
 
 --
 -- Indexes for table `trx_backup`
@@ -358,6 +501,12 @@ ALTER TABLE `trx`
 ALTER TABLE `trx_backup`
   ADD PRIMARY KEY (`index`,`source`);
 
+--
+-- Indexes for table `trx_change`
+--
+ALTER TABLE `trx_change`
+  ADD PRIMARY KEY (`id`);
+
 --
 -- AUTO_INCREMENT for dumped tables
 --
@@ -368,6 +517,16 @@ ALTER TABLE `trx_backup`
 ALTER TABLE `member_hist`
   MODIFY `id` int(11) NOT NULL AUTO_INCREMENT;
 --
+-- AUTO_INCREMENT for table `member_share_ledger`
+--
+ALTER TABLE `member_share_ledger`
+  MODIFY `id` int(11) NOT NULL AUTO_INCREMENT;
+--
+-- AUTO_INCREMENT for table `trx_change`
+--
+ALTER TABLE `trx_change`
+  MODIFY `id` int(11) NOT NULL AUTO_INCREMENT;
+--
 -- AUTO_INCREMENT for table `pending_refunds`
 --
 ALTER TABLE `pending_refunds`
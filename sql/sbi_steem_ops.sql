@@ -34,6 +34,23 @@ CREATE TABLE `curation_optimization` (
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `ingest_cursor`
+--
+
+CREATE TABLE `ingest_cursor` (
+  `module` varchar(50) NOT NULL,
+  `account` varchar(50) NOT NULL,
+  `block` bigint(19) DEFAULT NULL,
+  `op_acc_index` bigint(19) DEFAULT NULL,
+  `trx_in_block` int(11) DEFAULT NULL,
+  `op_in_trx` int(11) DEFAULT NULL,
+  `virtual_op` int(11) DEFAULT NULL,
+  `updated_at` datetime DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `member_hist`
 --
@@ -305,6 +322,12 @@ ALTER TABLE `curation_optimization`
   ADD PRIMARY KEY (`member`,`created`),
   ADD KEY `ix_curation_optimization_1f3f6589887b9c0e` (`member`,`created`);
 
+--
+-- Indexes for table `ingest_cursor`
+--
+ALTER TABLE `ingest_cursor`
+  ADD PRIMARY KEY (`module`,`account`);
+
 --
 -- Indexes for table `member_hist`
 --
@@ -0,0 +1,164 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from nectar.account import Accounts
+from nectar.exceptions import AccountDoesNotExistsException
+from nectar.instance import shared_blockchain_instance
+from nectar.utils import addTzInfo
+
+log = logging.getLogger(__name__)
+
+# One segment of an account name, names are segments joined by "."
+ACCOUNT_SEGMENT = re.compile(r"^[a-z][a-z0-9-]*[a-z0-9]$")
+
+
+def is_valid_account_name(name):
+    """Returns True when name can be an account name on chain"""
+    if not isinstance(name, str) or len(name) < 3 or len(name) > 16:
+        return False
+    for segment in name.split("."):
+        if len(segment) < 3 or not ACCOUNT_SEGMENT.match(segment):
+            return False
+    return True
+
+
+class AccountLookup:
+    """Checks whether accounts exist, with as few RPC calls as possible
+
+    Names are looked up in an in-process LRU cache first, then in the
+    account_exists table and only the remaining names are fetched from the
+    node, all of them with one batched call. Names which can not be account
+    names are rejected without a lookup. Lookups of several threads run one
+    after the other. With defer_writes the fetched names are written to the
+    account_exists table by ``flush`` only, so worker threads never write to
+    a database whose transaction another thread holds.
+
+    :param blockchain_instance: Hive instance
+    :param AccountExistsDB storage: persistent cache, only the LRU cache is used when None
+    :param int maxsize: number of names kept in the LRU cache
+    :param timedelta ttl: lifetime of a cached existing account
+    :param timedelta negative_ttl: lifetime of a cached missing account
+    :param bool defer_writes: keep the fetched names until ``flush``
+    """
+
+    def __init__(
+        self,
+        blockchain_instance=None,
+        storage=None,
+        maxsize=10000,
+        ttl=timedelta(days=30),
+        negative_ttl=timedelta(hours=6),
+        defer_writes=False,
+    ):
+        self.hive = blockchain_instance or shared_blockchain_instance()
+        self.storage = storage
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.defer_writes = defer_writes
+        self.pending = {}
+        self.cache = OrderedDict()
+        self.rpc_calls = 0
+        self.lock = threading.Lock()
+        if self.storage is not None:
+            self.storage.create_table()
+
+    def _expired(self, found, checked_at, now):
+        ttl = self.ttl if found else self.negative_ttl
+        return now - checked_at > ttl
+
+    def _cache_get(self, name, now):
+        if name not in self.cache:
+            return None
+        found, checked_at = self.cache[name]
+        if self._expired(found, checked_at, now):
+            del self.cache[name]
+            return None
+        self.cache.move_to_end(name)
+        return found
+
+    def _cache_set(self, name, found, checked_at):
+        self.cache[name] = (found, checked_at)
+        self.cache.move_to_end(name)
+        while len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+
+    def _fetch(self, names):
+        if not self.hive.is_connected():
+            raise ConnectionError("no node connected")
+        self.rpc_calls += 1
+        accounts = Accounts(names, lazy=True, full=False, blockchain_instance=self.hive)
+        existing = {account["name"] for account in accounts}
+        return {name: name in existing for name in names}
+
+    def lookup(self, names):
+        """Check a batch of account names
+
+        :param list names: account names
+        :returns: name -> True when the account exists
+        """
+        with self.lock:
+            return self._lookup(names)
+
+    def _lookup(self, names):
+        now = datetime.now(timezone.utc)
+        result = {}
+        missing = []
+        for name in names:
+            if name in result or name in missing:
+                continue
+            if not is_valid_account_name(name):
+                result[name] = False
+                continue
+            found = self._cache_get(name, now)
+            if found is None:
+                missing.append(name)
+            else:
+                result[name] = found
+        if len(missing) > 0 and self.storage is not None:
+            rows = self.storage.get_many(missing)
+            for name in list(missing):
+                if name not in rows:
+                    continue
+                checked_at = addTzInfo(rows[name]["checked_at"])
+                found = bool(rows[name]["found"])
+                if self._expired(found, checked_at, now):
+                    continue
+                self._cache_set(name, found, checked_at)
+                result[name] = found
+                missing.remove(name)
+        if len(missing) > 0:
+            try:
+                fetched = self._fetch(missing)
+            except Exception as e:
+                # Not cached, the names are checked again on the next lookup
+                log.warning(f"Could not look up accounts {missing}: {e}")
+                fetched = {name: False for name in missing}
+            else:
+                for name in fetched:
+                    self._cache_set(name, fetched[name], now)
+                if self.storage is not None and self.defer_writes:
+                    self.pending.update(fetched)
+                elif self.storage is not None:
+                    self.storage.set_many(fetched)
+            result.update(fetched)
+        return result
+
+    def flush(self):
+        """Write the fetched names kept by defer_writes to the account_exists table"""
+        with self.lock:
+            if len(self.pending) > 0:
+                self.storage.set_many(self.pending)
+                self.pending = {}
+
+    def exists(self, name):
+        """Returns True when the account exists"""
+        return self.lookup([name])[name]
+
+    def check(self, name):
+        """Raises AccountDoesNotExistsException when the account does not exist"""
+        if not self.exists(name):
+            raise AccountDoesNotExistsException(name)
@@ -0,0 +1,74 @@
+"""Lightweight parsing of the amounts in op_dict
+
+nectar's Amount looks up the asset through the blockchain instance for every
+amount. The replay loops only need the integer amount and the symbol, which
+are decoded here from the legacy ``"1.000 HIVE"`` string or the NAI form
+``{"amount": "1000", "precision": 3, "nai": "@@000000021"}``.
+"""
+
+# Assets of Hive, used when no blockchain instance is given
+HIVE_CHAIN_ASSETS = [
+    {"asset": "@@000000013", "symbol": "HBD", "precision": 3},
+    {"asset": "@@000000021", "symbol": "HIVE", "precision": 3},
+    {"asset": "@@000000037", "symbol": "VESTS", "precision": 6},
+]
+
+
+def asset_table(blockchain_instance=None):
+    """Returns NAI and symbol -> (symbol, precision) of the assets of a chain"""
+    if blockchain_instance is None:
+        chain_assets = HIVE_CHAIN_ASSETS
+    else:
+        chain_assets = blockchain_instance.chain_params["chain_assets"]
+    assets = {}
+    for asset in chain_assets:
+        assets[asset["asset"]] = (asset["symbol"], asset["precision"])
+        assets[asset["symbol"]] = (asset["symbol"], asset["precision"])
+    return assets
+
+
+HIVE_ASSETS = asset_table()
+
+
+def parse_amount(value, assets=HIVE_ASSETS):
+    """Returns the amount in satoshis and the symbol
+
+    :param value: amount as legacy string, NAI dict or NAI list
+    :param dict assets: see asset_table
+    :raises ValueError: for unknown assets or malformed amounts
+    """
+    if isinstance(value, str):
+        amount, symbol = value.split(" ")
+        if symbol not in assets:
+            raise ValueError(f"Unknown asset {symbol}")
+        precision = assets[symbol][1]
+        negative = amount[:1] == "-"
+        if negative:
+            amount = amount[1:]
+        integer, _, fraction = amount.partition(".")
+        if len(fraction) > precision:
+            raise ValueError(f"{value} has more than {precision} decimals")
+        satoshis = int(integer or "0") * 10**precision + int(fraction.ljust(precision, "0") or "0")
+        return -satoshis if negative else satoshis, symbol
+    if isinstance(value, dict):
+        satoshis, nai = value["amount"], value["nai"]
+    elif isinstance(value, (list, tuple)) and len(value) == 3:
+        satoshis, nai = value[0], value[2]
+    else:
+        raise ValueError(f"Unknown amount format {value}")
+    if nai not in assets:
+        raise ValueError(f"Unknown asset {nai}")
+    return int(satoshis), assets[nai][0]
+
+
+def amount_value(satoshis, symbol, assets=HIVE_ASSETS):
+    """Returns the amount as float, the same as Amount.amount"""
+    return satoshis / 10 ** assets[symbol][1]
+
+
+def format_amount(satoshis, symbol, assets=HIVE_ASSETS):
+    """Returns the amount as string, the same as str(Amount)"""
+    precision = assets[symbol][1]
+    sign = "-" if satoshis < 0 else ""
+    integer, fraction = divmod(abs(satoshis), 10**precision)
+    return f"{sign}{integer}.{fraction:0{precision}d} {symbol}"
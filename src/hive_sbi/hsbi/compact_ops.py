@@ -0,0 +1,83 @@
+import json
+import sys
+
+from hive_sbi.hsbi.core import get_logger
+from hive_sbi.hsbi.transfer_ops_storage import COMPACT_PREFIX, encode_op_dict
+
+logger = get_logger()
+
+
+def convert_ops(accountTrx, expand=False, chunk_size=1000):
+    """
+    Rewrite the op_dict column of an <account>_ops table
+
+    Each chunk is updated in its own transaction, an interrupted run can be
+    started again and only converts the remaining rows.
+
+    Args:
+        accountTrx (AccountTrx): Storage object of the ops table
+        expand (bool): Convert back to the JSON encoding
+        chunk_size (int): Rows per transaction
+
+    Returns:
+        tuple: Converted rows, op_dict bytes before and after
+    """
+    table = accountTrx.db[accountTrx.__tablename__]
+    converted = 0
+    size_before = 0
+    size_after = 0
+    batch = []
+    for op in accountTrx.iter_all(chunk_size=chunk_size):
+        is_compact = op["op_dict"].startswith(COMPACT_PREFIX)
+        if is_compact != expand:
+            continue
+        size_before += len(op["op_dict"])
+        if expand:
+            op_dict = json.dumps(op.op)
+        else:
+            op_dict = encode_op_dict(op)
+        size_after += len(op_dict)
+        batch.append({"op_acc_index": op["op_acc_index"], "op_dict": op_dict})
+        if len(batch) >= chunk_size:
+            converted += _update_batch(accountTrx.db, table, batch)
+            batch = []
+    if len(batch) > 0:
+        converted += _update_batch(accountTrx.db, table, batch)
+    return converted, size_before, size_after
+
+
+def _update_batch(db, table, batch):
+    with db:
+        for row in batch:
+            table.update(row, ["op_acc_index"])
+    return len(batch)
+
+
+def run():
+    """Convert the op_dict column of all ops tables to the compact encoding
+
+    ``hsbi compact-ops --expand`` converts them back to JSON.
+    """
+    from hive_sbi.hsbi.core import load_config, setup_account_trx, setup_database_connections
+    from hive_sbi.hsbi.storage import AccountsDB
+
+    expand = "--expand" in sys.argv[2:]
+
+    config_data = load_config()
+    db, db2 = setup_database_connections(config_data)
+
+    accountTrx = setup_account_trx(db, AccountsDB(db2).get())
+    for account in accountTrx:
+        if not accountTrx[account].exists_table():
+            continue
+        converted, size_before, size_after = convert_ops(accountTrx[account], expand=expand)
+        logger.info(
+            f"{accountTrx[account].__tablename__}: {converted} rows, "
+            f"op_dict {size_before} -> {size_after} bytes"
+        )
+    if not expand and db.engine.dialect.name == "mysql":
+        logger.info("Run OPTIMIZE TABLE on the ops tables to release the freed space")
+
+
+if __name__ == "__main__":
+    run()
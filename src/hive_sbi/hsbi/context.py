@@ -0,0 +1,116 @@
+"""Process-wide runtime context of the hsbi modules
+
+run_all runs nine modules in one process. Each of them loaded the config,
+connected both databases, set up the storage objects and refreshed the node
+list on its own, about 20 connects and 9 node list updates per cycle.
+HsbiContext does each of these once per process and is passed to the run(ctx)
+of every module. A module run on its own creates its own context. The node
+list itself is cached across processes by NodePool.
+"""
+
+from nectar import Hive
+
+from hive_sbi.hsbi.core import (
+    load_config,
+    load_storage_data,
+    setup_database_connections,
+    setup_storage_objects,
+)
+from hive_sbi.hsbi.node_pool import NodePool
+
+
+class HsbiContext:
+    """Config, database connections, storage objects and Hive clients of a process
+
+    Everything is created on first use. The storage objects are kept for the
+    lifetime of the context, the rows read with them (accounts, conf_setup,
+    blacklist) are read again by refresh, which the runner calls before each
+    module.
+
+    :param str config_file: config file, see load_config
+    :param dict config_data: configuration, config_file is not read when given
+    """
+
+    def __init__(self, config_file="config.json", config_data=None):
+        self.config_file = config_file
+        self._config = config_data
+        self._connections = None
+        self._storage = None
+        self._node_pool = None
+        self._hive = {}
+        self._database_initialized = False
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = load_config(self.config_file)
+        return self._config
+
+    @property
+    def hive_blockchain(self):
+        return self.config.get("hive_blockchain", True)
+
+    def _connect(self):
+        if self._connections is None:
+            self._connections = setup_database_connections(self.config)
+        return self._connections
+
+    @property
+    def db(self):
+        """Ops database"""
+        return self._connect()[0]
+
+    @property
+    def db2(self):
+        """SBI database"""
+        return self._connect()[1]
+
+    def init_database(self):
+        """Create the sbi tables and default rows, once per context"""
+        if not self._database_initialized:
+            from hive_sbi.hsbi.init_db import init_database
+
+            init_database(config_data=self.config, db2=self.db2)
+            self._database_initialized = True
+
+    @property
+    def storage(self):
+        """Storage objects and data, see setup_storage_objects"""
+        if self._storage is None:
+            self._storage = setup_storage_objects(self.db, self.db2)
+        return self._storage
+
+    def refresh(self):
+        """Read the accounts, the configuration and the blacklist again, returns the storage"""
+        if self._storage is None:
+            return self.storage
+        return load_storage_data(self._storage)
+
+    @property
+    def node_pool(self):
+        """Cached and health ordered nodes of the configured chain, see NodePool"""
+        if self._node_pool is None:
+            self._node_pool = NodePool(
+                cache_file=self.config.get("node_cache_file", "node_cache.json"),
+                ttl=self.config.get("node_cache_hours", 6) * 3600,
+                hive=self.hive_blockchain,
+            )
+        return self._node_pool
+
+    @property
+    def nodes(self):
+        """Nodes of the configured chain, the fastest healthy node first"""
+        return self.node_pool.nodes()
+
+    def hive(self, keys=None, **kwargs):
+        """Returns a Hive client on the nodes, one per context for each set of keys and options
+
+        :param list keys: private keys of the wallet
+        :param kwargs: further Hive options, e.g. num_retries or timeout
+        """
+        key = (tuple(keys or ()), tuple(sorted(kwargs.items())))
+        if key not in self._hive:
+            if keys:
+                kwargs["keys"] = keys
+            self._hive[key] = Hive(node=self.nodes, **kwargs)
+        return self._hive[key]
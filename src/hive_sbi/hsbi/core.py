@@ -2,8 +2,6 @@ import json
 import logging
 import os
 
-import dataset
-
 
 def get_logger(name="hive_sbi.hsbi"):
     """
@@ -70,6 +68,9 @@ def setup_database_connections(config_data):
     Returns:
         tuple: (db, db2) - Primary and secondary database connections
     """
+    # dataset imports SQLAlchemy and alembic, which are only needed once a database is used
+    import dataset
+
     databaseConnector = config_data.get("databaseConnector")
     databaseConnector2 = config_data.get("databaseConnector2")
 
@@ -113,6 +114,19 @@ def setup_storage_objects(db, db2):
     storage["transferMemosStorage"] = TransferMemoDB(db2)
     storage["blacklistStorage"] = BlacklistDB(db2)
 
+    return load_storage_data(storage)
+
+
+def load_storage_data(storage):
+    """
+    Read the accounts, the configuration and the blacklist into the storage dictionary
+
+    Args:
+        storage (dict): Dictionary of storage objects from setup_storage_objects
+
+    Returns:
+        dict: The storage dictionary
+    """
     # Get accounts
     storage["accounts"] = storage["accountStorage"].get()
     storage["other_accounts"] = storage["accountStorage"].get_transfer()
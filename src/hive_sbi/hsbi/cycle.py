@@ -1,5 +1,12 @@
+import json
+import os
+import time
+
+from hive_sbi.hsbi.core import get_logger
 from hive_sbi.hsbi.utils import get_elapsed_time_minutes
 
+logger = get_logger()
+
 
 def is_new_cycle(conf_setup, print_info=True):
     """
@@ -29,6 +36,68 @@ def is_new_cycle(conf_setup, print_info=True):
     return elapsed_minutes > share_cycle_min
 
 
+def minutes_to_next_cycle(conf_setup):
+    """
+    Get the minutes until the next cycle is due
+
+    Args:
+        conf_setup (dict): Configuration setup from ConfigurationDB
+
+    Returns:
+        float: Minutes until is_new_cycle returns True, 0 or less when it is due
+    """
+    last_cycle = conf_setup.get("last_cycle")
+    if last_cycle is None:
+        return 0
+    return conf_setup.get("share_cycle_min") - get_elapsed_time_minutes(last_cycle)
+
+
+def write_cycle_stamp(conf_setup, stamp_file="cycle_stamp.json"):
+    """
+    Write the time of the next cycle to the cycle stamp file
+
+    hsbi reads the stamp before it imports the database and chain libraries,
+    so a run before the next cycle ends without them.
+
+    Args:
+        conf_setup (dict): Configuration setup from ConfigurationDB
+        stamp_file (str): Path of the cycle stamp file
+    """
+    now = time.time()
+    data = {"next_cycle": now + minutes_to_next_cycle(conf_setup) * 60, "checked": now}
+    tmp_file = stamp_file + ".tmp"
+    try:
+        with open(tmp_file, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_file, stamp_file)
+    except OSError as e:
+        logger.warning(f"could not write cycle stamp {stamp_file}: {str(e)}")
+
+
+def read_cycle_stamp(stamp_file="cycle_stamp.json", max_age_minutes=10):
+    """
+    Get the minutes until the next cycle from the cycle stamp file
+
+    Args:
+        stamp_file (str): Path of the cycle stamp file
+        max_age_minutes (float): Age after which the stamp is not used, the
+            configuration table may have been changed since
+
+    Returns:
+        float: Minutes until the next cycle, None when there is no usable stamp
+    """
+    try:
+        with open(stamp_file) as f:
+            data = json.load(f)
+        next_cycle, checked = float(data["next_cycle"]), float(data["checked"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    now = time.time()
+    if now < checked or now - checked > max_age_minutes * 60:
+        return None
+    return (next_cycle - now) / 60
+
+
 def get_cycle_config(conf_setup):
     """
     Get cycle configuration parameters
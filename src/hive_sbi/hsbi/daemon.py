@@ -0,0 +1,101 @@
+import signal
+import threading
+import time
+
+from hive_sbi.hsbi.core import get_logger
+from hive_sbi.hsbi.cycle import minutes_to_next_cycle
+
+logger = get_logger()
+
+
+class Daemon:
+    """Runs the share cycle and the stream modules in one long-lived process
+
+    The cycle modules run when last_cycle plus share_cycle_min of the
+    configuration table has passed, the stream modules every stream_minutes.
+    In between the daemon sleeps, the context with its connections, node
+    list and Hive clients is kept across the runs.
+
+    :param HsbiContext ctx: shared runtime context
+    :param float stream_minutes: minutes between the runs of the stream modules
+    :param float retry_minutes: wait before the cycle is started again when it
+        is still due after a run, e.g. after an error
+    :param float max_sleep_minutes: longest sleep, the configuration table is
+        read again after it
+    """
+
+    def __init__(self, ctx, stream_minutes=5, retry_minutes=5, max_sleep_minutes=10):
+        self.ctx = ctx
+        self.stream_minutes = stream_minutes
+        self.retry_minutes = retry_minutes
+        self.max_sleep_minutes = max_sleep_minutes
+        self.stop_event = threading.Event()
+        self.next_stream = 0
+        self.next_cycle_retry = 0
+
+    def run_cycle(self):
+        from hive_sbi.hsbi.runner import run_all
+
+        run_all(self.ctx, stop_event=self.stop_event)
+
+    def run_stream(self):
+        from hive_sbi.hsbi.runner import STREAM_MODULES, run_module
+
+        for module in STREAM_MODULES:
+            if self.stop_event.is_set():
+                return
+            run_module(module, self.ctx, check_cycle=False)
+
+    def _run(self, name, func):
+        try:
+            func()
+        except Exception:
+            # A failed run must not end the daemon, the next run starts over
+            logger.exception(f"daemon: {name} failed")
+
+    def step(self, now=None):
+        """Run the due modules, returns the seconds until the next run is due"""
+        now = time.time() if now is None else now
+        cycle_in = minutes_to_next_cycle(self.ctx.refresh()["conf_setup"]) * 60
+        if cycle_in <= 0 and now >= self.next_cycle_retry:
+            logger.info("daemon: starting a new cycle")
+            self._run("cycle", self.run_cycle)
+            # A cycle which is still due after its run is retried after retry_minutes
+            self.next_cycle_retry = now + self.retry_minutes * 60
+            cycle_in = minutes_to_next_cycle(self.ctx.refresh()["conf_setup"]) * 60
+        elif now >= self.next_stream:
+            self._run("stream", self.run_stream)
+            self.next_stream = now + self.stream_minutes * 60
+        cycle_in = max(cycle_in, self.next_cycle_retry - now)
+        return max(0, min(cycle_in, self.next_stream - now, self.max_sleep_minutes * 60))
+
+    def stop(self, *args):
+        logger.info("daemon: stopping after the running module")
+        self.stop_event.set()
+
+    def run_forever(self):
+        while not self.stop_event.is_set():
+            sleep = self.step()
+            if sleep > 0:
+                logger.info(f"daemon: next run in {sleep / 60:.1f} min")
+                self.stop_event.wait(sleep)
+
+
+def run():
+    """Run the share cycle and the stream modules until SIGTERM or SIGINT"""
+    from hive_sbi.hsbi.context import HsbiContext
+
+    ctx = HsbiContext()
+    ctx.init_database()
+    daemon = Daemon(
+        ctx,
+        stream_minutes=ctx.config.get("daemon_stream_minutes", 5),
+        retry_minutes=ctx.config.get("daemon_retry_minutes", 5),
+    )
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run_forever()
+
+
+if __name__ == "__main__":
+    run()
@@ -7,19 +7,23 @@ from hive_sbi.hsbi.core import load_config
 from hive_sbi.hsbi.storage import AccountsDB, BlacklistDB, KeysDB
 
 
-def init_database(config_file="config.json"):
+def init_database(config_file="config.json", config_data=None, db2=None):
     """
     Initialize the database with configuration data from config.json
 
     Args:
         config_file (str): Path to the configuration file
+        config_data (dict, optional): Configuration data, loaded from config_file when None
+        db2 (dataset.Database, optional): Secondary database connection, opened when None
     """
     # Load configuration
-    config_data = load_config(config_file)
+    if config_data is None:
+        config_data = load_config(config_file)
 
     # Connect to databases
     # db = dataset.connect(config_data["databaseConnector"])
-    db2 = dataset.connect(config_data["databaseConnector2"])
+    if db2 is None:
+        db2 = dataset.connect(config_data["databaseConnector2"])
 
     # Initialize configuration table
     conf_table = db2["configuration"]
@@ -1,8 +1,222 @@
+import heapq
+from array import array
 from datetime import datetime, timezone
 
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, ShareAgeStore.share_days falls back to a Python loop
+    np = None
+
+SECONDS_PER_DAY = 60 * 60 * 24
+
+
+def _epoch(timestamp):
+    # Ensure timestamp has timezone information
+    if timestamp.tzinfo is None:
+        # Add UTC timezone to naive datetime
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+class ShareAgeStore:
+    """Share events of many members in flat columns
+
+    Every event is a member slot, a timestamp in epoch seconds and the shares.
+    The share ages of all members are computed in one pass over the columns
+    against a single "now", instead of one datetime per event and member.
+    When numpy is installed the pass runs vectorized over the columns.
+    The events of reset members are dropped from the columns once they are
+    the larger part, so a long-lived store does not grow with every reset.
+    """
+
+    def __init__(self):
+        self.slots = {}
+        self.slot_count = 0
+        self.member = array("l")
+        self.timestamp = array("d")
+        self.shares = array("q")
+        # Events per slot and events of the slots no account points to anymore
+        self.events = []
+        self.dropped = 0
+        self.now = None
+        self._positions = None
+
+    def _slot(self, account):
+        if account not in self.slots:
+            self.slots[account] = self.slot_count
+            self.slot_count += 1
+            self.events.append(0)
+        return self.slots[account]
+
+    def append(self, account, timestamp, shares):
+        """Add a share event of a member"""
+        slot = self.slots.get(account)
+        if slot is None:
+            slot = self._slot(account)
+        self.member.append(slot)
+        self.timestamp.append(_epoch(timestamp))
+        self.shares.append(shares)
+        self.events[slot] += 1
+        self._positions = None
+
+    def reset(self, account):
+        """Drop the share events of a member"""
+        if account not in self.slots:
+            return
+        # The old events keep their slot, which no account points to anymore
+        self.dropped += self.events[self.slots.pop(account)]
+        self._slot(account)
+        self._positions = None
+        if 2 * self.dropped > len(self.member) or self.slot_count > 2 * len(self.slots):
+            self.compact()
+
+    def compact(self):
+        """Remove the events and slots of reset members from the columns"""
+        live = {slot: new for new, slot in enumerate(self.slots.values())}
+        keep = [i for i, slot in enumerate(self.member) if slot in live]
+        self.member = array("l", (live[self.member[i]] for i in keep))
+        self.timestamp = array("d", (self.timestamp[i] for i in keep))
+        self.shares = array("q", (self.shares[i] for i in keep))
+        self.events = [self.events[slot] for slot in live]
+        self.slots = {account: live[slot] for account, slot in self.slots.items()}
+        self.slot_count = len(self.slots)
+        self.dropped = 0
+        self._positions = None
+
+    def positions(self, account):
+        """Returns the column positions of the events of a member"""
+        if self._positions is None:
+            positions = {}
+            for i, slot in enumerate(self.member):
+                positions.setdefault(slot, []).append(i)
+            self._positions = positions
+        if account not in self.slots:
+            return []
+        return self._positions.get(self.slots[account], [])
+
+    def share_days(self, now=None):
+        """Sum up the share days of all members in one pass
+
+        :param datetime now: reference time of the share ages, current time when None
+        :returns: slot -> [share days, shares, events]
+        """
+        if now is None:
+            now = datetime.now(timezone.utc)
+        self.now = now
+        now_ts = _epoch(now)
+        if np is not None and len(self.member) > 0:
+            return self._share_days_numpy(now_ts)
+        totals = [[0, 0, 0] for _ in range(self.slot_count)]
+        for slot, ts, shares in zip(self.member, self.timestamp, self.shares):
+            total = totals[slot]
+            total[0] += int((now_ts - ts) / SECONDS_PER_DAY) * shares
+            total[1] += shares
+            total[2] += 1
+        return totals
+
+    def _share_days_numpy(self, now_ts):
+        member = np.frombuffer(self.member, dtype=self.member.typecode)
+        timestamp = np.frombuffer(self.timestamp, dtype=self.timestamp.typecode)
+        shares = np.frombuffer(self.shares, dtype=self.shares.typecode)
+        # astype truncates towards zero like int()
+        days = ((now_ts - timestamp) / SECONDS_PER_DAY).astype(np.int64)
+        # The float sums are exact, share days and shares stay far below 2**53
+        share_days = np.bincount(member, weights=days * shares, minlength=self.slot_count)
+        share_sums = np.bincount(member, weights=shares, minlength=self.slot_count)
+        events = np.bincount(member, minlength=self.slot_count)
+        totals = np.stack(
+            [share_days.astype(np.int64), share_sums.astype(np.int64), events.astype(np.int64)],
+            axis=1,
+        )
+        return totals.tolist()
+
+    def member_share_days(self, account, now, until=None):
+        """Sum up the share days of one member, see share_days"""
+        now_ts = _epoch(now)
+        until_ts = _epoch(until) if until is not None else None
+        total = [0, 0, 0]
+        for i in self.positions(account):
+            ts = self.timestamp[i]
+            if until_ts is not None and ts > until_ts:
+                continue
+            total[0] += int((now_ts - ts) / SECONDS_PER_DAY) * self.shares[i]
+            total[1] += self.shares[i]
+            total[2] += 1
+        return total
+
+
+def calc_share_ages(member_data, now=None):
+    """Calculate total_share_days and avg_share_age of all members
+
+    Members which share a ShareAgeStore are computed in one pass over its columns.
+
+    :param dict member_data: account -> Member
+    :param datetime now: reference time of the share ages, current time when None
+    """
+    if now is None:
+        now = datetime.now(timezone.utc)
+    totals = {}
+    for member in member_data.values():
+        store = member.store
+        if id(store) not in totals:
+            totals[id(store)] = store.share_days(now)
+        member._set_share_age(totals[id(store)][store.slots[member["account"]]])
+
+
+class ShareAgeIndex:
+    """Max-heap of the members by avg_share_age
+
+    The share ages are calculated once when the index is built. Changed members
+    are pushed again and outdated heap entries are dropped when they reach the
+    top, ties go to the member which comes first in member_data.
+    """
+
+    def __init__(self, member_data, now=None):
+        self.member_data = member_data
+        calc_share_ages(member_data, now=now)
+        self.order = {}
+        self.heap = []
+        for account in member_data:
+            self.order[account] = len(self.order)
+            self._push(account)
+        heapq.heapify(self.heap)
+
+    def _push(self, account, heappush=False):
+        avg_share_age = self.member_data[account]["avg_share_age"]
+        if avg_share_age <= 0:
+            return
+        entry = (-avg_share_age, self.order[account], account)
+        if heappush:
+            heapq.heappush(self.heap, entry)
+        else:
+            self.heap.append(entry)
+
+    def set(self, account, avg_share_age):
+        """Set the avg_share_age of a member, e.g. 0 after it was selected"""
+        self.member_data[account]["avg_share_age"] = avg_share_age
+        if account not in self.order:
+            self.order[account] = len(self.order)
+        self._push(account, heappush=True)
+
+    def update(self, account, now=None):
+        """Calculate the share age of a member again after it received shares"""
+        self.member_data[account].calc_share_age(now=now)
+        self.set(account, self.member_data[account]["avg_share_age"])
+
+    def highest(self):
+        """Returns the member with the highest avg_share_age, None when all are 0"""
+        while len(self.heap) > 0:
+            neg_avg_share_age, _, account = self.heap[0]
+            member = self.member_data.get(account)
+            if member is not None and member["avg_share_age"] == -neg_avg_share_age:
+                return account
+            heapq.heappop(self.heap)
+        return None
+
 
 class Member(dict):
-    def __init__(self, account, shares=0, timestamp=None):
+    def __init__(self, account, shares=0, timestamp=None, store=None):
         if isinstance(account, dict):
             member = account
         else:
@@ -23,54 +237,67 @@ class Member(dict):
                 "balance_rshares": 0,
                 "comment_upvote": False,
             }
-        self.share_age_list = []
-        self.shares_list = []
-        self.share_timestamp = []
+        # Members which are computed together should share one store
+        self.store = store if store is not None else ShareAgeStore()
         super().__init__(member)
+        self.store.reset(self["account"])
+        self.store._slot(self["account"])
+
+    @property
+    def shares_list(self):
+        return [self.store.shares[i] for i in self.store.positions(self["account"])]
+
+    @property
+    def share_timestamp(self):
+        return [
+            datetime.fromtimestamp(self.store.timestamp[i], timezone.utc)
+            for i in self.store.positions(self["account"])
+        ]
+
+    @property
+    def share_age_list(self):
+        now = _epoch(self.store.now or datetime.now(timezone.utc))
+        return [
+            int((now - self.store.timestamp[i]) / SECONDS_PER_DAY)
+            for i in self.store.positions(self["account"])
+        ]
 
     def reset_share_age_list(self):
-        self.share_age_list = []
-        self.shares_list = []
-        self.share_timestamp = []
+        self.store.reset(self["account"])
 
     def append_share_age(self, timestamp, shares):
         if shares == 0:
             return
-        # Ensure timestamp has timezone information
-        if timestamp.tzinfo is None:
-            # Add UTC timezone to naive datetime
-            timestamp = timestamp.replace(tzinfo=timezone.utc)
-        age = (datetime.now(timezone.utc)) - (timestamp)
-        share_age = int(age.total_seconds() / 60 / 60 / 24)
-        self.share_age_list.append(share_age)
-        self.shares_list.append(shares)
-        self.share_timestamp.append(timestamp)
-
-    def calc_share_age(self):
-        total_share_days = 0
-        if len(self.share_age_list) == 0:
-            self["total_share_days"] = total_share_days
-            self["avg_share_age"] = total_share_days
+        self.store.append(self["account"], timestamp, shares)
+
+    def calc_share_age(self, now=None):
+        if now is None:
+            now = datetime.now(timezone.utc)
+        self.store.now = now
+        self._set_share_age(self.store.member_share_days(self["account"], now))
+
+    def calc_share_age_until(self, timestamp, now=None):
+        if len(self.store.positions(self["account"])) == 0:
             return
-        for i in range(len(self.share_age_list)):
-            total_share_days += self.share_age_list[i] * self.shares_list[i]
+        if now is None:
+            now = datetime.now(timezone.utc)
+        self.store.now = now
+        self._set_share_age_until(
+            self.store.member_share_days(self["account"], now, until=timestamp)
+        )
+
+    def _set_share_age(self, total):
+        total_share_days, shares, _ = total
         self["total_share_days"] = total_share_days
-        if sum(self.shares_list) > 0:
-            self["avg_share_age"] = total_share_days / sum(self.shares_list)
+        if shares > 0:
+            self["avg_share_age"] = total_share_days / shares
         else:
             self["avg_share_age"] = total_share_days
 
-    def calc_share_age_until(self, timestamp):
-        if len(self.share_age_list) == 0:
-            return
-        total_share_days = 0
-        index = 0
-        for i in range(len(self.share_age_list)):
-            if self.share_timestamp[i] <= timestamp:
-                total_share_days += self.share_age_list[i] * self.shares_list[i]
-                index += 1
+    def _set_share_age_until(self, total):
+        total_share_days, _, events = total
         self["total_share_days"] = total_share_days
-        if index > 0:
-            self["avg_share_age"] = total_share_days / index
+        if events > 0:
+            self["avg_share_age"] = total_share_days / events
         else:
             self["avg_share_age"] = total_share_days
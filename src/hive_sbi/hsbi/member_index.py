@@ -0,0 +1,84 @@
+"""The accounts of the member table for membership tests
+
+The scripts test every streamed op and every trx row for membership, with a
+list each test scans all members. MemberIndex keeps the accounts in a
+dict and is loaded once per process and database, run_all shares it
+between the modules. MemberDB reports added and removed members with
+members_changed, so a shared index never has to be reloaded.
+"""
+
+# database key -> shared MemberIndex
+_shared = {}
+
+
+def _key(db):
+    url = str(db.url)
+    # Every connection to an in-memory sqlite database is a database of its own
+    if url.endswith(":memory:"):
+        return id(db)
+    return url
+
+
+class MemberIndex:
+    """Member accounts with constant time membership tests, additions and removals
+
+    Iterating yields the accounts in the order of the member table, new
+    members at the end. Members may be removed while the index is iterated.
+
+    :param list accounts: member accounts
+    """
+
+    def __init__(self, accounts=()):
+        # dict keeps the order of the accounts, the values are unused
+        self.accounts = dict.fromkeys(accounts)
+        self.listeners = []
+
+    @classmethod
+    def shared(cls, memberStorage):
+        """Returns the index of the member table of memberStorage, loaded on the first call"""
+        key = _key(memberStorage.db)
+        if key not in _shared:
+            _shared[key] = cls(memberStorage.get_all_accounts())
+        return _shared[key]
+
+    def __contains__(self, account):
+        return account in self.accounts
+
+    def __iter__(self):
+        return iter(list(self.accounts))
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def subscribe(self, listener):
+        """Call listener(added, removed) with the lists of changed accounts after each change"""
+        self.listeners.append(listener)
+
+    def update(self, added=(), removed=()):
+        """Add and remove members, returns True when the members changed
+
+        Takes time in the number of changed accounts, not in the number of members.
+        """
+        removed = [account for account in dict.fromkeys(removed) if account in self.accounts]
+        for account in removed:
+            del self.accounts[account]
+        added = [account for account in dict.fromkeys(added) if account not in self.accounts]
+        for account in added:
+            self.accounts[account] = None
+        if len(added) == 0 and len(removed) == 0:
+            return False
+        for listener in self.listeners:
+            listener(added, removed)
+        return True
+
+
+def members_changed(db, added=(), removed=()):
+    """Update the shared index of a database after members were added or removed"""
+    index = _shared.get(_key(db))
+    if index is not None:
+        index.update(added=added, removed=removed)
+
+
+def drop_shared(db):
+    """Forget the shared index of a database, the next MemberIndex.shared call reloads it"""
+    _shared.pop(_key(db), None)
@@ -0,0 +1,477 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from nectar.utils import addTzInfo, formatTimeString
+
+from hive_sbi.hsbi.core import get_logger
+from hive_sbi.hsbi.member import Member, ShareAgeStore
+from hive_sbi.hsbi.storage import TrxChangeDB
+
+logger = get_logger()
+
+# ingest_cursor module of the ledger, one cursor per trx source
+LEDGER_MODULE = "member_ledger"
+# ingest_cursor entry whose updated_at is the time of the last full replay check
+VERIFY_MODULE = "member_ledger.verify"
+# ingest_cursor module of the member share state, one cursor per trx source
+# with the last trx index the state contains and one without source which
+# marks that the state exists
+STATE_MODULE = "member_ledger.state"
+
+DELEGATION_SHARE_TYPES = ["Delegation", "RemovedDelegation"]
+MGMT_SHARE_TYPES = ["Mgmt", "MgmtTransfer"]
+# Trx which never change the shares of a member
+SKIPPED_SHARE_TYPES = ["DelegationLeased", "ShareTransfer"] + DELEGATION_SHARE_TYPES
+
+
+def _timestamp(op):
+    if isinstance(op["timestamp"], str):
+        return formatTimeString(op["timestamp"])
+    return op["timestamp"]
+
+
+def share_entries(op):
+    """
+    Return the ledger entries of a trx row
+
+    One entry for the sponsor and one per sponsee, in the order the member
+    update applies them. A management share row gives one entry without account,
+    the shares of the management accounts are taken from the config when the
+    entries are applied.
+
+    Args:
+        op (dict): trx row
+
+    Returns:
+        list: Ledger entries
+    """
+    if op["status"] != "Valid":
+        return []
+    share_type = op["share_type"]
+    if share_type in SKIPPED_SHARE_TYPES:
+        return []
+    entry = {
+        "index": op["index"],
+        "source": op["source"],
+        "timestamp": _timestamp(op),
+        "share_type": share_type,
+    }
+    if share_type in MGMT_SHARE_TYPES:
+        return [dict(entry, seq=0, account="", sponsor="", shares=0)]
+    if op["shares"] == 0:
+        return []
+    entries = [dict(entry, seq=0, account=op["sponsor"], sponsor="", shares=op["shares"])]
+    sponsee = json.loads(op["sponsee"])
+    for seq, s in enumerate(sponsee, 1):
+        entries.append(dict(entry, seq=seq, account=s, sponsor=op["sponsor"], shares=sponsee[s]))
+    return entries
+
+
+def apply_share_entries(
+    member_data, entries, mgnt_shares, on_sponsoring=None, on_sponsoring_update=None, store=None
+):
+    """
+    Add the shares of ledger entries to the members
+
+    Args:
+        member_data (dict): Members with cleared shares, new members are added
+        entries (iterable): Ledger entries ordered by index, source and seq
+        mgnt_shares (dict): Management shares from the config
+        on_sponsoring (callable): Called with (sponsee, sponsor) for new sponsees
+        on_sponsoring_update (callable): Called with (sponsee, sponsor, shares)
+        store (ShareAgeStore): Share entry store of new members, by default the
+            store of the existing members
+    """
+    if store is None:
+        if len(member_data) > 0:
+            store = next(iter(member_data.values())).store
+        else:
+            store = ShareAgeStore()
+    mngt_shares_assigned = False
+    for entry in entries:
+        timestamp = entry["timestamp"]
+        if entry["share_type"] in MGMT_SHARE_TYPES:
+            if not mngt_shares_assigned:
+                for account in mgnt_shares:
+                    mngt_shares = mgnt_shares[account]
+                    if account not in member_data:
+                        member = Member(account, mngt_shares, timestamp, store=store)
+                        member.append_share_age(timestamp, mngt_shares)
+                        member_data[account] = member
+                    else:
+                        member_data[account]["latest_enrollment"] = timestamp
+                        member_data[account]["shares"] = mngt_shares
+                        member_data[account].append_share_age(timestamp, mngt_shares)
+                mngt_shares_assigned = True
+            continue
+        account = entry["account"]
+        shares = entry["shares"]
+        if account not in member_data:
+            member = Member(account, shares, timestamp, store=store)
+            member.append_share_age(timestamp, shares)
+            member_data[account] = member
+            if entry["sponsor"] and on_sponsoring is not None:
+                on_sponsoring(account, entry["sponsor"])
+        else:
+            member_data[account]["latest_enrollment"] = timestamp
+            member_data[account]["shares"] += shares
+            member_data[account].append_share_age(timestamp, shares)
+            if entry["sponsor"] and on_sponsoring_update is not None:
+                on_sponsoring_update(account, entry["sponsor"], member_data[account]["shares"])
+
+
+def collect_delegations(ops):
+    """
+    Return the current delegation of each account
+
+    Args:
+        ops (iterable): trx rows ordered by index and source
+
+    Returns:
+        tuple: account -> vests, account -> timestamp of the last change
+    """
+    delegation = {}
+    delegation_timestamp = {}
+    for op in ops:
+        if op["status"] != "Valid" or op["share_type"] not in DELEGATION_SHARE_TYPES:
+            continue
+        if op["share_type"] == "Delegation":
+            delegation[op["account"]] = op["vests"]
+        else:
+            delegation[op["account"]] = 0
+        delegation_timestamp[op["account"]] = _timestamp(op)
+    return delegation, delegation_timestamp
+
+
+def replay_trx(member_data, ops, mgnt_shares, **hooks):
+    """
+    Apply all trx rows to the members, the full replay
+
+    Args:
+        member_data (dict): Members with cleared shares
+        ops (iterable): All trx rows ordered by index and source
+        mgnt_shares (dict): Management shares from the config
+
+    Returns:
+        tuple: The delegations, see collect_delegations
+    """
+    delegation_ops = []
+
+    def entries():
+        for op in ops:
+            if op["share_type"] in DELEGATION_SHARE_TYPES:
+                delegation_ops.append(op)
+            yield from share_entries(op)
+
+    apply_share_entries(member_data, entries(), mgnt_shares, **hooks)
+    return collect_delegations(delegation_ops)
+
+
+def sync_ledger(trxStorage, ledgerStorage, cursorStorage, chunk_size=1000):
+    """
+    Append the entries of the trx rows added since the last sync
+
+    The entries of each chunk are committed together with the cursor of their
+    source, an interrupted sync continues where it stopped.
+
+    Returns:
+        int: Number of new trx rows
+    """
+    db = ledgerStorage.db
+    count = 0
+    for source in trxStorage.get_sources():
+        cursor = cursorStorage.get(LEDGER_MODULE, source)
+        start_index = None if cursor is None else cursor["op_acc_index"] + 1
+        ops = []
+        for op in trxStorage.get_source_ops(source, start_index=start_index):
+            ops.append(op)
+            if len(ops) >= chunk_size:
+                count += _append_entries(db, ledgerStorage, cursorStorage, source, ops)
+                ops = []
+        if len(ops) > 0:
+            count += _append_entries(db, ledgerStorage, cursorStorage, source, ops)
+    return count
+
+
+def _append_entries(db, ledgerStorage, cursorStorage, source, ops):
+    entries = []
+    for op in ops:
+        entries.extend(share_entries(op))
+    with db:
+        if len(entries) > 0:
+            ledgerStorage.add_batch(entries)
+        cursorStorage.set(LEDGER_MODULE, source, {"op_acc_index": ops[-1]["index"]})
+    return len(ops)
+
+
+def rebuild_ledger(trxStorage, ledgerStorage, cursorStorage):
+    """
+    Rebuild the ledger from the whole trx table
+
+    The member share state points into the old ledger, it is built again by
+    the next update_share_state.
+
+    Returns:
+        int: Number of trx rows
+    """
+    with ledgerStorage.db:
+        ledgerStorage.delete_all()
+        cursorStorage.delete_all(LEDGER_MODULE)
+        cursorStorage.delete_all(STATE_MODULE)
+    return sync_ledger(trxStorage, ledgerStorage, cursorStorage)
+
+
+def _entry_key(entry):
+    return (entry["index"], entry["source"], entry["seq"])
+
+
+def _new_state(account):
+    return {
+        "account": account,
+        "shares": 0,
+        "original_enrollment": None,
+        "latest_enrollment": None,
+        "last_index": None,
+        "last_source": None,
+        "last_seq": None,
+        "share_entries": [],
+    }
+
+
+def _add_entry(state, entry, shares, assign=False):
+    timestamp = entry["timestamp"]
+    if state["original_enrollment"] is None:
+        state["original_enrollment"] = timestamp
+    state["latest_enrollment"] = timestamp
+    state["shares"] = shares if assign else state["shares"] + shares
+    if shares != 0:
+        state["share_entries"].append([addTzInfo(timestamp).timestamp(), shares])
+    state["last_index"], state["last_source"], state["last_seq"] = _entry_key(entry)
+
+
+def load_share_state(stateStorage):
+    """Returns account -> share state of all members"""
+    states = {}
+    for row in stateStorage.get_all():
+        state = dict(row)
+        state["share_entries"] = json.loads(row["share_entries"] or "[]")
+        states[row["account"]] = state
+    return states
+
+
+def rebuild_state(ledgerStorage, account, mgnt_shares):
+    """
+    Build the share state of one member from its own ledger entries
+
+    A management account also gets the first management share entry, the
+    only one the full replay applies.
+
+    Returns:
+        dict: Share state
+    """
+    entries = list(ledgerStorage.get_account(account))
+    if account in mgnt_shares:
+        first = ledgerStorage.get_first(MGMT_SHARE_TYPES)
+        if first is not None:
+            entries.append(first)
+            entries.sort(key=_entry_key)
+    state = _new_state(account)
+    for entry in entries:
+        if entry["share_type"] in MGMT_SHARE_TYPES:
+            _add_entry(state, entry, mgnt_shares[account], assign=True)
+        else:
+            _add_entry(state, entry, entry["shares"])
+    return state
+
+
+def _derive_again(trxStorage, ledgerStorage, cursorStorage, change):
+    """Replace the ledger entries of a changed trx, returns the accounts of old and new entries"""
+    source = change["source"]
+    cursor = cursorStorage.get(LEDGER_MODULE, source)
+    if cursor is None:
+        # sync_ledger did not reach the source yet and reads the changed rows
+        return set()
+    synced_index = cursor["op_acc_index"]
+    if change["index"] is None:
+        ops = trxStorage.get_source_ops(source)
+    elif change["index"] > synced_index:
+        return set()
+    else:
+        op = trxStorage.get(change["index"], source)
+        ops = [] if op is None else [op]
+    accounts = {entry["account"] for entry in ledgerStorage.get_trx(source, change["index"])}
+    ledgerStorage.delete_trx(source, change["index"])
+    entries = []
+    for op in ops:
+        if op["index"] > synced_index:
+            break
+        entries.extend(share_entries(op))
+    if len(entries) > 0:
+        ledgerStorage.add_batch(entries)
+    accounts.update(entry["account"] for entry in entries)
+    return accounts
+
+
+def update_share_state(
+    states,
+    trxStorage,
+    ledgerStorage,
+    stateStorage,
+    cursorStorage,
+    mgnt_shares,
+    members=(),
+    on_sponsoring=None,
+    on_sponsoring_update=None,
+):
+    """
+    Move the member share state to the end of the ledger
+
+    Only the ledger entries added since the last update are applied, the hooks
+    are called for these entries like apply_share_entries does. The entries of
+    trx changed in place since then (see TrxChangeDB) are derived again, the
+    members they touch are rebuilt from their own ledger entries, as are the
+    management accounts after a new management entry and members whose new
+    entry sorts before the last one they got. Without state cursors the state
+    is built from the whole ledger.
+
+    Args:
+        states (dict): State of all members, see load_share_state, updated in place
+        mgnt_shares (dict): Management shares from the config
+        members (iterable): Accounts of the member table, the others are new members
+
+    Returns:
+        int: Number of applied ledger entries
+    """
+    db = ledgerStorage.db
+    exists = cursorStorage.get(STATE_MODULE, "") is not None
+    if not exists:
+        states.clear()
+    synced = {}
+    new_entries = []
+    for source in trxStorage.get_sources():
+        ledger_cursor = cursorStorage.get(LEDGER_MODULE, source)
+        if ledger_cursor is None:
+            continue
+        synced[source] = ledger_cursor["op_acc_index"]
+        cursor = cursorStorage.get(STATE_MODULE, source) if exists else None
+        start_index = None if cursor is None else cursor["op_acc_index"]
+        for entry in ledgerStorage.get_since(source, start_index):
+            if entry["index"] <= synced[source]:
+                new_entries.append(entry)
+    new_entries.sort(key=_entry_key)
+
+    changed = set()
+    rebuild = set()
+    for entry in new_entries:
+        if entry["share_type"] in MGMT_SHARE_TYPES:
+            rebuild.update(mgnt_shares)
+            continue
+        account = entry["account"]
+        new_member = account not in members and account not in states
+        if account not in states:
+            states[account] = _new_state(account)
+        state = states[account]
+        if state["last_index"] is not None and _entry_key(entry) < (
+            state["last_index"],
+            state["last_source"],
+            state["last_seq"],
+        ):
+            rebuild.add(account)
+        _add_entry(state, entry, entry["shares"])
+        changed.add(account)
+        if not entry["sponsor"]:
+            continue
+        if new_member and on_sponsoring is not None:
+            on_sponsoring(account, entry["sponsor"])
+        elif not new_member and on_sponsoring_update is not None:
+            on_sponsoring_update(account, entry["sponsor"], state["shares"])
+
+    changeStorage = TrxChangeDB(trxStorage.db)
+    with db:
+        if not exists:
+            stateStorage.delete_all()
+            cursorStorage.delete_all(STATE_MODULE)
+        changes = changeStorage.get_all()
+        for change in changes:
+            accounts = _derive_again(trxStorage, ledgerStorage, cursorStorage, change)
+            if "" in accounts:
+                accounts.discard("")
+                accounts.update(mgnt_shares)
+            rebuild.update(accounts)
+        for account in rebuild:
+            states[account] = rebuild_state(ledgerStorage, account, mgnt_shares)
+        changed.update(rebuild)
+        rows = [
+            dict(states[account], share_entries=json.dumps(states[account]["share_entries"]))
+            for account in changed
+        ]
+        stateStorage.add_batch(rows)
+        for source, index in synced.items():
+            cursorStorage.set(STATE_MODULE, source, {"op_acc_index": index})
+        cursorStorage.set(STATE_MODULE, "", {})
+        if len(changes) > 0:
+            changeStorage.delete_until(changes[-1]["id"])
+    return len(new_entries)
+
+
+def apply_share_state(member_data, states, store=None):
+    """
+    Set the shares and share entries of the members from their share state
+
+    Members without state keep their cleared shares, as in the full replay.
+
+    Args:
+        member_data (dict): Members with cleared shares, new members are added
+        states (dict): State of all members, see load_share_state
+        store (ShareAgeStore): Share entry store of new members, by default the
+            store of the existing members
+    """
+    if store is None:
+        if len(member_data) > 0:
+            store = next(iter(member_data.values())).store
+        else:
+            store = ShareAgeStore()
+    for account, state in states.items():
+        if account not in member_data:
+            if state["original_enrollment"] is None:
+                continue
+            member_data[account] = Member(account, 0, state["original_enrollment"], store=store)
+        member = member_data[account]
+        member["shares"] = state["shares"]
+        if state["latest_enrollment"] is not None:
+            member["latest_enrollment"] = state["latest_enrollment"]
+        for timestamp, shares in state["share_entries"]:
+            member.append_share_age(datetime.fromtimestamp(timestamp, timezone.utc), shares)
+
+
+def verify_due(cursorStorage, interval_hours):
+    """Returns True when the last full replay check is older than interval_hours"""
+    last_check = cursorStorage.get(VERIFY_MODULE, "")
+    if last_check is None or last_check["updated_at"] is None:
+        return True
+    age = datetime.now(timezone.utc) - addTzInfo(last_check["updated_at"])
+    return age > timedelta(hours=interval_hours)
+
+
+def compare_members(member_data, replayed):
+    """
+    Compare the shares of two member dicts
+
+    Returns:
+        list: Accounts whose shares, enrollment or share entries differ
+    """
+    diff = []
+    for account in set(member_data) | set(replayed):
+        if account not in member_data or account not in replayed:
+            diff.append(account)
+            continue
+        a = member_data[account]
+        b = replayed[account]
+        if (
+            a["shares"] != b["shares"]
+            or a["latest_enrollment"] != b["latest_enrollment"]
+            or a.shares_list != b.shares_list
+            or a.share_timestamp != b.share_timestamp
+        ):
+            diff.append(account)
+    return sorted(diff)
@@ -0,0 +1,175 @@
+import logging
+import struct
+from binascii import unhexlify
+from concurrent.futures import ProcessPoolExecutor
+
+from nectar.exceptions import MissingKeyError
+from nectar.instance import shared_blockchain_instance
+from nectar.memo import Memo
+from nectarbase import memo as BtsMemo
+from nectargraphenebase.account import PrivateKey, PublicKey
+from nectargraphenebase.types import varintdecode
+
+log = logging.getLogger(__name__)
+
+
+def derive_shared_secret(wif, public_key):
+    """Returns the ECDH shared secret of a private key and a public key in hex
+
+    A module level function, so that it can run in a process pool.
+    """
+    return BtsMemo.get_shared_secret(PrivateKey(wif), PublicKey(public_key))
+
+
+def _unpad(message, block_size):
+    """Remove the PKCS#7 padding of a decrypted memo, if there is one"""
+    count = message[-1]
+    if message[-count:] == count * struct.pack("B", count):
+        return message[:-count]
+    return message
+
+
+def decode_memo(shared_secret, nonce, check, cipher):
+    """Decrypt the cipher of a memo with the shared secret
+
+    Same steps as nectarbase.memo.decode_memo, which derives the shared
+    secret itself and takes the private key instead. Only its public helpers
+    are used, test_memo_decryptor compares both for memos of all lengths.
+    """
+    aes, checksum = BtsMemo.init_aes2(shared_secret, nonce)
+    if not check == checksum:
+        raise AssertionError("Checksum failure")
+    numBytes = 16 - len(cipher) % 16
+    n = 16 - numBytes
+    message = aes.decrypt(unhexlify(bytes(cipher[n:], "ascii")))
+    message = _unpad(message, 16)
+    n = varintdecode(message)
+    if (len(message) - n) > 0 and (len(message) - n) < 8:
+        return "#" + message[len(message) - n :].decode("utf8")
+    else:
+        return "#" + message.decode("utf8")
+
+
+class MemoDecryptor:
+    """Decrypts memos with cached shared secrets
+
+    The public keys of sender and receiver are part of an encrypted memo, so
+    neither account has to be fetched. The private memo key is taken from the
+    wallet and the shared secret is derived once per key pair. decrypt_batch
+    derives the missing secrets of many memos at once, in a process pool when
+    processes is above 1. The pool is started on first use and kept until
+    close is called.
+
+    :param blockchain_instance: Hive instance whose wallet holds the memo keys
+    :param int processes: worker processes for the key derivation, 0 derives in-process
+    :param pool: process pool of another decryptor, which also shuts it down
+    """
+
+    def __init__(self, blockchain_instance=None, processes=0, pool=None):
+        self.hive = blockchain_instance or shared_blockchain_instance()
+        self.processes = processes
+        self._pool = pool
+        self._own_pool = False
+        self.wifs = {}
+        self.secrets = {}
+        self.decrypted = {}
+        self.previous = {}
+
+    def pool(self):
+        """Returns the process pool of the key derivation, None when processes is not above 1"""
+        if self._pool is None and self.processes > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.processes)
+            self._own_pool = True
+        return self._pool
+
+    def close(self):
+        """Shut down the process pool, when this decryptor started it"""
+        if self._own_pool:
+            self._pool.shutdown()
+            self._own_pool = False
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _wif(self, public_key):
+        if public_key not in self.wifs:
+            try:
+                key = str(PublicKey(public_key, prefix=self.hive.prefix))
+                self.wifs[public_key] = self.hive.wallet.getPrivateKeyForPublicKey(key)
+            except MissingKeyError:
+                self.wifs[public_key] = None
+        return self.wifs[public_key]
+
+    def _key_pair(self, message):
+        """Returns our private key, the other public key and the memo data"""
+        from_key, to_key, nonce, check, cipher = BtsMemo.extract_memo_data(message)
+        from_key = repr(from_key)
+        to_key = repr(to_key)
+        # We first try to decode assuming we received the memo
+        if self._wif(to_key) is not None:
+            pair = (to_key, from_key)
+        elif self._wif(from_key) is not None:
+            pair = (from_key, to_key)
+        else:
+            raise MissingKeyError(
+                "Non of the required memo keys are installed!Need any of {}".format(
+                    [to_key, from_key]
+                )
+            )
+        return pair, (nonce, check, cipher)
+
+    def _secret(self, pair):
+        if pair not in self.secrets:
+            self.secrets[pair] = derive_shared_secret(self.wifs[pair[0]], pair[1])
+        return self.secrets[pair]
+
+    def decrypt(self, from_account, to_account, message):
+        """Decrypt a memo, same result as nectar.memo.Memo(from_account, to_account).decrypt"""
+        if message in self.decrypted:
+            return self.decrypted[message]
+        if not message or message[0] != "#":
+            memo = Memo(from_account, to_account, blockchain_instance=self.hive)
+            return memo.decrypt(message)
+        pair, data = self._key_pair(message)
+        return decode_memo(self._secret(pair), *data)
+
+    def decrypt_batch(self, memos):
+        """Decrypt many memos, the results are kept for the next decrypt calls
+
+        The results of this and the previous batch are kept, so the ops of one
+        batch can be parsed while the next batch is prepared. Older results
+        are dropped.
+
+        :param list memos: (from_account, to_account, message) tuples
+        :returns: message -> decrypted memo of the memos which could be decrypted
+        """
+        parsed = {}
+        for _, _, message in memos:
+            if not message or message[0] != "#" or message in parsed:
+                continue
+            try:
+                parsed[message] = self._key_pair(message)
+            except Exception as e:
+                # decrypt raises the error again when the memo is parsed
+                log.warning(f"Could not read memo {message[:20]}: {e}")
+        missing = list({pair for pair, _ in parsed.values() if pair not in self.secrets})
+        if self.processes > 1 and len(missing) > 1:
+            secrets = self.pool().map(
+                derive_shared_secret,
+                [self.wifs[pair[0]] for pair in missing],
+                [pair[1] for pair in missing],
+            )
+            self.secrets.update(zip(missing, secrets))
+        result = {}
+        for message, (pair, data) in parsed.items():
+            try:
+                result[message] = decode_memo(self._secret(pair), *data)
+            except Exception as e:
+                log.warning(f"Could not decrypt memo {message[:20]}: {e}")
+        self.decrypted = {**self.previous, **result}
+        self.previous = result
+        return result
@@ -1,14 +1,125 @@
 import logging
+import re
+from collections import namedtuple
 
-from nectar.account import Account
 from nectar.instance import shared_blockchain_instance
 
+from hive_sbi.hsbi.account_lookup import AccountLookup
+
 log = logging.getLogger(__name__)
 
+# Token kinds of a memo word
+EMPTY = "empty"
+FILLER = "filler"
+NUMBER = "number"
+SKIP = "skip"
+URL_ACCOUNT = "url_account"
+PAIR = "pair"
+ACCOUNT = "account"
+EMBEDDED_ACCOUNT = "embedded_account"
+WORD = "word"
+
+# The grammar of a memo word, the alternatives are tried in this order
+WORD_GRAMMAR = re.compile(
+    r"""
+    (?P<number>
+        # digits with at most one "x", "-" and ";" anywhere, e.g. x3 or 3;
+        (?=[^x]*x?[^x]*\Z)(?=[^-]*-?[^-]*\Z)(?=[^;]*;?[^;]*\Z)
+        [\dx;-]*\d[\dx;-]*
+    )
+    | (?P<short>.{0,2})
+    | https://steemit\.com/@(?P<url_account>[^/]*)
+    | (?P<pair_sponsor>[^:/]*):(?P<pair_sponsee>[^:/]*)
+    | @(?P<account>.*)
+    | [^@]*@(?P<embedded_account>[^@]*)(?:@.*)?
+    | (?P<long>.{17,})
+    | (?P<word>.*)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Characters dropped from account names before they are trimmed
+DROPPED_CHARS = re.compile(r"[!\";]")
+DROPPED_WORD_CHARS = re.compile(r"[!\"]")
+NUMBER_CHARS = re.compile(r"[x;-]")
+
+Token = namedtuple("Token", ["kind", "word", "names", "number"])
+
+
+def trim_name(name, strip_dot=True):
+    """Remove quotes, a trailing dot and a leading @ from an account name
+
+    :returns: the name, None when nothing is left to trim
+    """
+    if len(name) == 0:
+        return None
+    if name[0] == "'":
+        name = name[1:]
+    if len(name) == 0:
+        return None
+    if name[-1] == "'":
+        name = name[:-1]
+    if len(name) == 0:
+        return None
+    if strip_dot and name[-1] == ".":
+        name = name[:-1]
+        if len(name) == 0:
+            return None
+    if name[0] == "@":
+        name = name[1:]
+    return name.strip()
+
+
+def classify_word(w, filler_words=()):
+    """Returns the Token of a memo word
+
+    Names are None when the word has the shape of an account but no name in it.
+    """
+    if len(w) == 0:
+        return Token(EMPTY, w, (), None)
+    if w in filler_words:
+        return Token(FILLER, w, (), None)
+    match = WORD_GRAMMAR.fullmatch(w)
+    kind = match.lastgroup
+    if kind == NUMBER:
+        return Token(NUMBER, w, (), int(NUMBER_CHARS.sub("", w)))
+    if kind in ("short", "long"):
+        return Token(SKIP, w, (), None)
+    if kind == "pair_sponsee":
+        sponsor = trim_name(match.group("pair_sponsor"), strip_dot=False)
+        sponsee = trim_name(match.group("pair_sponsee"), strip_dot=False)
+        if sponsor is None or sponsee is None:
+            return Token(PAIR, w, (None, None), None)
+        return Token(PAIR, w, (sponsor, sponsee), None)
+    if kind == WORD:
+        return Token(WORD, w, (trim_name(DROPPED_WORD_CHARS.sub("", w)),), None)
+    return Token(kind, w, (trim_name(DROPPED_CHARS.sub("", match.group(kind))),), None)
+
+
+def tokenize(words_memo, filler_words=()):
+    """Classify all words of a memo in one pass"""
+    return [classify_word(w, filler_words) for w in words_memo]
+
+
+def memo_words(memo):
+    """Split a memo into the words which are classified"""
+    if memo[0] == "'":
+        memo = memo[1:]
+    if memo[-1] == "'":
+        memo = memo[:-1]
+    return memo.strip().lower().replace(",", "  ").replace('"', "").split(" ")
+
+
+def single_word_name(w):
+    """Returns the account name of a memo which is a single word"""
+    name = w.replace(",", " ").replace("!", " ").replace('"', "").replace("/", " ")
+    return trim_name(name)
+
 
 class MemoParser:
-    def __init__(self, blockchain_instance=None):
+    def __init__(self, blockchain_instance=None, account_lookup=None):
         self.hive = blockchain_instance or shared_blockchain_instance()
+        self.account_lookup = account_lookup or AccountLookup(blockchain_instance=self.hive)
         self.allowed_memo_words = [
             "for",
             "and",
@@ -37,180 +148,88 @@ class MemoParser:
             "sponsor:",
         ]
 
+    def candidates(self, words_memo, tokens):
+        """Returns the account names which are looked up for a memo"""
+        candidates = {name for token in tokens for name in token.names if name is not None}
+        if len(words_memo) == 1:
+            fallback_name = single_word_name(words_memo[0])
+            if fallback_name is not None:
+                candidates.add(fallback_name)
+        return candidates
+
+    def prefetch(self, memos):
+        """Look up the account names of many memos at once
+
+        parse_memo then finds them in the cache of the account lookup.
+        """
+        candidates = set()
+        for memo in memos:
+            words_memo = memo_words(memo)
+            candidates |= self.candidates(words_memo, tokenize(words_memo, self.allowed_memo_words))
+        if len(candidates) > 0:
+            self.account_lookup.lookup(sorted(candidates))
+
     def parse_memo(self, memo, shares, account):
-        if memo[0] == "'":
-            memo = memo[1:]
-        if memo[-1] == "'":
-            memo = memo[:-1]
-        words_memo = memo.strip().lower().replace(",", "  ").replace('"', "").split(" ")
+        words_memo = memo_words(memo)
+        tokens = tokenize(words_memo, self.allowed_memo_words)
+        n_words = len(words_memo)
+
+        # All distinct candidates are checked with one lookup
+        found = self.account_lookup.lookup(sorted(self.candidates(words_memo, tokens)))
+        fallback_name = single_word_name(words_memo[0]) if n_words == 1 else None
 
         sponsors = {}
         no_numbers = True
         amount_left = shares
         word_count = 0
         not_parsed_words = []
-        n_words = len(words_memo)
         digit_found = None
         sponsor = None
         account_error = False
 
-        for w in words_memo:
-            if len(w) == 0:
+        for token in tokens:
+            if token.kind in (EMPTY, FILLER):
                 continue
-            if w in self.allowed_memo_words:
+            if amount_left < 1:
                 continue
-            if amount_left >= 1:
-                account_name = ""
-                account_found = False
-                w_digit = w.replace("x", "", 1).replace("-", "", 1).replace(";", "", 1)
-                if w_digit.isdigit():
-                    no_numbers = False
-                    digit_found = int(w_digit)
-                elif len(w) < 3:
-                    continue
-                elif w[:21] == "https://steemit.com/@" and "/" not in w[21:]:
-                    try:
-                        account_name = w[21:].replace("!", "").replace('"', "").replace(";", "")
-                        if account_name[0] == "'":
-                            account_name = account_name[1:]
-                        if account_name[-1] == "'":
-                            account_name = account_name[:-1]
-                        if account_name[-1] == ".":
-                            account_name = account_name[:-1]
-                        if account_name[0] == "@":
-                            account_name = account_name[1:]
-                        account_name = account_name.strip()
-                        acc = Account(account_name, blockchain_instance=self.hive)
-                        account_found = True
-                    except Exception as e:
-                        print(f"{account_name} is not an account: {e}")
-                        account_error = True
-                elif len(w.split(":")) == 2 and "/" not in w:
-                    try:
-                        account_name1 = w.split(":")[0]
-                        account_name = w.split(":")[1]
-                        if account_name[0] == "'":
-                            account_name = account_name[1:]
-                        if account_name[-1] == "'":
-                            account_name = account_name[:-1]
-                        if account_name1[0] == "'":
-                            account_name1 = account_name1[1:]
-                        if account_name1[-1] == "'":
-                            account_name1 = account_name1[:-1]
-                        if account_name1[0] == "@":
-                            account_name1 = account_name1[1:]
-                        if account_name[0] == "@":
-                            account_name = account_name[1:]
-                        account_name = account_name.strip()
-                        account_name1 = account_name1.strip()
-                        # Verify accounts exist by attempting to create Account objects
-                        Account(account_name1, blockchain_instance=self.hive)
-                        Account(account_name, blockchain_instance=self.hive)
-                        account_found = True
-                        if sponsor is None:
-                            sponsor = account_name1
-                        else:
-                            account_error = True
-                    except Exception as e:
-                        print(f"{account_name} is not an account: {e}")
-                        account_error = True
-                elif w[0] == "@":
-                    try:
-                        account_name = w[1:].replace("!", "").replace('"', "").replace(";", "")
-                        if account_name[0] == "'":
-                            account_name = account_name[1:]
-                        if account_name[-1] == "'":
-                            account_name = account_name[:-1]
-                        if account_name[-1] == ".":
-                            account_name = account_name[:-1]
-                        if account_name[0] == "@":
-                            account_name = account_name[1:]
-                        account_name = account_name.strip()
-                        acc = Account(account_name, blockchain_instance=self.hive)
-                        account_found = True
-
-                    except Exception as e:
-                        print(f"{account_name} is not an account: {e}")
-                        account_error = True
-                elif len(w.split("@")) > 1:
-                    try:
-                        account_name = (
-                            w.replace("!", "").replace('"', "").replace(";", "").split("@")[1]
-                        )
-                        if account_name[0] == "'":
-                            account_name = account_name[1:]
-                        if account_name[-1] == "'":
-                            account_name = account_name[:-1]
-                        if account_name[-1] == ".":
-                            account_name = account_name[:-1]
-                        if account_name[0] == "@":
-                            account_name = account_name[1:]
-                        account_name = account_name.strip()
-                        acc = Account(account_name, blockchain_instance=self.hive)
-                        account_found = True
-
-                    except Exception as e:
-                        print(f"{account_name} is not an account: {e}")
-                        account_error = True
-
-                elif len(w) > 16:
-                    continue
-
+            if token.kind == NUMBER:
+                no_numbers = False
+                digit_found = token.number
+                continue
+            if token.kind == SKIP:
+                continue
+            account_name = token.names[-1]
+            if not all(name is not None and found[name] for name in token.names):
+                print(f"{account_name} is not an account")
+                account_error = True
+                if token.kind == WORD:
+                    not_parsed_words.append(token.word)
+                    word_count += 1
+                continue
+            if token.kind == PAIR:
+                if sponsor is None:
+                    sponsor = token.names[0]
+                else:
+                    account_error = True
+            if account_name != "" and account_name != account:
+                if digit_found is not None:
+                    sponsors[account_name] = digit_found
+                    amount_left -= digit_found
+                    digit_found = None
+                elif account_name in sponsors:
+                    sponsors[account_name] += 1
+                    amount_left -= 1
                 else:
-                    try:
-                        account_name = w.replace("!", "").replace('"', "")
-                        if account_name[0] == "'":
-                            account_name = account_name[1:]
-                        if account_name[-1] == "'":
-                            account_name = account_name[:-1]
-                        if account_name[-1] == ".":
-                            account_name = account_name[:-1]
-                        if account_name[0] == "@":
-                            account_name = account_name[1:]
-                        account_name = account_name.strip()
-                        acc = Account(account_name, blockchain_instance=self.hive)
-                        account_found = True
-                    except Exception as e:
-                        print(f"{account_name} is not an account: {e}")
-                        not_parsed_words.append(w)
-                        word_count += 1
-                        account_error = True
-                if account_found and account_name != "" and account_name != account:
-                    if digit_found is not None:
-                        sponsors[account_name] = digit_found
-                        amount_left -= digit_found
-                        digit_found = None
-                    elif account_name in sponsors:
-                        sponsors[account_name] += 1
-                        amount_left -= 1
-                    else:
-                        sponsors[account_name] = 1
-                        amount_left -= 1
-        if n_words == 1 and len(sponsors) == 0:
-            try:
-                account_name = (
-                    words_memo[0]
-                    .replace(",", " ")
-                    .replace("!", " ")
-                    .replace('"', "")
-                    .replace("/", " ")
-                )
-                if account_name[0] == "'":
-                    account_name = account_name[1:]
-                if account_name[-1] == "'":
-                    account_name = account_name[:-1]
-                if account_name[-1] == ".":
-                    account_name = account_name[:-1]
-                if account_name[0] == "@":
-                    account_name = account_name[1:]
-                account_name = account_name.strip()
-                Account(account_name, blockchain_instance=self.hive)
-                if account_name != account:
                     sponsors[account_name] = 1
                     amount_left -= 1
-            except Exception as e:
+        if n_words == 1 and len(sponsors) == 0:
+            if fallback_name is not None and found[fallback_name]:
+                if fallback_name != account:
+                    sponsors[fallback_name] = 1
+                    amount_left -= 1
+            else:
                 account_error = True
-                print(f"{account_name} is not an account: {e}")
+                print(f"{fallback_name} is not an account")
         if len(sponsors) == 1 and shares > 1 and no_numbers:
             for a in sponsors:
                 sponsors[a] = shares
@@ -0,0 +1,186 @@
+from sqlalchemy import and_, or_, select
+
+from hive_sbi.hsbi.core import get_logger
+
+logger = get_logger()
+
+
+def trx_query_shapes(table, sample):
+    """
+    Build the queries TrxDB issues against the trx table
+
+    Args:
+        table (dataset.Table): The trx table
+        sample (dict): A trx row used as filter values
+
+    Returns:
+        dict: TrxDB method name -> select statement
+    """
+    t = table.table
+    c = t.c
+    source = sample.get("source", "")
+    account = sample.get("account", "")
+    return {
+        "get_all_op_index": select(t).where(c.source == source),
+        "get_account": select(t).where(and_(c.account == account, c.share_type == "Standard")),
+        "get_share_type": select(t).where(c.share_type == "Delegation"),
+        "get_lastest_share_type": select(t)
+        .where(c.share_type == "Mgmt")
+        .order_by(c["index"].desc())
+        .limit(1),
+        "get_SBD_transfer": select(t).where(
+            and_(c.account == account, c.shares == -1, c.share_type == "HBD")
+        ),
+        "update_delegation_shares": select(t).where(
+            and_(
+                c.source == source,
+                c.account == account,
+                c.status == "Valid",
+                c.share_type == "Delegation",
+            )
+        ),
+        "update_delegation_state": select(t).where(
+            and_(c.source == source, c.account == account, c.share_type == "Delegation")
+        ),
+        "update_memo": select(t).where(
+            and_(c.source == source, c.account == account, c.memo == "")
+        ),
+    }
+
+
+def transaction_memo_query_shapes(table, sample):
+    """
+    Build the cleanup query TransactionMemoDB issues against the transaction_memo table
+
+    Args:
+        table (dataset.Table): The transaction_memo table
+        sample (dict): A transaction_memo row used as filter values
+
+    Returns:
+        dict: TransactionMemoDB method name -> select statement
+    """
+    t = table.table
+    c = t.c
+    return {
+        "delete_excluded": select(t).where(
+            or_(c.sender.in_([sample.get("sender", "")]), c.to.in_([sample.get("to", "")]))
+        ),
+    }
+
+
+def ops_query_shapes(table, sample):
+    """
+    Build the queries AccountTrx issues against an <account>_ops table
+
+    Args:
+        table (dataset.Table): The ops table
+        sample (dict): An ops row used as filter values
+
+    Returns:
+        dict: AccountTrx method name -> select statement
+    """
+    t = table.table
+    c = t.c
+    return {
+        "get_all": select(t)
+        .where(
+            and_(
+                c["type"].in_(["transfer", "delegate_vesting_shares"]),
+                c.op_acc_index >= sample.get("op_acc_index", 0),
+            )
+        )
+        .order_by(c.op_acc_index),
+    }
+
+
+def explain(db, statement):
+    """
+    Return the query plan of a statement as a list of strings
+
+    Args:
+        db (dataset.Database): Database connection
+        statement: SQLAlchemy select statement
+
+    Returns:
+        list: One line per plan row
+    """
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    if dialect.name == "sqlite":
+        sql = "EXPLAIN QUERY PLAN " + sql
+    else:
+        sql = "EXPLAIN " + sql
+    plan = []
+    for row in db.executable.exec_driver_sql(sql).mappings():
+        if "detail" in row:
+            plan.append(row["detail"])
+        else:
+            plan.append(
+                "type=%s key=%s rows=%s extra=%s"
+                % (row.get("type"), row.get("key"), row.get("rows"), row.get("Extra"))
+            )
+    return plan
+
+
+def migrate_indexes(storage, query_shapes, report=True):
+    """
+    Create the missing indexes of a storage object
+
+    Prints the query plans of the given query shapes before and after the
+    migration. Running it again on a migrated table changes nothing.
+
+    Args:
+        storage: Storage object with ``__indexes__`` and ``create_indexes``
+        query_shapes (callable): Returns the statements to explain for a table
+        report (bool): Whether to print the query plans
+
+    Returns:
+        list: Names of the created indexes
+    """
+    tablename = storage.__tablename__
+    if not storage.exists_table():
+        logger.warning(f"{tablename} does not exist, nothing to migrate")
+        return []
+    table = storage.db[tablename]
+    sample = table.find_one() or {}
+    shapes = query_shapes(table, sample)
+
+    before = {}
+    if report:
+        for name, statement in shapes.items():
+            before[name] = explain(storage.db, statement)
+
+    created = storage.create_indexes()
+    if len(created) > 0:
+        logger.info(f"{tablename}: created {', '.join(created)}")
+    else:
+        logger.info(f"{tablename}: all indexes already exist")
+
+    if report:
+        for name, statement in shapes.items():
+            logger.info(f"{tablename}.{name}")
+            for line in before[name]:
+                logger.info(f"  before: {line}")
+            for line in explain(storage.db, statement):
+                logger.info(f"  after:  {line}")
+    return created
+
+
+def run():
+    """Create the secondary indexes of the sbi and ops databases"""
+    from hive_sbi.hsbi.core import load_config, setup_account_trx, setup_database_connections
+    from hive_sbi.hsbi.storage import AccountsDB, TransactionMemoDB, TrxDB
+
+    config_data = load_config()
+    db, db2 = setup_database_connections(config_data)
+
+    migrate_indexes(TrxDB(db2), trx_query_shapes)
+    migrate_indexes(TransactionMemoDB(db2), transaction_memo_query_shapes)
+
+    accountTrx = setup_account_trx(db, AccountsDB(db2).get())
+    for account in accountTrx:
+        migrate_indexes(accountTrx[account], ops_query_shapes)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,231 @@
+"""RPC nodes of the hsbi modules, cached and ordered by their health
+
+NodeList().update_nodes() reads @fullnodeupdate from the chain, which every
+module did before it could make its first call. NodePool keeps the node list
+in a cache file and updates it from @fullnodeupdate only when the file is
+older than its ttl, so neither a restart nor the next module updates it again.
+
+The latency and the error rate of the calls made through NodePool.call are
+kept per node as exponentially weighted moving averages and saved with the
+node list. nodes() returns the healthy nodes first, the fastest first, which
+is the order a Hive client tries them in.
+"""
+
+import json
+import os
+import threading
+import time
+
+from nectar.exceptions import (
+    AccountDoesNotExistsException,
+    BlockDoesNotExistsException,
+    ContentDoesNotExistsException,
+)
+from nectar.nodelist import NodeList
+
+from hive_sbi.hsbi.core import get_logger
+
+logger = get_logger()
+
+# Errors which are the same on every node, they are not retried
+NOT_RETRIED = (
+    AccountDoesNotExistsException,
+    BlockDoesNotExistsException,
+    ContentDoesNotExistsException,
+)
+
+
+class RetryPolicy:
+    """Calls a function again after an error, with exponential backoff
+
+    :param int tries: calls before the last error is raised
+    :param float delay: seconds to wait before the first retry
+    :param float factor: growth of the wait per retry
+    :param float max_delay: longest wait in seconds
+    :param tuple not_retried: exceptions which are raised at once
+    """
+
+    def __init__(self, tries=5, delay=1.0, factor=2.0, max_delay=30.0, not_retried=NOT_RETRIED):
+        self.tries = tries
+        self.delay = delay
+        self.factor = factor
+        self.max_delay = max_delay
+        self.not_retried = not_retried
+
+    def delays(self):
+        """Returns the waits before each retry"""
+        return [min(self.delay * self.factor**n, self.max_delay) for n in range(self.tries - 1)]
+
+    def call(self, func, *args, on_error=None, **kwargs):
+        """Returns func(*args, **kwargs), on_error(exception) is called after each failed call"""
+        for delay in self.delays() + [None]:
+            try:
+                return func(*args, **kwargs)
+            except self.not_retried:
+                raise
+            except Exception as e:
+                if on_error is not None:
+                    on_error(e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+
+class NodePool:
+    """Cached node list with the latency and error rate of each node
+
+    :param str cache_file: json file of the node list and node statistics
+    :param float ttl: seconds until the node list is updated from @fullnodeupdate
+    :param bool hive: Hive nodes when True, Steem nodes otherwise
+    :param float alpha: weight of the newest call in the moving averages
+    :param float max_error_rate: nodes above this error rate are unhealthy
+    :param RetryPolicy retry: the retry policy of call
+    """
+
+    def __init__(
+        self,
+        cache_file="node_cache.json",
+        ttl=6 * 3600,
+        hive=True,
+        alpha=0.2,
+        max_error_rate=0.5,
+        retry=None,
+    ):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.hive = hive
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.retry = retry or RetryPolicy()
+        self.lock = threading.Lock()
+        self.updated = None
+        self.node_list = None
+        self.stats = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.cache_file):
+            return
+        try:
+            with open(self.cache_file) as f:
+                data = json.load(f)
+            self.updated = data["updated"]
+            self.node_list = data["nodes"]
+            self.stats = data.get("stats", {})
+        except Exception as e:
+            logger.warning(f"could not read node cache {self.cache_file}: {str(e)}")
+
+    def save(self):
+        """Write the node list and the node statistics to the cache file"""
+        if self.node_list is None:
+            return
+        with self.lock:
+            data = {"updated": self.updated, "nodes": self.node_list, "stats": self.stats}
+        tmp_file = self.cache_file + ".tmp"
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logger.warning(f"could not write node cache {self.cache_file}: {str(e)}")
+
+    def is_stale(self):
+        return self.updated is None or time.time() - self.updated > self.ttl
+
+    def update(self):
+        """Read the node list from @fullnodeupdate, the node statistics start again"""
+        nodes = NodeList()
+        try:
+            nodes.update_nodes()
+        except Exception as e:
+            logger.warning(f"could not update nodes: {str(e)}")
+            if self.node_list:
+                # Keep the cached nodes, the next process tries again
+                return
+        with self.lock:
+            self.node_list = nodes.get_nodes(hive=self.hive)
+            self.stats = {node: stat for node, stat in self.stats.items() if node in self.node_list}
+            self.updated = time.time()
+        self.save()
+
+    def nodes(self):
+        """Returns the nodes, healthy nodes first and the fastest first"""
+        if self.node_list is None or self.is_stale():
+            self.update()
+        with self.lock:
+            stats = dict(self.stats)
+
+        def score(n_node):
+            n, node = n_node
+            stat = stats.get(node, {})
+            latency = stat.get("latency")
+            unhealthy = stat.get("errors", 0) > self.max_error_rate
+            # Untried nodes keep the order of @fullnodeupdate behind the measured ones
+            return (unhealthy, latency is None, latency or 0, n)
+
+        return [node for _, node in sorted(enumerate(self.node_list), key=score)]
+
+    def record(self, node, latency=None, error=False):
+        """Add a call to the moving averages of a node"""
+        if node is None:
+            return
+        with self.lock:
+            stat = self.stats.setdefault(node, {})
+            stat["errors"] = self.alpha * error + (1 - self.alpha) * stat.get("errors", 0)
+            if latency is not None:
+                if stat.get("latency") is None:
+                    stat["latency"] = latency
+                else:
+                    stat["latency"] = self.alpha * latency + (1 - self.alpha) * stat["latency"]
+
+    def call(self, hv, func, *args, **kwargs):
+        """Returns func(*args, **kwargs) with the retry policy
+
+        Each call is recorded for the current node of the Hive client hv, on
+        an error hv switches to its next node before the retry.
+        """
+
+        def current_node():
+            return hv.rpc.url if hv.rpc is not None else None
+
+        def timed_call():
+            node = current_node()
+            start = time.monotonic()
+            result = func(*args, **kwargs)
+            self.record(node, latency=time.monotonic() - start)
+            return result
+
+        def on_error(e):
+            node = current_node()
+            logger.warning(f"call to {node} failed: {str(e)}")
+            self.record(node, error=True)
+            try:
+                hv.rpc.next()
+            except Exception as e:
+                logger.warning(f"could not switch node: {str(e)}")
+
+        return self.retry.call(timed_call, on_error=on_error)
+
+
+class NodeSemaphores:
+    """One semaphore per node, shared by all threads which call the nodes
+
+    The semaphores of the known nodes are created up front. A node which is
+    not in the list, e.g. the node a client switched to, gets its semaphore
+    on the first lookup, and all later lookups share it.
+
+    :param list nodes: node urls
+    :param int concurrency: threads which may use a node at the same time
+    """
+
+    def __init__(self, nodes, concurrency):
+        self.concurrency = concurrency
+        self.lock = threading.Lock()
+        self.semaphores = {node: threading.BoundedSemaphore(concurrency) for node in nodes}
+
+    def get(self, node):
+        """Returns the semaphore of a node"""
+        with self.lock:
+            if node not in self.semaphores:
+                self.semaphores[node] = threading.BoundedSemaphore(self.concurrency)
+            return self.semaphores[node]
@@ -5,12 +5,14 @@ from datetime import datetime
 from nectar.account import Account
 from nectar.amount import Amount
 from nectar.instance import shared_blockchain_instance
-from nectar.memo import Memo
 from nectar.utils import (
     addTzInfo,
     formatTimeString,
 )
 
+from hive_sbi.hsbi.amount import amount_value, asset_table, format_amount, parse_amount
+from hive_sbi.hsbi.member import ShareAgeIndex
+from hive_sbi.hsbi.memo_decryptor import MemoDecryptor
 from hive_sbi.hsbi.memo_parser import MemoParser
 
 log = logging.getLogger(__name__)
@@ -27,6 +29,10 @@ class ParseAccountHist(list):
         member_data,
         memberStorage=None,
         blockchain_instance=None,
+        share_age_index=None,
+        account_lookup=None,
+        memo_decryptor=None,
+        memo_exclusions=None,
     ):
         self.hive = blockchain_instance or shared_blockchain_instance()
         self.account = Account(account, blockchain_instance=self.hive)
@@ -36,7 +42,16 @@ class ParseAccountHist(list):
         self.path = path
         self.member_data = member_data
         self.memberStorage = memberStorage
-        self.memo_parser = MemoParser(blockchain_instance=self.hive)
+        # Built from member_data on the first sponsee selection when not given
+        self.share_age_index = share_age_index
+        self.assets = asset_table(self.hive)
+        self.memo_decryptor = memo_decryptor or MemoDecryptor(blockchain_instance=self.hive)
+        self.memo_parser = MemoParser(blockchain_instance=self.hive, account_lookup=account_lookup)
+        # Transfers of these senders and to these recipients are not kept in
+        # transaction_memo, see MemoExclusionDB.get
+        self.memo_exclusions = memo_exclusions or {"sender": set(), "to": set()}
+        # (memo, shares, account) -> parse_memo result, filled by prepare_transfers
+        self.parsed_memos = {}
         self.excluded_accounts = [
             "minnowbooster",
             "smartsteem",
@@ -67,16 +82,9 @@ class ParseAccountHist(list):
         self.transactionOutStorage = transactionOutStorage
 
     def get_highest_avg_share_age_account(self):
-        max_avg_share_age = 0
-        account_name = None
-        for m in self.member_data:
-            self.member_data[m].calc_share_age()
-        for m in self.member_data:
-            if max_avg_share_age < self.member_data[m]["avg_share_age"]:
-                max_avg_share_age = self.member_data[m]["avg_share_age"]
-                account_name = m
-
-        return account_name
+        if self.share_age_index is None:
+            self.share_age_index = ShareAgeIndex(self.member_data)
+        return self.share_age_index.highest()
 
     def update_delegation(self, op, delegated_in=None, delegated_out=None):
         """Updates the internal state arrays
@@ -140,39 +148,86 @@ class ParseAccountHist(list):
 
         self.delegated_vests_out = new_deleg
 
-        delegated_sp_in = {}
-        for acc in self.delegated_vests_in:
-            vests = Amount(self.delegated_vests_in[acc])
-            delegated_sp_in[acc] = str(self.hive.vests_to_hp(vests))
-        delegated_sp_out = {}
-        for acc in self.delegated_vests_out:
-            vests = Amount(self.delegated_vests_out[acc])
-            delegated_sp_out[acc] = str(self.hive.vests_to_hp(vests))
-
-        if self.path is None:
-            return
-
-    def parse_transfer_out_op(self, op):
-        amount = Amount(op["amount"], blockchain_instance=self.hive)
-        index = op["index"]
-        account = op["from"]
-        timestamp = op["timestamp"]
-        encrypted = False
+    def encrypted_memo(self, op):
+        """Returns the encrypted memo of a transfer sent by steembasicincome, None otherwise"""
         processed_memo = ascii(op["memo"]).replace("\n", "").replace("\\n", "").replace("\\", "")
         if (
             len(processed_memo) > 2
             and (processed_memo[0] == "#" or processed_memo[1] == "#" or processed_memo[2] == "#")
-            and account == "steembasicincome"
+            and op["from"] == "steembasicincome"
         ):
             if processed_memo[1] == "#":
                 processed_memo = processed_memo[1:-1]
             elif processed_memo[2] == "#":
                 processed_memo = processed_memo[2:-2]
-            memo = Memo(account, op["to"], blockchain_instance=self.hive)
-            processed_memo = ascii(memo.decrypt(processed_memo)).replace("\n", "")
-            encrypted = True
+            return processed_memo
+        return None
+
+    def prepare_memos(self, ops):
+        """Decrypt the encrypted memos of a batch of ops before they are parsed"""
+        memos = []
+        for op in ops:
+            if op["type"] != "transfer":
+                continue
+            encrypted_memo = self.encrypted_memo(op)
+            if encrypted_memo is not None:
+                memos.append((op["from"], op["to"], encrypted_memo))
+        if len(memos) > 0:
+            self.memo_decryptor.decrypt_batch(memos)
+
+    def processed_memo(self, op):
+        """Returns the memo of a transfer as it is stored, and whether it was encrypted"""
+        processed_memo = ascii(op["memo"]).replace("\n", "").replace("\\n", "").replace("\\", "")
+        encrypted_memo = self.encrypted_memo(op)
+        if encrypted_memo is None:
+            return processed_memo, False
+        processed_memo = self.memo_decryptor.decrypt(op["from"], op["to"], encrypted_memo)
+        return ascii(processed_memo).replace("\n", ""), True
+
+    def parse_memo(self, processed_memo, shares, account):
+        """Returns the parse_memo result of the memo parser, prepared ones are taken first"""
+        key = (processed_memo, shares, account)
+        if key in self.parsed_memos:
+            return self.parsed_memos.pop(key)
+        return self.memo_parser.parse_memo(processed_memo, shares, account)
+
+    def prepare_transfers(self, ops):
+        """Decrypt and parse the memos of the incoming transfers of ops
+
+        Nothing here depends on the other accounts or on member_data, so the
+        ops of several accounts can be prepared in parallel. The account names
+        of all memos are looked up together. parse_op then only assigns the
+        sponsees and adds the rows.
+        """
+        self.prepare_memos(ops)
+        memos = []
+        for op in ops:
+            if (
+                op["type"] != "transfer"
+                or op["to"] != self.account["name"]
+                or op["from"] in self.excluded_accounts
+            ):
+                continue
+            processed_memo, _ = self.processed_memo(op)
+            if processed_memo.lower().replace(",", "  ").replace('"', "") == "":
+                continue
+            satoshis, amount_symbol = parse_amount(op["amount"], self.assets)
+            shares = int(amount_value(satoshis, amount_symbol, self.assets))
+            memos.append((processed_memo, shares, op["from"]))
+        self.memo_parser.prefetch([memo for memo, _, _ in memos])
+        for key in memos:
+            if key not in self.parsed_memos:
+                self.parsed_memos[key] = self.memo_parser.parse_memo(*key)
 
-        if amount.amount < 1:
+    def parse_transfer_out_op(self, op):
+        satoshis, amount_symbol = parse_amount(op["amount"], self.assets)
+        amount = amount_value(satoshis, amount_symbol, self.assets)
+        index = op["index"]
+        account = op["from"]
+        timestamp = op["timestamp"]
+        processed_memo, encrypted = self.processed_memo(op)
+
+        if amount < 1:
             data = {
                 "index": index,
                 "sender": account,
@@ -180,15 +235,15 @@ class ParseAccountHist(list):
                 "memo": processed_memo,
                 "encrypted": encrypted,
                 "referenced_accounts": None,
-                "amount": amount.amount,
-                "amount_symbol": amount.symbol,
+                "amount": amount,
+                "amount_symbol": amount_symbol,
                 "timestamp": timestamp,
             }
             self.transactionOutStorage.add(data)
             return
-        if amount.symbol == self.hive.hbd_symbol:
+        if amount_symbol == self.hive.hbd_symbol:
             # self.trxStorage.get_account(op["to"], share_type="SBD")
-            shares = -int(amount.amount)
+            shares = -int(amount)
             if "http" in op["memo"] or self.hive.hive_symbol not in op["memo"]:
                 data = {
                     "index": index,
@@ -197,8 +252,8 @@ class ParseAccountHist(list):
                     "memo": processed_memo,
                     "encrypted": encrypted,
                     "referenced_accounts": None,
-                    "amount": amount.amount,
-                    "amount_symbol": amount.symbol,
+                    "amount": amount,
+                    "amount_symbol": amount_symbol,
                     "timestamp": timestamp,
                 }
                 self.transactionOutStorage.add(data)
@@ -230,8 +285,8 @@ class ParseAccountHist(list):
                 "memo": processed_memo,
                 "encrypted": encrypted,
                 "referenced_accounts": sponsee,
-                "amount": amount.amount,
-                "amount_symbol": amount.symbol,
+                "amount": amount,
+                "amount_symbol": amount_symbol,
                 "timestamp": timestamp,
             }
             self.transactionOutStorage.add(data)
@@ -245,34 +300,24 @@ class ParseAccountHist(list):
                 "memo": processed_memo,
                 "encrypted": encrypted,
                 "referenced_accounts": None,
-                "amount": amount.amount,
-                "amount_symbol": amount.symbol,
+                "amount": amount,
+                "amount_symbol": amount_symbol,
                 "timestamp": timestamp,
             }
             self.transactionOutStorage.add(data)
             return
 
     def parse_transfer_in_op(self, op):
-        amount = Amount(op["amount"], blockchain_instance=self.hive)
+        satoshis, amount_symbol = parse_amount(op["amount"], self.assets)
+        amount = amount_value(satoshis, amount_symbol, self.assets)
         share_type = "Standard"
         index = op["index"]
         account = op["from"]
         timestamp = op["timestamp"]
         sponsee = {}
-        processed_memo = ascii(op["memo"]).replace("\n", "").replace("\\n", "").replace("\\", "")
-        if (
-            len(processed_memo) > 2
-            and (processed_memo[0] == "#" or processed_memo[1] == "#" or processed_memo[2] == "#")
-            and account == "steembasicincome"
-        ):
-            if processed_memo[1] == "#":
-                processed_memo = processed_memo[1:-1]
-            elif processed_memo[2] == "#":
-                processed_memo = processed_memo[2:-2]
-            memo = Memo(account, op["to"], blockchain_instance=self.hive)
-            processed_memo = ascii(memo.decrypt(processed_memo)).replace("\n", "")
+        processed_memo, _ = self.processed_memo(op)
 
-        shares = int(amount.amount)
+        shares = int(amount)
         if processed_memo.lower().replace(",", "  ").replace('"', "") == "":
             self.new_transfer_record(
                 index,
@@ -284,10 +329,15 @@ class ParseAccountHist(list):
                 timestamp,
             )
             return
-        [sponsor, sponsee, not_parsed_words, account_error] = self.memo_parser.parse_memo(
+        [sponsor, sponsee, not_parsed_words, account_error] = self.parse_memo(
             processed_memo, shares, account
         )
-        if amount.amount < 1:
+        if amount < 1:
+            if (
+                account in self.memo_exclusions["sender"]
+                or self.account["name"] in self.memo_exclusions["to"]
+            ):
+                return
             data = {
                 "index": index,
                 "sender": account,
@@ -295,13 +345,13 @@ class ParseAccountHist(list):
                 "memo": processed_memo,
                 "encrypted": False,
                 "referenced_accounts": sponsor + ";" + json.dumps(sponsee),
-                "amount": amount.amount,
-                "amount_symbol": amount.symbol,
+                "amount": amount,
+                "amount_symbol": amount_symbol,
                 "timestamp": timestamp,
             }
             self.transactionStorage.add(data)
             return
-        if amount.symbol == self.hive.hbd_symbol:
+        if amount_symbol == self.hive.hbd_symbol:
             share_type = self.hive.hbd_symbol
 
         sponsee_amount = 0
@@ -321,7 +371,7 @@ class ParseAccountHist(list):
                     + " from: "
                     + sponsor
                     + " amount: "
-                    + str(amount)
+                    + format_amount(satoshis, amount_symbol, self.assets)
                     + " memo: "
                     + processed_memo
                     + "\n"
@@ -352,7 +402,7 @@ class ParseAccountHist(list):
                 share_type=share_type,
             )
             self.memberStorage.update_avg_share_age(sponsee_account, 0)
-            self.member_data[sponsee_account]["avg_share_age"] = 0
+            self.share_age_index.set(sponsee_account, 0)
             return
         elif sponsee_amount == 0 and not account_error:
             sponsee = {}
@@ -363,7 +413,7 @@ class ParseAccountHist(list):
                 + " from: "
                 + sponsor
                 + " amount: "
-                + str(amount)
+                + format_amount(satoshis, amount_symbol, self.assets)
                 + " memo: "
                 + processed_memo
                 + "\n"
@@ -397,7 +447,7 @@ class ParseAccountHist(list):
                     share_type=share_type,
                 )
                 self.memberStorage.update_avg_share_age(sponsee_account, 0)
-                self.member_data[sponsee_account]["avg_share_age"] = 0
+                self.share_age_index.set(sponsee_account, 0)
                 return
             else:
                 sponsee = {}
@@ -421,7 +471,7 @@ class ParseAccountHist(list):
                 + " from: "
                 + sponsor
                 + " amount: "
-                + str(amount)
+                + format_amount(satoshis, amount_symbol, self.assets)
                 + " memo: "
                 + ascii(op["memo"])
                 + "\n"
@@ -447,7 +497,7 @@ class ParseAccountHist(list):
                 + " from: "
                 + sponsor
                 + " amount: "
-                + str(amount)
+                + format_amount(satoshis, amount_symbol, self.assets)
                 + " memo: "
                 + ascii(op["memo"])
                 + "\n"
@@ -536,7 +586,6 @@ class ParseAccountHist(list):
                 return
 
         elif op["type"] == "transfer":
-            amount = Amount(op["amount"], blockchain_instance=self.hive)
             # print(op)
             if op["from"] == self.account["name"] and op["to"] not in self.excluded_accounts:
                 self.parse_transfer_out_op(op)
@@ -1,46 +1,69 @@
+import importlib
 import sys
 import time
 
-from hive_sbi.hsbi.core import (
-    get_logger,
-    load_config,
-    setup_database_connections,
-    setup_storage_objects,
-)
+# Only light modules are imported here, the context, dataset and nectar are
+# imported once a module runs, see main
+from hive_sbi.hsbi.core import get_logger, load_config
 
 logger = get_logger()
-from hive_sbi.hsbi.cycle import is_new_cycle
-from hive_sbi.hsbi.init_db import init_database
+from hive_sbi.hsbi.cycle import is_new_cycle, read_cycle_stamp, write_cycle_stamp
 from hive_sbi.hsbi.utils import measure_execution_time, print_elapsed_time
 
-
-def run_module(module_name):
+# Maintenance commands, they run outside of the share cycle
+COMMANDS = {
+    "migrate-indexes": "hive_sbi.hsbi.migrate",
+    "compact-ops": "hive_sbi.hsbi.compact_ops",
+    "daemon": "hive_sbi.hsbi.daemon",
+}
+
+# Modules of a share cycle, in the order run_all runs them
+MODULES = [
+    "store_ops_db",
+    "transfer",
+    "check_delegation",
+    "update_member_db",
+    "store_member_hist",
+    "upvote_post_comment",
+    "stream_post_comment",
+    "build_member_db",
+    "check_member_db",
+]
+
+# Modules which process the new blocks, the daemon also runs them between the cycles
+STREAM_MODULES = ["upvote_post_comment", "stream_post_comment"]
+
+
+def run_module(module_name, ctx=None, check_cycle=True):
     """
     Run a specific SBI module
 
     Args:
         module_name (str): Name of the module to run
+        ctx (HsbiContext, optional): Shared runtime context, a new one is created when None
+        check_cycle (bool): Only run the module when a new cycle is due, False
+            runs a stream module between the cycles, which keeps last_cycle
     """
     start_time = time.time()
 
-    # Load configuration
-    config_data = load_config()
+    if ctx is None:
+        from hive_sbi.hsbi.context import HsbiContext
 
-    # Initialize database if needed
-    init_database(config_file="config.json")
+        ctx = HsbiContext()
 
-    # Setup database connections
-    db, db2 = setup_database_connections(config_data)
+    # Initialize database if needed
+    ctx.init_database()
 
-    # Setup storage objects
-    storage = setup_storage_objects(db, db2)
+    # Read the accounts and the configuration the previous module may have changed
+    storage = ctx.refresh()
+    write_cycle_stamp(storage["conf_setup"], ctx.config.get("cycle_stamp_file", "cycle_stamp.json"))
 
     # Print elapsed time since last cycle
     # NOTE: print_elapsed_time may still use print internally. Consider refactoring it to use logging if needed.
     print_elapsed_time(module_name, storage["conf_setup"]["last_cycle"])
 
     # Check if it's time for a new cycle
-    if not is_new_cycle(storage["conf_setup"]):
+    if check_cycle and not is_new_cycle(storage["conf_setup"]):
         logger.info(f"{module_name}: Not time for a new cycle yet. Exiting.")
         return
 
@@ -68,42 +91,131 @@ def run_module(module_name):
         return
 
     # Run the module
-    run()
+    try:
+        if check_cycle:
+            run(ctx)
+        else:
+            # A stream module run between the cycles must not start the next cycle
+            run(ctx, check_cycle=False)
+    finally:
+        # Keep the node statistics of the module's calls for the next process
+        ctx.node_pool.save()
 
     # Print execution time
     logger.info(f"{module_name} script run {measure_execution_time(start_time):.2f} s")
 
 
-def run_all():
+def run_all(ctx=None, stop_event=None):
     """
     Run all SBI modules in sequence
+
+    Args:
+        ctx (HsbiContext, optional): Shared runtime context, a new one is created when None
+        stop_event (threading.Event, optional): When set, no further module is started
     """
-    modules = [
-        "store_ops_db",
-        "transfer",
-        "check_delegation",
-        "update_member_db",
-        "store_member_hist",
-        "upvote_post_comment",
-        "stream_post_comment",
-        "build_member_db",
-        "check_member_db",
-    ]
-
-    for module in modules:
+    # One context for the whole cycle, the modules share its connections and clients
+    if ctx is None:
+        from hive_sbi.hsbi.context import HsbiContext
+
+        ctx = HsbiContext()
+    for module in MODULES:
+        if stop_event is not None and stop_event.is_set():
+            logger.info(f"Stopping before {module}")
+            return
         logger.info(f"Running {module}...")
-        run_module(module)
+        run_module(module, ctx)
         logger.info(f"Finished {module}\n")
 
 
+def cycle_not_due(config_data):
+    """
+    Check the cycle stamp, without the database
+
+    Args:
+        config_data (dict): Configuration data from config.json
+
+    Returns:
+        bool: True when the stamp shows that the next cycle is not due yet
+    """
+    minutes = read_cycle_stamp(
+        config_data.get("cycle_stamp_file", "cycle_stamp.json"),
+        config_data.get("cycle_stamp_minutes", 10),
+    )
+    if minutes is None or minutes <= 0:
+        return False
+    logger.info(f"Not time for a new cycle yet, next cycle in {minutes:.2f} min. Exiting.")
+    return True
+
+
+def profile_import(args, top=25):
+    """
+    Run hsbi with python -X importtime and print the slowest imports
+
+    Args:
+        args (list): Arguments of the profiled hsbi run
+        top (int): Number of imports to print
+
+    Returns:
+        int: Exit code of the profiled run
+    """
+    import subprocess
+
+    start_time = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "hive_sbi.hsbi.runner", *args],
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start_time
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            # Log output of the profiled run
+            print(line, file=sys.stderr)
+            continue
+        fields = line[len("import time:") :].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except (IndexError, ValueError):
+            # The header line
+            continue
+        imports.append((cumulative_us, self_us, fields[2].rstrip()))
+
+    print(f"{'cumulative':>12s} {'self':>10s}  imported package")
+    for cumulative_us, self_us, name in sorted(imports, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:9.1f} ms {self_us / 1000:7.1f} ms  {name}")
+    total_us = sum(self_us for _, self_us, _ in imports)
+    print(f"{len(imports)} imports in {total_us / 1000:.1f} ms, run {elapsed * 1000:.1f} ms")
+    return result.returncode
+
+
 def main():
     """Entry point for the command-line script."""
-    if len(sys.argv) > 1:
+    if "--profile-import" in sys.argv[1:]:
+        # Profile the imports of the same command
+        args = [arg for arg in sys.argv[1:] if arg != "--profile-import"]
+        sys.exit(profile_import(args))
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        # Run maintenance command
+        importlib.import_module(COMMANDS[sys.argv[1]]).run()
+        return
+
+    module_name = sys.argv[1] if len(sys.argv) > 1 else None
+    config_data = load_config()
+    # Before the next cycle the run ends here, without importing dataset or nectar
+    if module_name in MODULES + [None] and cycle_not_due(config_data):
+        return
+
+    from hive_sbi.hsbi.context import HsbiContext
+
+    ctx = HsbiContext(config_data=config_data)
+    if module_name is not None:
         # Run specific module
-        run_module(sys.argv[1])
+        run_module(module_name, ctx)
     else:
         # Run all modules
-        run_all()
+        run_all(ctx)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,12 @@
 import logging
+from datetime import datetime, timezone
 
 from nectar.utils import addTzInfo
+from sqlalchemy import Index, String, and_, bindparam, or_, select, tuple_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from hive_sbi.hsbi.member import Member
+from hive_sbi.hsbi.member_index import members_changed
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
@@ -9,13 +15,238 @@ log.addHandler(logging.StreamHandler())
 timeformat = "%Y%m%d-%H%M%S"
 
 
+def create_indexes(db, tablename, indexes):
+    """Create the named indexes of a table which do not exist yet
+
+    :param dataset.Database db: database connection
+    :param str tablename: table name
+    :param dict indexes: index name -> list of column names
+    :returns: names of the created indexes
+    """
+    table = db[tablename]
+    existing = [ix["name"] for ix in db.inspect.get_indexes(tablename, schema=db.schema)]
+    created = []
+    for name, columns in indexes.items():
+        if name in existing:
+            continue
+        if not all(table.has_column(column) for column in columns):
+            log.warning("Skipping index %s, %s has no column %s" % (name, tablename, columns))
+            continue
+        index_columns = [table.table.c[column] for column in columns]
+        kw = {}
+        if db.engine.dialect.name == "mysql":
+            # Tables created by dataset use unbounded TEXT columns, which MySQL
+            # can only index with a prefix length
+            kw["mysql_length"] = {
+                c.name: 50
+                for c in index_columns
+                if isinstance(c.type, String) and c.type.length is None
+            }
+        Index(name, *index_columns, **kw).create(bind=db.executable)
+        created.append(name)
+    return created
+
+
+def _normalize(value):
+    """The value as it is read back from the database, for change detection"""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _has_unique_key(db, tablename, keys):
+    """Returns True when a primary key or unique index covers exactly the key columns"""
+    inspector = db.inspect
+    unique = [inspector.get_pk_constraint(tablename, schema=db.schema)["constrained_columns"]]
+    for constraint in inspector.get_unique_constraints(tablename, schema=db.schema):
+        unique.append(constraint["column_names"])
+    for index in inspector.get_indexes(tablename, schema=db.schema):
+        if index["unique"]:
+            unique.append(index["column_names"])
+    return set(keys) in [set(columns) for columns in unique]
+
+
+def _insert_statement(db, table, keys, columns):
+    """INSERT of columns which updates a row with the same keys inserted meanwhile"""
+    dialect = db.engine.dialect.name
+    update = [c for c in columns if c not in keys] or list(keys)
+    if dialect == "mysql":
+        statement = mysql.insert(table)
+        return statement.on_duplicate_key_update({c: statement.inserted[c] for c in update})
+    if dialect in ("sqlite", "postgresql"):
+        statement = (sqlite if dialect == "sqlite" else postgresql).insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=keys, set_={c: statement.excluded[c] for c in update}
+        )
+    return table.insert()
+
+
+def bulk_upsert(db, tablename, rows, keys, chunk_size=1000):
+    """Insert or update rows identified by the key columns, with few statements
+
+    The stored rows are read with one query per chunk_size rows and compared
+    with the new ones. Unchanged rows are skipped, of the changed rows only
+    the changed columns are updated. Rows with the same columns are written
+    together with executemany. New rows are inserted with INSERT ... ON
+    DUPLICATE KEY UPDATE on MySQL and INSERT ... ON CONFLICT on SQLite and
+    PostgreSQL when a primary key or unique index covers the key columns.
+
+    Does not commit, missing columns are created like ``Table.upsert`` does.
+
+    :param dataset.Database db: database connection
+    :param str tablename: table name
+    :param list rows: rows as dicts, a later row with the same keys wins
+    :param list keys: columns which identify a row
+    :returns: number of inserted and updated rows
+    """
+    merged = {}
+    for row in rows:
+        key = tuple(_normalize(row[k]) for k in keys)
+        merged.setdefault(key, {}).update(row)
+    if len(merged) == 0:
+        return 0
+    table = db[tablename]
+    if not table.exists:
+        table.insert_many(list(merged.values()), chunk_size=chunk_size)
+        return len(merged)
+    examples = {}
+    for row in merged.values():
+        for column, value in row.items():
+            if examples.get(column) is None:
+                examples[column] = value
+    for column, value in examples.items():
+        if not table.has_column(column):
+            table.create_column_by_example(column, value)
+
+    t = table.table
+    key_columns = [t.c[k] for k in keys]
+    stored = {}
+    items = list(merged.items())
+    for i in range(0, len(items), chunk_size):
+        chunk = [key for key, _ in items[i : i + chunk_size]]
+        if len(keys) == 1:
+            clause = key_columns[0].in_([key[0] for key in chunk])
+        else:
+            clause = tuple_(*key_columns).in_(chunk)
+        for existing in table.find(clause):
+            stored[tuple(_normalize(existing[k]) for k in keys)] = existing
+
+    # column names -> rows, rows with the same columns share a statement
+    inserts = {}
+    updates = {}
+    for key, row in items:
+        existing = stored.get(key)
+        if existing is None:
+            inserts.setdefault(tuple(sorted(row)), []).append(row)
+            continue
+        changed = {
+            column: value
+            for column, value in row.items()
+            if column not in keys and _normalize(value) != _normalize(existing.get(column))
+        }
+        if len(changed) == 0:
+            continue
+        for k in keys:
+            changed["_key_" + k] = existing[k]
+        updates.setdefault(tuple(sorted(changed)), []).append(changed)
+
+    count = 0
+    if len(inserts) > 0:
+        unique = _has_unique_key(db, tablename, keys)
+        for columns, group in inserts.items():
+            statement = _insert_statement(db, t, keys, columns) if unique else t.insert()
+            for i in range(0, len(group), chunk_size):
+                db.executable.execute(statement, group[i : i + chunk_size])
+            count += len(group)
+    # The key values are bound as _key_<column>, the other values set the columns
+    statement = t.update().where(and_(*[c == bindparam("_key_" + c.name) for c in key_columns]))
+    for group in updates.values():
+        for i in range(0, len(group), chunk_size):
+            db.executable.execute(statement, group[i : i + chunk_size])
+        count += len(group)
+    return count
+
+
+class WriteBuffer:
+    """Collects rows of several storage objects and writes them in one transaction
+
+    While the buffer is entered, ``add`` of every attached storage object queues
+    its row here instead of inserting and committing it. Leaving the ``with``
+    block writes the queued rows with ``insert_many`` and commits each database
+    once. An exception rolls back all databases and drops the queued rows.
+
+    Databases are committed in the order their storage objects were passed, so
+    the storage which holds the resume position should be passed last.
+
+    :param storages: storage objects with a ``writer`` attribute
+    :param int chunk_size: rows per ``insert_many`` statement
+    """
+
+    def __init__(self, *storages, chunk_size=1000):
+        self.storages = storages
+        self.chunk_size = chunk_size
+        self.rows = {}
+        self.dbs = []
+        for storage in storages:
+            if storage.db not in self.dbs:
+                self.dbs.append(storage.db)
+
+    def __enter__(self):
+        for db in self.dbs:
+            db.begin()
+        for storage in self.storages:
+            storage.writer = self
+        return self
+
+    def __exit__(self, error_type, error_value, traceback):
+        for storage in self.storages:
+            storage.writer = None
+        if error_type is not None:
+            self.rows = {}
+            for db in self.dbs:
+                db.rollback()
+            return False
+        try:
+            self.flush()
+        except Exception:
+            self.rows = {}
+            for db in self.dbs:
+                db.rollback()
+            raise
+        for db in self.dbs:
+            db.commit()
+        return False
+
+    def add(self, storage, data):
+        """Queue a row for the table of the given storage object"""
+        if storage not in self.rows:
+            self.rows[storage] = []
+        self.rows[storage].append(data)
+
+    def flush(self):
+        """Write all queued rows into the open transactions without committing"""
+        for storage, rows in self.rows.items():
+            if len(rows) > 0:
+                table = storage.db[storage.__tablename__]
+                table.insert_many(rows, chunk_size=self.chunk_size)
+        self.rows = {}
+
+
 class TrxDB:
     """This is the trx storage class"""
 
     __tablename__ = "trx"
+    # Secondary indexes for the filters used below, see hsbi.migrate
+    __indexes__ = {
+        "ix_trx_source_index": ["source", "index"],
+        "ix_trx_source_account": ["source", "account"],
+        "ix_trx_account_share_type": ["account", "share_type"],
+        "ix_trx_share_type_index": ["share_type", "index"],
+    }
 
     def __init__(self, db):
         self.db = db
+        self.writer = None
 
     def exists_table(self):
         """Check if the database table exists"""
@@ -32,13 +263,34 @@ class TrxDB:
             # Create the table
             self.db.create_table(self.__tablename__)
 
+    def create_indexes(self):
+        """Create the missing secondary indexes, returns the created index names"""
+        return create_indexes(self.db, self.__tablename__, self.__indexes__)
+
     def get_all_data(self):
         """Returns the public keys stored in the database"""
         return self.db[self.__tablename__].all()
 
     def get_all_data_sorted(self):
-        """Returns the public keys stored in the database"""
-        return self.db[self.__tablename__].find(order_by="index")
+        """Returns all trx ordered by index and source, the primary key order"""
+        return self.db[self.__tablename__].find(order_by=["index", "source"], _streamed=True)
+
+    def get_sources(self):
+        """Returns the distinct sources"""
+        table = self.db[self.__tablename__]
+        return [trx["source"] for trx in table.distinct("source")]
+
+    def get_source_ops(self, source, start_index=None):
+        """Returns the trx of a source ordered by index
+
+        :param str source: source account
+        :param int start_index: only trx with an index of at least start_index
+        """
+        table = self.db[self.__tablename__]
+        filters = {"source": source}
+        if start_index is not None:
+            filters["index"] = {">=": start_index}
+        return table.find(order_by="index", _streamed=True, **filters)
 
     def get_all_op_index(self, source):
         """Returns all ids"""
@@ -48,6 +300,22 @@ class TrxDB:
             id_list.append(trx["index"])
         return id_list
 
+    def get_latest_op_index(self, source):
+        """Returns the trx with the highest index of a source"""
+        table = self.db[self.__tablename__]
+        return table.find_one(source=source, order_by="-index")
+
+    def flush_writer(self):
+        """Push rows queued in an attached WriteBuffer so that reads see them"""
+        if self.writer is not None:
+            self.writer.flush()
+
+    def record_change(self, index, source):
+        """Record a trx row changed in place, see TrxChangeDB"""
+        changeStorage = TrxChangeDB(self.db)
+        if changeStorage.exists_table():
+            changeStorage.add(index, source)
+
     def get_account(self, account, share_type="standard"):
         """Returns all entries for given value"""
         table = self.db[self.__tablename__]
@@ -62,16 +330,18 @@ class TrxDB:
         return table.find_one(index=index, source=source)
 
     def get_share_type(self, share_type):
-        """Returns all ids"""
+        """Returns all trx of a share type, or of a list of share types"""
         table = self.db[self.__tablename__]
-        return table.find(share_type=share_type)
+        return table.find(share_type=share_type, order_by=["index", "source"])
 
     def get_lastest_share_type(self, share_type):
+        self.flush_writer()
         table = self.db[self.__tablename__]
         return table.find_one(order_by="-index", share_type=share_type)
 
     def get_SBD_transfer(self, account, shares, timestamp, hbd_symbol="SBD"):
         """Returns all entries for given value"""
+        self.flush_writer()
         table = self.db[self.__tablename__]
         found_trx = None
         for trx in table.find(account=account, shares=-shares, share_type=hbd_symbol):
@@ -87,6 +357,7 @@ class TrxDB:
             source=source, account=account, status="Valid", share_type="Delegation"
         ):
             found_trx = trx
+        self.record_change(found_trx["index"], source)
         data = dict(index=found_trx["index"], source=source, shares=shares)
         table.update(data, ["index", "source"])
 
@@ -96,6 +367,7 @@ class TrxDB:
         found_trx = None
         for trx in table.find(source=source, account=account, share_type=share_type_old):
             found_trx = trx
+        self.record_change(found_trx["index"], source)
         data = dict(index=found_trx["index"], source=source, share_type=share_type_new)
         table.update(data, ["index", "source"])
 
@@ -114,23 +386,29 @@ class TrxDB:
         found_trx = None
         for trx in table.find(source=source, account=account, memo=memo):
             found_trx = trx
+        self.record_change(found_trx["index"], source)
         data = dict(index=found_trx["index"], source=source, sponsee=sponsee, status=status)
         table.update(data, ["index", "source"])
 
     def update_sponsee_index(self, index, source, sponsee, status):
         """Change share_age depending on timestamp"""
         table = self.db[self.__tablename__]
+        self.record_change(index, source)
         data = dict(index=index, source=source, sponsee=sponsee, status=status)
         table.update(data, ["index", "source"])
 
     def update_sponsor_index(self, index, source, sponsor, status):
         """Change share_age depending on timestamp"""
         table = self.db[self.__tablename__]
+        self.record_change(index, source)
         data = dict(index=index, source=source, sponsor=sponsor, status=status)
         table.update(data, ["index", "source"])
 
     def add(self, data):
         """Add a new data set"""
+        if self.writer is not None:
+            self.writer.add(self, data)
+            return
         table = self.db[self.__tablename__]
         table.insert(data)
         self.db.commit()
@@ -141,6 +419,7 @@ class TrxDB:
         :param int ID: database id
         """
         table = self.db[self.__tablename__]
+        self.record_change(index, source)
         table.delete(index=index, source=source)
 
     def delete_all(self, source):
@@ -149,6 +428,7 @@ class TrxDB:
         :param int ID: database id
         """
         table = self.db[self.__tablename__]
+        self.record_change(None, source)
         table.delete(source=source)
 
     def wipe(self, sure=False):
@@ -200,20 +480,57 @@ class MemberDB:
             id_list.append(trx["account"])
         return id_list
 
+    def get_many(self, accounts=None, columns=None, chunk_size=500):
+        """Returns account -> row, in the order of the table
+
+        All members are streamed with one query, given accounts are read with
+        one query per chunk_size accounts.
+
+        :param list accounts: only these members, all members when None
+        :param list columns: only these columns and account, all columns when None
+        """
+        if not self.exists_table():
+            return {}
+        table = self.db[self.__tablename__]
+        if columns is None:
+            statement = table.table.select()
+        else:
+            names = ["account"] + [c for c in columns if c != "account" and table.has_column(c)]
+            statement = select(*[table.table.c[name] for name in names])
+        if accounts is None:
+            return {row["account"]: row for row in self.db.query(statement)}
+        accounts = list(accounts)
+        rows = {}
+        for i in range(0, len(accounts), chunk_size):
+            chunk = statement.where(table.table.c.account.in_(accounts[i : i + chunk_size]))
+            for row in self.db.query(chunk):
+                rows[row["account"]] = row
+        return rows
+
+    def load_all(self, columns=None, store=None):
+        """Returns account -> Member of all members, read with one query
+
+        :param list columns: only these columns and account, all columns when None
+        :param ShareAgeStore store: shared store of the Member objects, see Member
+        """
+        return {
+            account: Member(row, store=store)
+            for account, row in self.get_many(columns=columns).items()
+        }
+
     def add(self, data):
         """Add a new data set"""
         table = self.db[self.__tablename__]
         table.upsert(data, ["account"])
         self.db.commit()
+        members_changed(self.db, added=[data["account"]])
 
     def add_batch(self, data):
-        """Add a new data set"""
-        table = self.db[self.__tablename__]
+        """Add or update members, only the changed columns are written"""
         self.db.begin()
-        for d in data:
-            table.upsert(d, ["account"])
-
+        bulk_upsert(self.db, self.__tablename__, data, ["account"])
         self.db.commit()
+        members_changed(self.db, added=[d["account"] for d in data])
 
     def get(self, account):
         """Change share_age depending on timestamp"""
@@ -252,6 +569,7 @@ class MemberDB:
         """Change share_age depending on timestamp"""
         table = self.db[self.__tablename__]
         table.upsert(data, ["account"])
+        members_changed(self.db, added=[data["account"]])
 
     def delete(self, account):
         """Delete a data set
@@ -260,6 +578,7 @@ class MemberDB:
         """
         table = self.db[self.__tablename__]
         table.delete(account=account)
+        members_changed(self.db, removed=[account])
 
     def wipe(self, sure=False):
         """Purge the entire database. No data set will survive this!"""
@@ -584,9 +903,15 @@ class TransactionMemoDB:
     """This is the trx storage class"""
 
     __tablename__ = "transaction_memo"
+    # Indexes for the cleanup of excluded senders and recipients, see hsbi.migrate
+    __indexes__ = {
+        "ix_transaction_memo_sender": ["sender"],
+        "ix_transaction_memo_to": ["to"],
+    }
 
     def __init__(self, db):
         self.db = db
+        self.writer = None
 
     def exists_table(self):
         """Check if the database table exists"""
@@ -653,6 +978,9 @@ class TransactionMemoDB:
 
     def add(self, data):
         """Add a new data set"""
+        if self.writer is not None:
+            self.writer.add(self, data)
+            return
         table = self.db[self.__tablename__]
         table.insert(data)
         self.db.commit()
@@ -681,6 +1009,29 @@ class TransactionMemoDB:
         table = self.db[self.__tablename__]
         table.delete(to=to)
 
+    def delete_excluded(self, exclusions):
+        """Delete the rows of excluded senders and recipients with one statement
+
+        :param dict exclusions: see MemoExclusionDB.get
+        """
+        if not self.exists_table():
+            return
+        senders = sorted(exclusions.get("sender", []))
+        recipients = sorted(exclusions.get("to", []))
+        table = self.db[self.__tablename__]
+        clauses = []
+        if len(senders) > 0 and table.has_column("sender"):
+            clauses.append(table.table.c.sender.in_(senders))
+        if len(recipients) > 0 and table.has_column("to"):
+            clauses.append(table.table.c.to.in_(recipients))
+        if len(clauses) == 0:
+            return
+        table.delete(or_(*clauses))
+
+    def create_indexes(self):
+        """Create the missing secondary indexes, returns the created index names"""
+        return create_indexes(self.db, self.__tablename__, self.__indexes__)
+
     def wipe(self, sure=False):
         """Purge the entire database. No data set will survive this!"""
         if not sure:
@@ -695,6 +1046,57 @@ class TransactionMemoDB:
             table.drop
 
 
+class MemoExclusionDB:
+    """Senders and recipients whose transfers are not kept in transaction_memo"""
+
+    __tablename__ = "memo_exclusions"
+    # Rows of a new table, the accounts excluded before the table existed
+    defaults = [
+        {"account": "dtube.rewards", "field": "sender"},
+        {"account": "reward.app", "field": "sender"},
+    ] + [{"account": "sbi%d" % i, "field": "to"} for i in range(2, 11)]
+
+    def __init__(self, db):
+        self.db = db
+
+    def exists_table(self):
+        """Check if the database table exists"""
+        if len(self.db.tables) == 0:
+            return False
+        if self.__tablename__ in self.db.tables:
+            return True
+        else:
+            return False
+
+    def create_table(self):
+        """Create the table with the default exclusions if it doesn't exist"""
+        if not self.exists_table():
+            types = self.db.types
+            table = self.db.create_table(self.__tablename__, primary_id=False)
+            table.create_column("account", types.string(16))
+            table.create_column("field", types.string(6))
+            table.insert_many(self.defaults)
+
+    def get(self):
+        """Returns "sender" and "to" -> set of the excluded accounts"""
+        exclusions = {"sender": set(), "to": set()}
+        if not self.exists_table():
+            return exclusions
+        for row in self.db[self.__tablename__].all():
+            exclusions[row["field"]].add(row["account"])
+        return exclusions
+
+    def add(self, account, field):
+        """Exclude the transfers of a sender or to a recipient"""
+        table = self.db[self.__tablename__]
+        table.upsert({"account": account, "field": field}, ["account", "field"])
+
+    def delete(self, account, field):
+        """Keep the transfers of a sender or to a recipient again"""
+        table = self.db[self.__tablename__]
+        table.delete(account=account, field=field)
+
+
 class TransactionOutDB:
     """This is the trx storage class"""
 
@@ -702,6 +1104,7 @@ class TransactionOutDB:
 
     def __init__(self, db):
         self.db = db
+        self.writer = None
 
     def exists_table(self):
         """Check if the database table exists"""
@@ -753,6 +1156,9 @@ class TransactionOutDB:
 
     def add(self, data):
         """Add a new data set"""
+        if self.writer is not None:
+            self.writer.add(self, data)
+            return
         table = self.db[self.__tablename__]
         table.insert(data)
         self.db.commit()
@@ -779,6 +1185,338 @@ class TransactionOutDB:
             table.drop
 
 
+class IngestCursorDB:
+    """Stores where each module stopped reading the history of an account
+
+    The cursor of a module is written without commit, inside the transaction
+    of the rows it points to, so data and resume position are always committed
+    together. The table lives in the same database as the data it tracks.
+    """
+
+    __tablename__ = "ingest_cursor"
+
+    def __init__(self, db):
+        self.db = db
+
+    def exists_table(self):
+        """Check if the database table exists"""
+        if len(self.db.tables) == 0:
+            return False
+        if self.__tablename__ in self.db.tables:
+            return True
+        else:
+            return False
+
+    def create_table(self):
+        """Create the cursor table with all columns if it doesn't exist
+
+        Done up front, so that the first ``set`` inside a data transaction
+        does not need to alter the table. Like in sql/sbi.sql a module has
+        one cursor per account, (module, account) is a unique key.
+        """
+        if not self.exists_table():
+            types = self.db.types
+            table = self.db.create_table(self.__tablename__, primary_id=False)
+            table.create_column("module", types.string(50))
+            table.create_column("account", types.string(50))
+            table.create_column("block", types.bigint)
+            table.create_column("op_acc_index", types.bigint)
+            table.create_column("trx_in_block", types.integer)
+            table.create_column("op_in_trx", types.integer)
+            table.create_column("virtual_op", types.integer)
+            table.create_column("updated_at", types.datetime)
+            Index(
+                "ux_ingest_cursor_module_account",
+                table.table.c.module,
+                table.table.c.account,
+                unique=True,
+            ).create(bind=self.db.executable)
+
+    def get(self, module, account):
+        """Returns the cursor of a module for an account, None when not set"""
+        if not self.exists_table():
+            return None
+        table = self.db[self.__tablename__]
+        return table.find_one(module=module, account=account)
+
+    def set(self, module, account, position):
+        """Move the cursor of a module for an account
+
+        :param str module: module name, e.g. store_ops_db
+        :param str account: account name
+        :param dict position: block, op_acc_index, trx_in_block, op_in_trx and virtual_op
+        """
+        data = {
+            "module": module,
+            "account": account,
+            "block": position.get("block"),
+            "op_acc_index": position.get("op_acc_index"),
+            "trx_in_block": position.get("trx_in_block"),
+            "op_in_trx": position.get("op_in_trx"),
+            "virtual_op": position.get("virtual_op"),
+            "updated_at": datetime.now(timezone.utc).replace(tzinfo=None),
+        }
+        table = self.db[self.__tablename__]
+        table.upsert(data, ["module", "account"])
+
+    def delete(self, module, account):
+        """Delete a cursor, the module falls back to scanning its data table"""
+        table = self.db[self.__tablename__]
+        table.delete(module=module, account=account)
+
+    def delete_all(self, module):
+        """Delete all cursors of a module"""
+        if not self.exists_table():
+            return
+        table = self.db[self.__tablename__]
+        table.delete(module=module)
+
+
+class MemberShareLedgerDB:
+    """Share entries of the members, derived from the trx table
+
+    One row per share change of a member, see hsbi.member_ledger. The rows are
+    written without commit, in the transaction which moves the ledger cursor.
+    """
+
+    __tablename__ = "member_share_ledger"
+    __indexes__ = {"ix_member_share_ledger_account": ["account"]}
+
+    def __init__(self, db):
+        self.db = db
+
+    def exists_table(self):
+        """Check if the database table exists"""
+        if len(self.db.tables) == 0:
+            return False
+        if self.__tablename__ in self.db.tables:
+            return True
+        else:
+            return False
+
+    def create_table(self):
+        """Create the ledger table with all columns if it doesn't exist"""
+        if not self.exists_table():
+            types = self.db.types
+            table = self.db.create_table(self.__tablename__)
+            table.create_column("index", types.bigint)
+            table.create_column("source", types.string(50))
+            table.create_column("seq", types.integer)
+            table.create_column("account", types.string(50))
+            table.create_column("sponsor", types.string(50))
+            table.create_column("shares", types.integer)
+            table.create_column("timestamp", types.datetime)
+            table.create_column("share_type", types.string(50))
+            table.create_index(["index", "source", "seq"])
+        create_indexes(self.db, self.__tablename__, self.__indexes__)
+        # From now on TrxDB records the trx rows it changes in place
+        TrxChangeDB(self.db).create_table()
+
+    def get_all(self):
+        """Returns all entries in the order of the trx they were derived from"""
+        table = self.db[self.__tablename__]
+        return table.find(order_by=["index", "source", "seq"], _streamed=True)
+
+    def get_since(self, source, start_index=None):
+        """Returns the entries of the trx of a source with an index above start_index"""
+        table = self.db[self.__tablename__]
+        filters = {"source": source}
+        if start_index is not None:
+            filters["index"] = {">": start_index}
+        return table.find(order_by=["index", "seq"], **filters)
+
+    def get_account(self, account):
+        """Returns the entries of a member in trx order"""
+        table = self.db[self.__tablename__]
+        return table.find(account=account, order_by=["index", "source", "seq"])
+
+    def get_first(self, share_type):
+        """Returns the first entry of a share type, or of a list of share types"""
+        table = self.db[self.__tablename__]
+        return table.find_one(share_type=share_type, order_by=["index", "source", "seq"])
+
+    def get_trx(self, source, index=None):
+        """Returns the entries derived from one trx, or from all trx of a source"""
+        table = self.db[self.__tablename__]
+        if index is None:
+            return table.find(source=source)
+        return table.find(source=source, index=index)
+
+    def delete_trx(self, source, index=None):
+        """Delete the entries derived from one trx, or from all trx of a source"""
+        table = self.db[self.__tablename__]
+        if index is None:
+            table.delete(source=source)
+        else:
+            table.delete(source=source, index=index)
+
+    def add_batch(self, data, chunk_size=1000):
+        """Add share entries"""
+        table = self.db[self.__tablename__]
+        table.insert_many(data, chunk_size=chunk_size)
+
+    def delete_all(self):
+        """Delete all entries"""
+        table = self.db[self.__tablename__]
+        table.delete()
+
+
+class TrxChangeDB:
+    """Trx rows which were changed in place after they were added
+
+    The member ledger reads only the trx added since its last sync, TrxDB
+    records the rows it updates or deletes here so that the ledger derives
+    their entries again. Nothing is recorded until the ledger created the table.
+    A row without index stands for all trx of its source.
+    """
+
+    __tablename__ = "trx_change"
+
+    def __init__(self, db):
+        self.db = db
+
+    def exists_table(self):
+        """Check if the database table exists"""
+        if len(self.db.tables) == 0:
+            return False
+        if self.__tablename__ in self.db.tables:
+            return True
+        else:
+            return False
+
+    def create_table(self):
+        """Create the change table with all columns if it doesn't exist"""
+        if not self.exists_table():
+            types = self.db.types
+            table = self.db.create_table(self.__tablename__)
+            table.create_column("index", types.bigint)
+            table.create_column("source", types.string(50))
+            table.create_column("changed_at", types.datetime)
+
+    def add(self, index, source):
+        """Record a changed trx, index None for all trx of the source"""
+        table = self.db[self.__tablename__]
+        data = {
+            "index": index,
+            "source": source,
+            "changed_at": datetime.now(timezone.utc).replace(tzinfo=None),
+        }
+        table.insert(data)
+
+    def get_all(self):
+        """Returns the recorded changes in the order they were made"""
+        table = self.db[self.__tablename__]
+        return list(table.find(order_by="id"))
+
+    def delete_until(self, change_id):
+        """Delete the changes up to and including the id change_id"""
+        table = self.db[self.__tablename__]
+        table.delete(id={"<=": change_id})
+
+
+class MemberShareStateDB:
+    """Shares and share entries of each member, summed from the member ledger
+
+    The state is moved forward with the ledger entries added since the last
+    cycle, see hsbi.member_ledger. The rows are written without commit, in the
+    transaction which moves the state cursor.
+    """
+
+    __tablename__ = "member_share_state"
+
+    def __init__(self, db):
+        self.db = db
+
+    def exists_table(self):
+        """Check if the database table exists"""
+        if len(self.db.tables) == 0:
+            return False
+        if self.__tablename__ in self.db.tables:
+            return True
+        else:
+            return False
+
+    def create_table(self):
+        """Create the state table with all columns if it doesn't exist"""
+        if not self.exists_table():
+            types = self.db.types
+            table = self.db.create_table(
+                self.__tablename__, primary_id="account", primary_type=types.string(50)
+            )
+            table.create_column("shares", types.integer)
+            table.create_column("original_enrollment", types.datetime)
+            table.create_column("latest_enrollment", types.datetime)
+            table.create_column("last_index", types.bigint)
+            table.create_column("last_source", types.string(50))
+            table.create_column("last_seq", types.integer)
+            table.create_column("share_entries", types.text)
+
+    def get_all(self):
+        """Returns the state of all members"""
+        table = self.db[self.__tablename__]
+        return table.find(_streamed=True)
+
+    def add_batch(self, data):
+        """Add or update member states, only the changed columns are written"""
+        bulk_upsert(self.db, self.__tablename__, data, ["account"])
+
+    def delete_all(self):
+        """Delete the state of all members"""
+        table = self.db[self.__tablename__]
+        table.delete()
+
+
+class AccountExistsDB:
+    """Cache of account lookups, whether an account name exists on chain"""
+
+    __tablename__ = "account_exists"
+
+    def __init__(self, db):
+        self.db = db
+
+    def exists_table(self):
+        """Check if the database table exists"""
+        if len(self.db.tables) == 0:
+            return False
+        if self.__tablename__ in self.db.tables:
+            return True
+        else:
+            return False
+
+    def create_table(self):
+        """Create the cache table with all columns if it doesn't exist"""
+        if not self.exists_table():
+            types = self.db.types
+            table = self.db.create_table(
+                self.__tablename__, primary_id="name", primary_type=types.string(50)
+            )
+            table.create_column("found", types.boolean)
+            table.create_column("checked_at", types.datetime)
+
+    def get_many(self, names):
+        """Returns name -> row of the cached names"""
+        if not self.exists_table() or len(names) == 0:
+            return {}
+        table = self.db[self.__tablename__]
+        return {row["name"]: row for row in table.find(name=list(names))}
+
+    def set_many(self, found):
+        """Store lookup results
+
+        :param dict found: name -> True when the account exists
+        """
+        checked_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        rows = [{"name": name, "found": found[name], "checked_at": checked_at} for name in found]
+        self.db.begin()
+        bulk_upsert(self.db, self.__tablename__, rows, ["name"])
+        self.db.commit()
+
+    def delete_before(self, checked_at):
+        """Delete the entries checked before checked_at"""
+        table = self.db[self.__tablename__]
+        table.delete(checked_at={"<": checked_at})
+
+
 class PendingRefundDB:
     """This is the trx storage class"""
 
@@ -1,8 +1,14 @@
+import base64
+import json
 import logging
+import zlib
 from datetime import datetime, timezone
 
+from nectar.utils import formatTimeString
 from sqlalchemy import and_
 
+from hive_sbi.hsbi.storage import bulk_upsert, create_indexes
+
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 log.addHandler(logging.StreamHandler())
@@ -10,12 +16,111 @@ log.addHandler(logging.StreamHandler())
 timeformat = "%Y%m%d-%H%M%S"
 
 
+# op_dict fields which repeat a column of the ops row
+OP_COLUMNS = {
+    "block": "block",
+    "trx_in_block": "trx_in_block",
+    "op_in_trx": "op_in_trx",
+    "virtual_op": "virtual_op",
+    "timestamp": "timestamp",
+    "type": "type",
+    "account": "op_acc_name",
+}
+# Marks a compact op_dict, the version belongs to COMPACT_ZDICT
+COMPACT_PREFIX = "z1:"
+# Preset zlib dictionary with the frequent keys and values of history ops, the
+# most frequent ones last. Changing it needs a new COMPACT_PREFIX.
+COMPACT_ZDICT = (
+    '"weight":"author":"permlink":"voter":"type":"vote""delegator":"delegatee":'
+    '"vesting_shares":"type":"delegate_vesting_shares""precision":6,"nai":"@@000000037"}'
+    '"precision":3,"nai":"@@000000013"}"operation_id":0,"memo":"","memo":"'
+    '"amount":{"amount":"precision":3,"nai":"@@000000021"}"from":"to":'
+    '"type":"transfer""trx_id":"0000000000000000000000000000000000000000""index":"_id":"'
+).encode()
+
+
+def _column_value(row, field):
+    value = row[OP_COLUMNS[field]]
+    # A row read from the database holds a datetime, a new row the string of the op
+    if field == "timestamp" and isinstance(value, datetime):
+        return formatTimeString(value)
+    return value
+
+
+def encode_op_dict(row):
+    """Returns the compact form of the op_dict of an ops row
+
+    Fields which are equal to a column of the row are dropped, the rest is
+    zlib compressed with COMPACT_ZDICT and stored as base64 text, so that the
+    existing TEXT column can hold it.
+
+    :param dict row: ops row with a JSON op_dict
+    """
+    if row["op_dict"].startswith(COMPACT_PREFIX):
+        return row["op_dict"]
+    op = json.loads(row["op_dict"])
+    mask = 0
+    for bit, field in enumerate(OP_COLUMNS):
+        if field in op and op[field] == _column_value(row, field):
+            del op[field]
+            mask |= 1 << bit
+    payload = json.dumps([mask, op], separators=(",", ":")).encode()
+    compressor = zlib.compressobj(9, zdict=COMPACT_ZDICT)
+    data = compressor.compress(payload) + compressor.flush()
+    return COMPACT_PREFIX + base64.b64encode(data).decode("ascii")
+
+
+def decode_op_dict(row):
+    """Returns the op of an ops row, for JSON and compact op_dict values"""
+    value = row["op_dict"]
+    if not value.startswith(COMPACT_PREFIX):
+        return json.loads(value)
+    decompressor = zlib.decompressobj(zdict=COMPACT_ZDICT)
+    data = base64.b64decode(value[len(COMPACT_PREFIX) :])
+    mask, op = json.loads(decompressor.decompress(data) + decompressor.flush())
+    for bit, field in enumerate(OP_COLUMNS):
+        if mask & (1 << bit):
+            op[field] = _column_value(row, field)
+    return op
+
+
+class OpRecord(dict):
+    """A row of an <account>_ops table
+
+    The ``op_dict`` column stays a JSON or compact string until ``op`` is
+    accessed for the first time, rows which are skipped by a consumer are never
+    decoded.
+    """
+
+    __slots__ = ("_op",)
+
+    @property
+    def op(self):
+        """The decoded op_dict"""
+        try:
+            return self._op
+        except AttributeError:
+            self._op = decode_op_dict(self)
+            return self._op
+
+    def expanded(self):
+        """Returns the row with op_dict as a JSON string"""
+        if self["op_dict"].startswith(COMPACT_PREFIX):
+            self["op_dict"] = json.dumps(self.op)
+        return self
+
+
 class AccountTrx:
     """This is the trx storage class"""
 
-    def __init__(self, db, account):
+    def __init__(self, db, account, compact=False):
         self.db = db
         self.__tablename__ = "%s_ops" % account
+        # Write op_dict in the compact encoding, reading handles both
+        self.compact = compact
+        self.__indexes__ = {
+            "ix_%s_op_acc_index_type" % self.__tablename__: ["op_acc_index", "type"],
+        }
 
     def exists_table(self):
         """Check if the database table exists"""
@@ -27,37 +132,88 @@ class AccountTrx:
         else:
             return False
 
+    def create_indexes(self):
+        """Create the missing secondary indexes, returns the created index names"""
+        return create_indexes(self.db, self.__tablename__, self.__indexes__)
+
     def add(self, data):
         """Add a new data set"""
         table = self.db[self.__tablename__]
         table.insert(data)
         self.db.commit()
 
-    def get_all(self, op_types=[]):
-        ops = []
+    def _filters(self, op_types, start_index):
+        filters = {}
+        if len(op_types) > 0:
+            filters["type"] = list(op_types)
+        if start_index is not None:
+            filters["op_acc_index"] = {">=": start_index}
+        return filters
+
+    def get_all(self, op_types=[], start_index=None):
+        """Returns the ops ordered by op_acc_index
+
+        :param list op_types: only ops of these types, all ops when empty
+        :param int start_index: only ops with an op_acc_index of at least start_index
+        """
         table = self.db[self.__tablename__]
-        for op in table.find(order_by="op_acc_index"):
-            if op["type"] in op_types or len(op_types) == 0:
-                ops.append(op)
-        return ops
+        filters = self._filters(op_types, start_index)
+        return [
+            OpRecord(row).expanded()
+            for row in table.find(order_by="op_acc_index", _streamed=True, **filters)
+        ]
+
+    def iter_all(self, op_types=[], start_index=None, chunk_size=1000):
+        """Yields the ops ordered by op_acc_index
+
+        The rows are read in chunks of chunk_size, continuing after the last
+        op_acc_index of the previous chunk, so that only one chunk is held in
+        memory at a time.
+
+        :param list op_types: only ops of these types, all ops when empty
+        :param int start_index: only ops with an op_acc_index of at least start_index
+        :param int chunk_size: number of rows fetched per query
+        """
+        table = self.db[self.__tablename__]
+        filters = self._filters(op_types, start_index)
+        while True:
+            n = 0
+            for row in table.find(order_by="op_acc_index", _limit=chunk_size, **filters):
+                n += 1
+                last_index = row["op_acc_index"]
+                yield OpRecord(row)
+            if n < chunk_size:
+                return
+            filters["op_acc_index"] = {">": last_index}
 
     def get_newest(self, timestamp, op_types=[], limit=100):
-        ops = []
         table = self.db[self.__tablename__]
-        for op in table.find(table.table.columns.timestamp > timestamp, order_by="-op_acc_index"):
-            if op["type"] in op_types or len(op_types) == 0:
-                ops.append(op)
-            if len(ops) >= limit:
-                return ops
-        return ops
+        filters = self._filters(op_types, None)
+        return [
+            OpRecord(row).expanded()
+            for row in table.find(
+                table.table.columns.timestamp > timestamp,
+                order_by="-op_acc_index",
+                _limit=limit,
+                **filters,
+            )
+        ]
 
-    def add_batch(self, data):
-        """Add a new data set"""
+    def add_batch(self, data, cursor=None):
+        """Add a new data set
+
+        :param list data: rows to insert
+        :param callable cursor: called with the last row inside the same
+            transaction, e.g. ``partial(IngestCursorDB(db).set, module, account)``
+        """
         table = self.db[self.__tablename__]
         self.db.begin()
         for d in data:
+            if self.compact:
+                d = dict(d, op_dict=encode_op_dict(d))
             table.insert(d)
-
+        if cursor is not None and len(data) > 0:
+            cursor(data[-1])
         self.db.commit()
 
     def get_latest_index(self):
@@ -123,13 +279,19 @@ class TransferTrx:
         table.insert(data)
         self.db.commit()
 
-    def add_batch(self, data):
-        """Add a new data set"""
+    def add_batch(self, data, cursor=None):
+        """Add a new data set
+
+        :param list data: rows to insert
+        :param callable cursor: called with the last row inside the same
+            transaction, e.g. ``partial(IngestCursorDB(db).set, module, account)``
+        """
         table = self.db[self.__tablename__]
         self.db.begin()
         for d in data:
             table.insert(d)
-
+        if cursor is not None and len(data) > 0:
+            cursor(data[-1])
         self.db.commit()
 
     def get_latest_index(self, account_name):
@@ -286,18 +448,11 @@ class PostsTrx:
         self.db.commit()
 
     def add_batch(self, data):
-        """Add a new data set"""
-        table = self.db[self.__tablename__]
-
-        if isinstance(data, list):
-            # table.insert_many(data, chunk_size=chunk_size)
-            for d in data:
-                table.upsert(d, ["author", "created"])
-        else:
-            self.db.begin()
-            for d in data:
-                table.upsert(data[d], ["author", "created"])
-
+        """Add or update a list or a dict of rows, only the changed columns are written"""
+        if not isinstance(data, list):
+            data = list(data.values())
+        self.db.begin()
+        bulk_upsert(self.db, self.__tablename__, data, ["author", "created"])
         self.db.commit()
 
     def update_batch(self, data):
@@ -449,18 +604,11 @@ class CurationOptimizationTrx:
         self.db.commit()
 
     def add_batch(self, data):
-        """Add a new data set"""
-        table = self.db[self.__tablename__]
-
-        if isinstance(data, list):
-            # table.insert_many(data, chunk_size=chunk_size)
-            for d in data:
-                table.upsert(d, ["member", "created"])
-        else:
-            self.db.begin()
-            for d in data:
-                table.upsert(data[d], ["member", "created"])
-
+        """Add or update a list or a dict of rows, only the changed columns are written"""
+        if not isinstance(data, list):
+            data = list(data.values())
+        self.db.begin()
+        bulk_upsert(self.db, self.__tablename__, data, ["member", "created"])
         self.db.commit()
 
     def update_batch(self, data):
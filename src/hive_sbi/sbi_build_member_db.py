@@ -1,39 +1,27 @@
 import json
 import time
 
-from nectar import Hive
-from nectar.nodelist import NodeList
 from nectar.utils import formatTimeString
 
-from hive_sbi.hsbi.core import (
-    load_config,
-    setup_database_connections,
-    setup_storage_objects,
-)
-from hive_sbi.hsbi.member import Member
+from hive_sbi.hsbi.context import HsbiContext
+from hive_sbi.hsbi.member import Member, ShareAgeStore, calc_share_ages
+from hive_sbi.hsbi.member_index import MemberIndex
 from hive_sbi.hsbi.utils import measure_execution_time
 
 
-def run():
+def run(ctx=None):
     """Run the build member database module"""
     start_time = time.time()
 
-    # Load configuration
-    config_data = load_config()
-
-    # Setup database connections
-    db, db2 = setup_database_connections(config_data)
-
-    # Setup storage objects
-    storage = setup_storage_objects(db, db2)
+    # Storage objects are shared by the modules
+    if ctx is None:
+        ctx = HsbiContext()
+    storage = ctx.storage
 
     # Get storage objects
     trxStorage = storage["trxStorage"]
     memberStorage = storage["memberStorage"]
 
-    # Get configuration values
-    hive_blockchain = config_data.get("hive_blockchain", True)
-
     # Create tables if they don't exist
     if not trxStorage.exists_table():
         trxStorage.create_table()
@@ -45,22 +33,17 @@ def run():
     print("Building member database...")
 
     # Clear existing member data
-    accs = memberStorage.get_all_accounts()
+    accs = MemberIndex.shared(memberStorage)
     for a in accs:
         memberStorage.delete(a)
 
-    # Setup Hive connection
-    nodes = NodeList()
-    try:
-        nodes.update_nodes()
-    except Exception as e:
-        print(f"Could not update nodes: {str(e)}")
     # Initialize Hive connection for potential future use
     # Not directly used in this file but kept for consistency with other modules
-    _ = Hive(node=nodes.get_nodes(hive=hive_blockchain))
+    _ = ctx.hive()
     # Get all transaction data
     data = trxStorage.get_all_data()
     member_data = {}
+    store = ShareAgeStore()
     for op in data:
         if op["status"] == "Valid":
             share_type = op["share_type"]
@@ -82,7 +65,7 @@ def run():
             if shares == 0:
                 continue
             if sponsor not in member_data:
-                member = Member(sponsor, shares, timestamp)
+                member = Member(sponsor, shares, timestamp, store=store)
                 member.append_share_age(timestamp, shares)
                 member_data[sponsor] = member
             else:
@@ -94,7 +77,7 @@ def run():
             for s in sponsee:
                 shares = sponsee[s]
                 if s not in member_data:
-                    member = Member(s, shares, timestamp)
+                    member = Member(s, shares, timestamp, store=store)
                     member.append_share_age(timestamp, shares)
                     member_data[s] = member
                 else:
@@ -114,8 +97,8 @@ def run():
     # Calculate share statistics
     shares = 0
     bonus_shares = 0
+    calc_share_ages(member_data)
     for m in member_data:
-        member_data[m].calc_share_age()
         shares += member_data[m]["shares"]
         bonus_shares += member_data[m]["bonus_shares"]
 
@@ -1,8 +1,6 @@
 from datetime import timezone
 
-from nectar import Hive
 from nectar.instance import set_shared_blockchain_instance
-from nectar.nodelist import NodeList
 
 from hive_sbi.hsbi.core import get_logger
 from hive_sbi.hsbi.transfer_ops_storage import TransferTrx
@@ -14,22 +12,19 @@ def calculate_shares(delegation_shares, sp_share_ratio):
     return int(delegation_shares / sp_share_ratio)
 
 
-def run():
+def run(ctx=None):
     import time
 
-    from hive_sbi.hsbi.core import load_config, setup_database_connections, setup_storage_objects
+    from hive_sbi.hsbi.context import HsbiContext
     from hive_sbi.hsbi.utils import measure_execution_time
 
     start_time = time.time()
 
-    # Load configuration
-    config_data = load_config()
-
-    # Setup database connections
-    db, db2 = setup_database_connections(config_data)
-
-    # Setup storage objects
-    storage = setup_storage_objects(db, db2)
+    # Database connections and storage objects are shared by the modules
+    if ctx is None:
+        ctx = HsbiContext()
+    db = ctx.db
+    storage = ctx.storage
 
     # Get account storage
     accounts = storage["accounts"]
@@ -39,9 +34,6 @@ def run():
     confStorage = storage["confStorage"]  # Get the storage object for later updates
     conf_setup = storage["conf_setup"]  # Get the pre-fetched configuration data
 
-    # Get blockchain setting
-    hive_blockchain = config_data.get("hive_blockchain", True)
-
     last_cycle = conf_setup["last_cycle"]
     # Ensure last_cycle has timezone info
     if last_cycle is not None:
@@ -133,12 +125,7 @@ def run():
         last_cycle is not None
         and (datetime.now(timezone.utc) - last_cycle).total_seconds() > 60 * share_cycle_min
     ):
-        nodes = NodeList()
-        try:
-            nodes.update_nodes()
-        except Exception as e:
-            logger.info(f"could not update nodes: {str(e)}")
-        hv = Hive(node=nodes.get_nodes(hive=hive_blockchain))
+        hv = ctx.hive()
         set_shared_blockchain_instance(hv)
 
         # Get storage objects
@@ -1,31 +1,22 @@
 import time
 
-from nectar import Hive
-from nectar.nodelist import NodeList
-
-from hive_sbi.hsbi.core import (
-    get_logger,
-    load_config,
-    setup_database_connections,
-    setup_storage_objects,
-)
+from hive_sbi.hsbi.context import HsbiContext
+from hive_sbi.hsbi.core import get_logger
+from hive_sbi.hsbi.member_index import MemberIndex
 from hive_sbi.hsbi.utils import measure_execution_time
 
 logger = get_logger()
 
 
-def run():
+def run(ctx=None):
     """Run the check member database module"""
     start_time = time.time()
 
-    # Load configuration
-    config_data = load_config()
-
-    # Setup database connections
-    db, db2 = setup_database_connections(config_data)
-
-    # Setup storage objects
-    storage = setup_storage_objects(db, db2)
+    # Configuration and storage objects are shared by the modules
+    if ctx is None:
+        ctx = HsbiContext()
+    config_data = ctx.config
+    storage = ctx.storage
 
     # Get storage objects
     trxStorage = storage["trxStorage"]
@@ -38,26 +29,18 @@ def run():
     other_accounts = accStorage.get_transfer()
     sp_share_ratio = confStorage.get()["sp_share_ratio"]
     mgnt_shares = config_data.get("mgnt_shares", {})
-    hive_blockchain = config_data.get("hive_blockchain", True)
 
     # Setup Hive connection
-    nodes = NodeList()
-    try:
-        nodes.update_nodes()
-    except Exception as e:
-        logger.warning(f"could not update nodes: {str(e)}")
-    hv = Hive(node=nodes.get_nodes(hive=hive_blockchain))
+    hv = ctx.hive()
 
     # Check member database
     logger.info("Checking member database...")
-    member_accounts = memberStorage.get_all_accounts()
+    member_accounts = MemberIndex.shared(memberStorage)
     data = trxStorage.get_all_data()
 
     missing_accounts = []
-    member_data = {}
     aborted = False
-    for m in member_accounts:
-        member_data[m] = memberStorage.get(m)
+    member_data = memberStorage.get_many(columns=["shares", "bonus_shares", "balance_rshares"])
     for d in data:
         if d["share_type"] == "Mgmt" and d["sponsor"] in member_accounts:
             continue
@@ -1,38 +1,29 @@
 import time
 from datetime import datetime, timedelta, timezone
 
-from nectar import Hive
 from nectar.blockchain import Blockchain
 from nectar.comment import Comment
 from nectar.instance import set_shared_blockchain_instance
-from nectar.nodelist import NodeList
 from nectar.utils import addTzInfo, construct_authorperm, formatTimeString
 from nectar.vote import Vote
 
-from hive_sbi.hsbi.core import (
-    get_logger,
-    load_config,
-    setup_database_connections,
-    setup_storage_objects,
-)
-from hive_sbi.hsbi.member import Member
+from hive_sbi.hsbi.context import HsbiContext
+from hive_sbi.hsbi.core import get_logger
+from hive_sbi.hsbi.member_index import MemberIndex
 from hive_sbi.hsbi.transfer_ops_storage import CurationOptimizationTrx, MemberHistDB
 from hive_sbi.hsbi.utils import measure_execution_time
 
 logger = get_logger()
 
 
-def run():
+def run(ctx=None):
     start_prep_time = time.time()
 
-    # Load configuration
-    config_data = load_config()
-
-    # Setup database connections
-    db, db2 = setup_database_connections(config_data)
-
-    # Setup storage objects
-    storage = setup_storage_objects(db, db2)
+    # Database connections and storage objects are shared by the modules
+    if ctx is None:
+        ctx = HsbiContext()
+    db, db2 = ctx.db, ctx.db2
+    storage = ctx.storage
 
     # Get accounts and other_accounts lists directly from storage
     accounts = storage["accounts"]
@@ -43,9 +34,6 @@ def run():
     memberStorage = storage["memberStorage"]
     confStorage = storage["confStorage"]
 
-    # Get blockchain setting
-    hive_blockchain = config_data.get("hive_blockchain", True)
-
     # Get configuration settings
     conf_setup = confStorage.get()
 
@@ -59,14 +47,13 @@ def run():
     upvote_multiplier_adjusted = conf_setup["upvote_multiplier_adjusted"]
 
     # print("Count rshares of upvoted members.")
-    member_accounts = memberStorage.get_all_accounts()
+    member_accounts = MemberIndex.shared(memberStorage)
     logger.info("%d members in list" % len(member_accounts))
 
-    member_data = {}
+    member_data = memberStorage.load_all()
     latest_enrollment = None
     share_age_member = {}
-    for m in member_accounts:
-        member_data[m] = Member(memberStorage.get(m))
+    for m in member_data:
         if latest_enrollment is None:
             latest_enrollment = member_data[m]["latest_enrollment"]
         elif latest_enrollment < member_data[m]["latest_enrollment"]:
@@ -78,16 +65,7 @@ def run():
 
     curationOptimTrx = CurationOptimizationTrx(db)
     curationOptimTrx.delete_old_posts(days=7)
-    # Update current node list from @fullnodeupdate
-    nodes = NodeList()
-    # nodes.update_nodes(weights={"hist": 1})
-    try:
-        nodes.update_nodes()
-    except Exception as e:
-        logger.warning(f"could not update nodes: {str(e)}")
-
-    node_list = nodes.get_nodes(hive=hive_blockchain)
-    hv = Hive(node=node_list, num_retries=3, timeout=10)
+    hv = ctx.hive(num_retries=3, timeout=10)
     # print(str(hv))
     set_shared_blockchain_instance(hv)
 
@@ -106,9 +84,9 @@ def run():
     if start_block is None:
         start_block = b.get_estimated_block_num(addTzInfo(start_time))
         # block_id_list = []
-        trx_id_list = []
+        trx_id_list = set()
     else:
-        trx_id_list = accountTrx.get_block_trx_id(start_block)
+        trx_id_list = set(accountTrx.get_block_trx_id(start_block))
     end_block = current_block["id"]
     # end_block = current_block["id"] - (20 * 10)
     if end_block > start_block + 6000:
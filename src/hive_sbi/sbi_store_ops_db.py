@@ -1,23 +1,30 @@
+import itertools
 import json
+import queue
+import threading
 import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from functools import partial
 
 from nectar import Hive
 from nectar.account import Account
 from nectar.amount import Amount
-from nectar.nodelist import NodeList
 from nectar.utils import formatTimeString
 
 from hive_sbi.hsbi.core import get_logger
+from hive_sbi.hsbi.node_pool import NodeSemaphores
+from hive_sbi.hsbi.storage import IngestCursorDB
 from hive_sbi.hsbi.transfer_ops_storage import AccountTrx, TransferTrx
 
 logger = get_logger()
 
 
-def get_account_trx_data(account, start_block, start_index) -> list:
+def get_account_trx_data(account, start_block, start_index) -> Iterator[dict]:
     """
     Retrieve all transfer operations for a given account from a starting block and index.
-    Returns a list of transaction dictionaries.
+    Yields the transaction dictionaries while the history is walked.
     """
     # Go through all transfer ops
     if start_block is not None:
@@ -42,7 +49,6 @@ def get_account_trx_data(account, start_block, start_index) -> list:
     else:
         start_index = 0
 
-    data = []
     last_block = 0
     last_trx = trx_in_block
     for op in account.history(start=start_block - 5, use_block_num=True):
@@ -87,20 +93,18 @@ def get_account_trx_data(account, start_block, start_index) -> list:
         start_index += 1
         last_block = op["block"]
         last_trx = trx_in_block
-        data.append(d)
-    return data
+        yield d
 
 
-def get_account_trx_storage_data(account, start_index, hv) -> list:
+def get_account_trx_storage_data(account, start_index, hv) -> Iterator[dict]:
     """
     Retrieve all 'transfer' operations for an account from a starting index.
-    Returns a list of transaction storage dictionaries.
+    Yields the transaction storage dictionaries while the history is walked.
     """
     if start_index is not None:
         start_index = start_index["op_acc_index"] + 1
         logger.info(f"account {account['name']} - {start_index}")
 
-    data = []
     for op in account.history(start=start_index, use_block_num=False, only_ops=["transfer"]):
         amount = Amount(op["amount"], blockchain_instance=hv)
         virtual_op = op["virtual_op"]
@@ -123,11 +127,69 @@ def get_account_trx_storage_data(account, start_index, hv) -> list:
             "memo": memo,
             "op_type": op["type"],
         }
-        data.append(d)
-    return data
+        yield d
 
 
-def _batch_insert(add_batch_func, data: list, batch_size: int = 1000) -> None:
+_worker = threading.local()
+_worker_counter = itertools.count()
+
+
+def _worker_hive(nodes) -> Hive:
+    """
+    Return the Hive instance of the calling worker thread.
+    Each worker starts on a different node of the list, so that the workers
+    spread over the available nodes.
+    """
+    if getattr(_worker, "hv", None) is None:
+        shift = next(_worker_counter) % len(nodes)
+        _worker.hv = Hive(node=nodes[shift:] + nodes[:shift])
+    return _worker.hv
+
+
+def fetch_history(n, job, nodes, node_semaphores, batches, stop, batch_size=1000) -> None:
+    """
+    Fetch the new history of one account in a worker thread.
+    Workers only talk to the RPC node, every batch_size ops are handed to the
+    writer as (n, batch) through the bounded batches queue. (n, None) marks the
+    end of job n, also when the walk failed.
+    """
+    try:
+        module, account_name, start_block, start_index = job
+        hv = _worker_hive(nodes)
+        # At most store_ops_node_concurrency history walks run against the same node
+        with node_semaphores.get(hv.rpc.url):
+            account = Account(account_name, blockchain_instance=hv)
+            if module == "store_ops_db":
+                data = get_account_trx_data(account, start_block, start_index)
+            else:
+                data = get_account_trx_storage_data(account, start_index, hv)
+            _batch_insert(partial(_put_batch, batches, stop, n), data, batch_size=batch_size)
+    finally:
+        _put(batches, stop, (n, None))
+
+
+def _put(batches, stop, item) -> bool:
+    """
+    Wait for room in the batches queue, returns False when the writer has stopped.
+    """
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _put_batch(batches, stop, n, batch) -> None:
+    """
+    Hand a batch of job n to the writer, ends the history walk when the writer has stopped.
+    """
+    if not _put(batches, stop, (n, batch)):
+        raise RuntimeError("store_ops_db writer stopped")
+
+
+def _batch_insert(add_batch_func, data: Iterable, batch_size: int = 1000) -> None:
     """
     Helper to batch-insert data using the provided add_batch_func.
     """
@@ -141,29 +203,24 @@ def _batch_insert(add_batch_func, data: list, batch_size: int = 1000) -> None:
         add_batch_func(data_batch)
 
 
-def run():
-    from hive_sbi.hsbi.core import load_config, setup_database_connections, setup_storage_objects
+def run(ctx=None):
+    from hive_sbi.hsbi.context import HsbiContext
     from hive_sbi.hsbi.utils import measure_execution_time
 
     # Initialize start time for measuring execution time
     start_prep_time = time.time()
 
-    # Load configuration
-    config_data = load_config()
-
-    # Setup database connections
-    db, db2 = setup_database_connections(config_data)
-
-    # Setup storage objects
-    storage = setup_storage_objects(db, db2)
+    # Configuration, database connections and storage objects are shared by the modules
+    if ctx is None:
+        ctx = HsbiContext()
+    config_data = ctx.config
+    db = ctx.db
+    storage = ctx.storage
 
     # Get accounts directly from storage
     accounts = storage["accounts"]
     other_accounts = storage["other_accounts"]
 
-    # Get hive_blockchain setting
-    hive_blockchain = config_data.get("hive_blockchain", True)
-
     # Get configuration directly from storage
     conf_setup = storage["conf_setup"]
     last_cycle = conf_setup["last_cycle"]
@@ -183,56 +240,85 @@ def run():
         last_cycle is not None
         and (datetime.now(timezone.utc) - last_cycle).total_seconds() > 60 * share_cycle_min
     ):
-        # Update current node list from @fullnodeupdate
-        nodes = NodeList()
-        nodes.update_nodes()
-        # nodes.update_nodes(weights={"hist": 1})
-        hv = Hive(node=nodes.get_nodes(hive=hive_blockchain))
-        logger.info(str(hv))
+        # Current node list from @fullnodeupdate
+        node_list = ctx.nodes
+        logger.info(f"nodes: {node_list}")
 
-        logger.info("Fetch new account history ops.")
+        workers = config_data.get("store_ops_workers", 4)
+        node_concurrency = config_data.get("store_ops_node_concurrency", 2)
+        node_semaphores = NodeSemaphores(node_list, node_concurrency)
 
-        # Blockchain instance is not needed here
+        logger.info("Fetch new account history ops.")
 
+        # New ops are stored with a compact op_dict, see hsbi compact-ops
+        ops_compact = config_data.get("ops_compact", False)
         accountTrx = {}
         for account in accounts:
             if account == "steembasicincome":
-                accountTrx["sbi"] = AccountTrx(db, "sbi")
+                accountTrx["sbi"] = AccountTrx(db, "sbi", compact=ops_compact)
             else:
-                accountTrx[account] = AccountTrx(db, account)
+                accountTrx[account] = AccountTrx(db, account, compact=ops_compact)
+        transferTrxStorage = TransferTrx(db)
+
+        # The resume positions are stored next to the ops in the ops database
+        cursorStorage = IngestCursorDB(db)
+        cursorStorage.create_table()
 
         # stop_index = addTzInfo(datetime(2018, 7, 21, 23, 46, 00))
         # stop_index = formatTimeString("2018-07-21T23:46:09")
 
+        # Resume positions are read here, the workers never touch the database
+        jobs = []
         for account_name in accounts:
-            if account_name == "steembasicincome":
-                account = Account(account_name, blockchain_instance=hv)
-                account_name = "sbi"
+            table_name = "sbi" if account_name == "steembasicincome" else account_name
+            cursor = cursorStorage.get("store_ops_db", table_name)
+            if cursor is not None:
+                start_block = cursor
+                start_index = cursor
             else:
-                account = Account(account_name, blockchain_instance=hv)
-            start_block = accountTrx[account_name].get_latest_block()
-            start_index = (
-                accountTrx[account_name].get_latest_index() if start_block is not None else 0
+                # No cursor yet, resume from the newest stored op
+                start_block = accountTrx[table_name].get_latest_block()
+                start_index = (
+                    accountTrx[table_name].get_latest_index() if start_block is not None else 0
+                )
+            add_batch = partial(
+                accountTrx[table_name].add_batch,
+                cursor=partial(cursorStorage.set, "store_ops_db", table_name),
             )
-
-            data = get_account_trx_data(account, start_block, start_index)
-
-            # Process data using the same approach as the original code
-            # Batch insert account transaction data
-            _batch_insert(accountTrx[account_name].add_batch, data, batch_size=1000)
-
-        # Process other accounts using a new TransferTrx instance
-        transferTrxStorage = TransferTrx(db)
-
-        for account in other_accounts:
-            account = Account(account, blockchain_instance=hv)
-            start_index = transferTrxStorage.get_latest_index(account["name"])
-
-            data = get_account_trx_storage_data(account, start_index, hv)
-
-            # Process data using the same approach as the original code
-            # Batch insert transfer transaction storage data
-            _batch_insert(transferTrxStorage.add_batch, data, batch_size=1000)
+            jobs.append((("store_ops_db", account_name, start_block, start_index), add_batch))
+
+        for account_name in other_accounts:
+            start_index = cursorStorage.get("store_ops_db.transfers", account_name)
+            if start_index is None:
+                start_index = transferTrxStorage.get_latest_index(account_name)
+            add_batch = partial(
+                transferTrxStorage.add_batch,
+                cursor=partial(cursorStorage.set, "store_ops_db.transfers", account_name),
+            )
+            jobs.append((("store_ops_db.transfers", account_name, None, start_index), add_batch))
+
+        # At most two batches per worker wait in memory for the writer
+        batches = queue.Queue(maxsize=2 * workers)
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(fetch_history, n, job, node_list, node_semaphores, batches, stop)
+                for n, (job, add_batch) in enumerate(jobs)
+            ]
+            # This thread is the only writer, the batches of an account are
+            # inserted in op order and each one moves the cursor
+            try:
+                running = len(jobs)
+                while running > 0:
+                    n, batch = batches.get()
+                    if batch is None:
+                        running -= 1
+                        continue
+                    jobs[n][1](batch)
+            finally:
+                stop.set()
+        for future in futures:
+            future.result()
         logger.info(f"store_ops_db script run {measure_execution_time(start_prep_time):.2f} s")
 
 
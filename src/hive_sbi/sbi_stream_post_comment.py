@@ -2,38 +2,30 @@ import json
 import random
 import time
 
-from nectar import Hive
 from nectar.blockchain import Blockchain
 from nectar.comment import Comment
-from nectar.nodelist import NodeList
 from nectar.utils import construct_authorperm
 
-from hive_sbi.hsbi.core import (
-    get_logger,
-    load_config,
-    setup_database_connections,
-    setup_storage_objects,
-)
-
-logger = get_logger()
-from hive_sbi.hsbi.member import Member
+from hive_sbi.hsbi.context import HsbiContext
+from hive_sbi.hsbi.core import get_logger
+from hive_sbi.hsbi.member_index import MemberIndex
 from hive_sbi.hsbi.storage import MemberDB
 from hive_sbi.hsbi.transfer_ops_storage import PostsTrx
 from hive_sbi.hsbi.utils import measure_execution_time
 from hive_sbi.hsbi.version import version as sbiversion
 
+logger = get_logger()
 
-def run():
-    start_prep_time = time.time()
-
-    # Load configuration
-    config_data = load_config()
 
-    # Setup database connections
-    db, db2 = setup_database_connections(config_data)
+def run(ctx=None, check_cycle=True):
+    # check_cycle is False for a run between the cycles, this module does not use it
+    start_prep_time = time.time()
 
-    # Setup storage objects
-    storage = setup_storage_objects(db, db2)
+    # Database connections and storage objects are shared by the modules
+    if ctx is None:
+        ctx = HsbiContext()
+    db, db2 = ctx.db, ctx.db2
+    storage = ctx.storage
 
     # Get storage objects
     trxStorage = storage["trxStorage"]
@@ -41,9 +33,6 @@ def run():
     confStorage = storage["confStorage"]
     keyStorage = storage["keyStorage"]
 
-    # Get blockchain setting
-    hive_blockchain = config_data.get("hive_blockchain", True)
-
     accounts = storage["accounts"]
     other_accounts = storage["other_accounts"]
 
@@ -71,15 +60,13 @@ def run():
     comment_vote_divider = conf_setup["comment_vote_divider"]
     comment_footer = conf_setup["comment_footer"]
 
-    member_accounts = memberStorage.get_all_accounts()
+    member_accounts = MemberIndex.shared(memberStorage)
     logger.info("%d members in list" % len(member_accounts))
 
     nobroadcast = False
     # nobroadcast = True
 
-    member_data = {}
-    for m in member_accounts:
-        member_data[m] = Member(memberStorage.get(m))
+    member_data = memberStorage.load_all()
 
     postTrx = PostsTrx(db)
 
@@ -92,13 +79,6 @@ def run():
     normal = False
     appbase = True
 
-    nodes = NodeList()
-    # nodes.update_nodes(weights={"block": 1})
-    try:
-        nodes.update_nodes()
-    except Exception as e:
-        logger.warning(f"could not update nodes: {str(e)}")
-
     keys = []
     account_list = []
     for acc in accounts:
@@ -108,9 +88,7 @@ def run():
     for k in keys:
         if k["key_type"] == "posting":
             keys_list.append(k["wif"].replace("\n", "").replace("\r", ""))
-    node_list = nodes.get_nodes(hive=hive_blockchain)
-    hv = Hive(
-        node=node_list,
+    hv = ctx.hive(
         keys=keys_list,
         num_retries=5,
         call_num_retries=3,
@@ -118,6 +96,7 @@ def run():
         nobroadcast=nobroadcast,
     )
 
+    node_pool = ctx.node_pool
     b = Blockchain(blockchain_instance=hv)
     print("deleting old posts")
     postTrx.delete_old_posts(1)
@@ -146,7 +125,8 @@ def run():
     cnt = 0
     updated_accounts = []
     posts_dict = {}
-    changed_member_data = []
+    # Authors in the order they were found, a dict for constant time lookups
+    changed_member_data = {}
     for ops in b.stream(
         start=start_block,
         stop=stop_block,
@@ -169,22 +149,20 @@ def run():
                 "blocks left %d - post found: %d" % (ops["block_num"] - stop_block, len(posts_dict))
             )
         authorperm = construct_authorperm(ops)
-        c = None
-        cnt = 0
-        use_tags_api = True
-        while c is None and cnt < 5:
-            cnt += 1
+        try:
+            c = Comment(authorperm, use_tags_api=True, blockchain_instance=hv)
+        except Exception:
+            # Retry without the tags api, on the next nodes of the pool
             try:
-                c = Comment(authorperm, use_tags_api=use_tags_api, blockchain_instance=hv)
+                c = node_pool.call(
+                    hv, Comment, authorperm, use_tags_api=False, blockchain_instance=hv
+                )
             except Exception:
                 c = None
-                use_tags_api = False
-                continue
         if c is None:
             continue
         main_post = c.is_main_post()
-        if ops["author"] not in changed_member_data:
-            changed_member_data.append(ops["author"])
+        changed_member_data[ops["author"]] = True
         if main_post:
             if "last_update" in c:
                 last_update = c["last_update"]
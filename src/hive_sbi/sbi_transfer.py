@@ -1,41 +1,116 @@
-import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from itertools import islice
 
-from nectar import Hive
 from nectar.account import Account
-from nectar.amount import Amount
-from nectar.nodelist import NodeList
 from nectar.utils import formatTimeString
 
-from hive_sbi.hsbi.member import Member
+from hive_sbi.hsbi.account_lookup import AccountLookup
+from hive_sbi.hsbi.amount import amount_value, asset_table, parse_amount
+from hive_sbi.hsbi.member import ShareAgeIndex
+from hive_sbi.hsbi.memo_decryptor import MemoDecryptor
 from hive_sbi.hsbi.parse_hist_op import ParseAccountHist
-from hive_sbi.hsbi.storage import TransactionOutDB
+from hive_sbi.hsbi.storage import (
+    AccountExistsDB,
+    IngestCursorDB,
+    MemoExclusionDB,
+    TransactionOutDB,
+    WriteBuffer,
+)
 from hive_sbi.hsbi.transfer_ops_storage import AccountTrx
 
 
-def run():
-    from hive_sbi.hsbi.core import load_config, setup_database_connections, setup_storage_objects
-    from hive_sbi.hsbi.utils import measure_execution_time
+def is_parsed_op(account_name, json_op, assets):
+    """Returns False for the transfers to the voting accounts which are not parsed"""
+    if account_name != "steembasicincome" and json_op["type"] == "transfer":
+        satoshis, symbol = parse_amount(json_op["amount"], assets)
+        if amount_value(satoshis, symbol, assets) < 1:
+            return False
+        if json_op["memo"][:8] == "https://":
+            return False
+    return True
 
-    start_prep_time = time.time()
 
-    # Load configuration
-    config_data = load_config()
+def prepare_batch(pah, ops, start_index_offset, assets, stop_index=None, batch_size=1000):
+    """Read and prepare the next batch_size ops of one account, runs in a worker thread
+
+    Memos are decrypted and parsed by pah.prepare_transfers, nothing is
+    written and member_data is not touched.
+
+    :returns: (ops to parse, last op read, number of ops read)
+    """
+    account_name = pah.account["name"]
+    batch = list(islice(ops, batch_size))
+    prepared = []
+    last_op = None
+    for op in batch:
+        timestamp = formatTimeString(op["timestamp"])
+        if stop_index is not None and timestamp > stop_index:
+            continue
+        last_op = op
+        json_op = op.op
+        json_op["index"] = op["op_acc_index"] + start_index_offset
+        if is_parsed_op(account_name, json_op, assets):
+            prepared.append(json_op)
+    pah.prepare_transfers(prepared)
+    return prepared, last_op, len(batch)
+
+
+def prepared_ops(
+    executor,
+    pah,
+    ops,
+    position,
+    start_index_offset,
+    assets,
+    last_ops,
+    stop_index=None,
+    batch_size=1000,
+):
+    """Prepare the ops of one account in batches, returns an iterator over the prepared ops
+
+    The first batch is submitted at once, each further batch when the
+    previous one is handed out. So the first batch of every account is
+    prepared in parallel while at most two batches of each account are held.
+    last_ops[position] is set to the last op read.
+    """
+
+    def submit():
+        return executor.submit(
+            prepare_batch, pah, ops, start_index_offset, assets, stop_index, batch_size
+        )
+
+    def iterate(future):
+        while future is not None:
+            prepared, last_op, count = future.result()
+            if last_op is not None:
+                last_ops[position] = last_op
+            future = submit() if count == batch_size else None
+            yield from prepared
+
+    return iterate(submit())
+
 
-    # Setup database connections
-    db, db2 = setup_database_connections(config_data)
+def run(ctx=None):
+    from hive_sbi.hsbi.context import HsbiContext
+    from hive_sbi.hsbi.utils import measure_execution_time
+
+    start_prep_time = time.time()
 
-    # Setup storage objects
-    storage = setup_storage_objects(db, db2)
+    # Configuration, database connections and storage objects are shared by the modules
+    if ctx is None:
+        ctx = HsbiContext()
+    config_data = ctx.config
+    db, db2 = ctx.db, ctx.db2
+    storage = ctx.storage
 
     # Get accounts
     accounts = storage["accounts"]
     other_accounts = storage["other_accounts"]
 
-    # Get management shares and blockchain setting
+    # Get management shares
     mgnt_shares = config_data.get("mgnt_shares", {})
-    hive_blockchain = config_data.get("hive_blockchain", True)
 
     # Setup account transaction storage
     accountTrx = {}
@@ -52,6 +127,9 @@ def run():
     transactionStorage = storage["transactionStorage"]
     # Create TransactionOutDB instance as it's not available in the storage dictionary
     transactionOutStorage = TransactionOutDB(db)
+    # Resume positions live next to the trx rows they belong to
+    cursorStorage = IngestCursorDB(db2)
+    cursorStorage.create_table()
 
     # Get configuration
     conf_setup = storage["conf_setup"]
@@ -84,102 +162,170 @@ def run():
         if key is not None:
             key_list.append(key["wif"])
         # print(key_list)
-        nodes = NodeList()
-        try:
-            nodes.update_nodes()
-        except Exception as e:
-            print(f"could not update nodes: {str(e)}")
-        hv = Hive(keys=key_list, node=nodes.get_nodes(hive=hive_blockchain))
+        hv = ctx.hive(keys=key_list)
         # set_shared_blockchain_instance(hv)
 
         # print("load member database")
-        member_accounts = memberStorage.get_all_accounts()
-        member_data = {}
-        n_records = 0
-        share_age_member = {}
-        for m in member_accounts:
-            member_data[m] = Member(memberStorage.get(m))
-
-        if True:
+        # Only the share ages are needed to select sponsees
+        member_data = memberStorage.load_all(columns=["avg_share_age"])
+        # One index for all accounts, a selected sponsee stays at 0 for this run
+        share_age_index = ShareAgeIndex(member_data)
+        # With transfer_workers above 1 the ops of the next accounts are read and
+        # prepared in worker threads while this thread parses the current account
+        transfer_workers = config_data.get("transfer_workers", 1)
+        # Account checks of the memo parser, cached across runs in the sbi database.
+        # Lookups of the workers are written to the cache by this thread, between
+        # the transactions of the accounts
+        account_lookup = AccountLookup(
+            blockchain_instance=hv,
+            storage=AccountExistsDB(db2),
+            defer_writes=transfer_workers > 1,
+        )
+        assets = asset_table(hv)
+        memo_decrypt_processes = config_data.get("memo_decrypt_processes", 0)
+        memo_decryptor = MemoDecryptor(blockchain_instance=hv, processes=memo_decrypt_processes)
+
+        # The process pool of the key derivation is shut down after the last account
+        try:
+            # Excluded transfers are not written any more, rows of accounts which
+            # were excluded later are removed here
+            exclusionStorage = MemoExclusionDB(db2)
+            exclusionStorage.create_table()
+            memo_exclusions = exclusionStorage.get()
             print("delete from transaction_memo... ")
-            transactionStorage.delete_sender("dtube.rewards")
-            transactionStorage.delete_sender("reward.app")
-            transactionStorage.delete_to("sbi2")
-            transactionStorage.delete_to("sbi3")
-            transactionStorage.delete_to("sbi4")
-            transactionStorage.delete_to("sbi5")
-            transactionStorage.delete_to("sbi6")
-            transactionStorage.delete_to("sbi7")
-            transactionStorage.delete_to("sbi8")
-            transactionStorage.delete_to("sbi9")
-            transactionStorage.delete_to("sbi10")
+            transactionStorage.delete_excluded(memo_exclusions)
             print("done.")
 
-        stop_index = None
-        # stop_index = addTzInfo(datetime(2018, 7, 21, 23, 46, 00))
-        # stop_index = formatTimeString("2018-07-21T23:46:09")
-
-        for account_name in accounts:
-            if account_name == "steembasicincome":
-                account_trx_name = "sbi"
-            else:
-                account_trx_name = account_name
-            parse_vesting = account_name == "steembasicincome"
-            accountTrx[account_trx_name].db = db
-            account = Account(account_name, blockchain_instance=hv)
-            # print(account["name"])
-            pah = ParseAccountHist(
-                account,
-                "",
-                trxStorage,
-                transactionStorage,
-                transactionOutStorage,
-                member_data,
-                memberStorage=memberStorage,
-                blockchain_instance=hv,
-            )
-
-            op_index = trxStorage.get_all_op_index(account["name"])
-
-            if len(op_index) == 0:
-                start_index = 0
-                op_counter = 0
-                start_index_offset = 0
-            else:
-                op = trxStorage.get(op_index[-1], account["name"])
-                start_index = op["index"] + 1
-                op_counter = op_index[-1] + 1
+            stop_index = None
+            # stop_index = addTzInfo(datetime(2018, 7, 21, 23, 46, 00))
+            # stop_index = formatTimeString("2018-07-21T23:46:09")
+
+            jobs = []
+
+            for account_name in accounts:
                 if account_name == "steembasicincome":
-                    start_index_offset = 316
+                    account_trx_name = "sbi"
                 else:
-                    start_index_offset = 0
+                    account_trx_name = account_name
+                parse_vesting = account_name == "steembasicincome"
+                accountTrx[account_trx_name].db = db
+                account = Account(account_name, blockchain_instance=hv)
+                account_decryptor = memo_decryptor
+                if transfer_workers > 1:
+                    # Keeps the decrypted memos of the current batches of this account
+                    account_decryptor = MemoDecryptor(
+                        blockchain_instance=hv,
+                        processes=memo_decrypt_processes,
+                        pool=memo_decryptor.pool(),
+                    )
+                # print(account["name"])
+                pah = ParseAccountHist(
+                    account,
+                    "",
+                    trxStorage,
+                    transactionStorage,
+                    transactionOutStorage,
+                    member_data,
+                    memberStorage=memberStorage,
+                    blockchain_instance=hv,
+                    share_age_index=share_age_index,
+                    account_lookup=account_lookup,
+                    memo_decryptor=account_decryptor,
+                    memo_exclusions=memo_exclusions,
+                )
 
-            # print("start_index %d" % start_index)
-            # ops = []
-            #
+                cursor = cursorStorage.get("transfer", account["name"])
+                if cursor is None:
+                    # No cursor yet, resume after the newest trx of this account
+                    cursor = trxStorage.get_latest_op_index(account["name"])
+                    if cursor is not None:
+                        cursor = {"op_acc_index": cursor["index"]}
+
+                if cursor is None:
+                    start_index = 0
+                    start_index_offset = 0
+                else:
+                    start_index = cursor["op_acc_index"] + 1
+                    if account_name == "steembasicincome":
+                        start_index_offset = 316
+                    else:
+                        start_index_offset = 0
 
-            ops = accountTrx[account_trx_name].get_all(
-                op_types=["transfer", "delegate_vesting_shares"]
-            )
-            if len(ops) == 0:
-                continue
+                # print("start_index %d" % start_index)
+                # ops = []
+                #
 
-            if ops[-1]["op_acc_index"] < start_index - start_index_offset:
-                continue
-            for op in ops:
-                if op["op_acc_index"] < start_index - start_index_offset:
-                    continue
-                if stop_index is not None and formatTimeString(op["timestamp"]) > stop_index:
+                # Only the ops which were not parsed yet
+                ops = accountTrx[account_trx_name].iter_all(
+                    op_types=["transfer", "delegate_vesting_shares"],
+                    start_index=start_index - start_index_offset,
+                )
+                if transfer_workers > 1:
+                    jobs.append((pah, ops, start_index_offset, parse_vesting))
                     continue
-                json_op = json.loads(op["op_dict"])
-                json_op["index"] = op["op_acc_index"] + start_index_offset
-                if account_name != "steembasicincome" and json_op["type"] == "transfer":
-                    if float(Amount(json_op["amount"], blockchain_instance=hv)) < 1:
-                        continue
-                    if json_op["memo"][:8] == "https://":
-                        continue
-
-                pah.parse_op(json_op, parse_vesting=parse_vesting)
+
+                # All rows of this account are written in one transaction together
+                # with the trx rows that mark where the next run resumes
+                with WriteBuffer(transactionOutStorage, transactionStorage, trxStorage):
+                    last_op = None
+                    while True:
+                        batch = list(islice(ops, 1000))
+                        if len(batch) == 0:
+                            break
+                        # The encrypted memos of the batch are decrypted together
+                        pah.prepare_memos([op.op for op in batch])
+                        for op in batch:
+                            if (
+                                stop_index is not None
+                                and formatTimeString(op["timestamp"]) > stop_index
+                            ):
+                                continue
+                            last_op = op
+                            json_op = op.op
+                            json_op["index"] = op["op_acc_index"] + start_index_offset
+                            if not is_parsed_op(account_name, json_op, assets):
+                                continue
+
+                            pah.parse_op(json_op, parse_vesting=parse_vesting)
+
+                    # The cursor is committed together with the trx rows
+                    if last_op is not None:
+                        last_op["op_acc_index"] += start_index_offset
+                        cursorStorage.set("transfer", account["name"], last_op)
+
+            if len(jobs) > 0:
+                # The workers read ops and look up accounts, the trx rows are
+                # written below by this thread
+                last_ops = {}
+                with ThreadPoolExecutor(max_workers=transfer_workers) as executor:
+                    prepared = [
+                        prepared_ops(
+                            executor,
+                            pah,
+                            ops,
+                            position,
+                            start_index_offset,
+                            assets,
+                            last_ops,
+                            stop_index,
+                        )
+                        for position, (pah, ops, start_index_offset, _) in enumerate(jobs)
+                    ]
+
+                    for position, (pah, _, start_index_offset, parse_vesting) in enumerate(jobs):
+                        # All rows of this account are written in one transaction
+                        # together with its cursor, as in the sequential path
+                        with WriteBuffer(transactionOutStorage, transactionStorage, trxStorage):
+                            for json_op in prepared[position]:
+                                pah.parse_op(json_op, parse_vesting=parse_vesting)
+
+                            last_op = last_ops.get(position)
+                            if last_op is not None:
+                                last_op["op_acc_index"] += start_index_offset
+                                cursorStorage.set("transfer", pah.account["name"], last_op)
+                        account_lookup.flush()
+        finally:
+            memo_decryptor.close()
 
         print(f"transfer script run {measure_execution_time(start_prep_time):.2f} s")
 
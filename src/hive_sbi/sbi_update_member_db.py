@@ -1,15 +1,25 @@
-import json
 import time
 from datetime import datetime, timedelta, timezone
 from time import sleep
 
-from nectar import Hive
 from nectar.account import Account
-from nectar.nodelist import NodeList
 from nectar.utils import formatTimeString
 
-from hive_sbi.hsbi.core import load_config, setup_database_connections, setup_storage_objects
-from hive_sbi.hsbi.member import Member
+from hive_sbi.hsbi.context import HsbiContext
+from hive_sbi.hsbi.member import ShareAgeStore, calc_share_ages
+from hive_sbi.hsbi.member_ledger import (
+    VERIFY_MODULE,
+    apply_share_state,
+    collect_delegations,
+    compare_members,
+    load_share_state,
+    rebuild_ledger,
+    replay_trx,
+    sync_ledger,
+    update_share_state,
+    verify_due,
+)
+from hive_sbi.hsbi.storage import IngestCursorDB, MemberShareLedgerDB, MemberShareStateDB
 from hive_sbi.hsbi.transfer_ops_storage import TransferTrx
 from hive_sbi.hsbi.utils import measure_execution_time
 
@@ -145,19 +155,17 @@ def memo_sponsoring_update_shares(
         print(f"Could not send 0.001 {HIVE_symbol} to {s}: {str(e)}")
 
 
-def run():
+def run(ctx=None):
     """Run the update member database module"""
 
     start_time = time.time()
 
-    # Load configuration
-    config_data = load_config()
-
-    # Setup database connections
-    db, db2 = setup_database_connections(config_data)
-
-    # Setup storage objects
-    storage = setup_storage_objects(db, db2)
+    # Configuration, database connections and storage objects are shared by the modules
+    if ctx is None:
+        ctx = HsbiContext()
+    config_data = ctx.config
+    db, db2 = ctx.db, ctx.db2
+    storage = ctx.storage
 
     # Get storage objects
     transferStorage = TransferTrx(db)
@@ -173,7 +181,6 @@ def run():
     accounts = accountStorage.get()
     other_accounts = accountStorage.get_transfer()
     mgnt_shares = config_data.get("mgnt_shares", {})
-    hive_blockchain = config_data.get("hive_blockchain", True)
 
     # Get configuration settings
     conf_setup = confStorage.get()
@@ -231,16 +238,8 @@ def run():
         current_cycle = last_cycle + timedelta(seconds=60 * share_cycle_min)
 
         print(f"Update member database, new cycle: {str(new_cycle)}")
-        member_accounts = memberStorage.get_all_accounts()
-        data = trxStorage.get_all_data()
 
-        # Update current node list from @fullnodeupdate
-        nodes = NodeList()
-        try:
-            nodes.update_nodes()
-        except Exception as e:
-            print(f"Could not update nodes: {str(e)}")
-        hv = Hive(node=nodes.get_nodes(hive=hive_blockchain))
+        hv = ctx.hive()
 
         # Get memo transfer account key
         # Using get_all_data() instead of get() since get() requires a memo_type parameter
@@ -271,24 +270,22 @@ def run():
             print("No transfer memo sender account found in the database")
             memo_transfer_acc = None
 
-        member_data = {}
-        share_age_member = {}
-        for m in member_accounts:
-            member_data[m] = Member(memberStorage.get(m))
+        def load_members(store):
+            member_data = memberStorage.load_all(store=store)
+            for member in member_data.values():
+                # clear shares
+                member["shares"] = 0
+                member["bonus_shares"] = 0
+                member.reset_share_age_list()
+            return member_data
+
+        # All members keep their share entries in one store, their share ages
+        # are computed together in a single pass
+        store = ShareAgeStore()
+        member_data = load_members(store)
+        delegation = {m: 0 for m in member_data}
+        delegation_timestamp = {m: None for m in member_data}
 
-        mngt_shares_assigned = False
-        mngt_shares = 0
-        delegation = {}
-        delegation_timestamp = {}
-        # clear shares
-        for m in member_data:
-            member_data[m]["shares"] = 0
-            member_data[m]["bonus_shares"] = 0
-            delegation[m] = 0
-            delegation_timestamp[m] = None
-            member_data[m].reset_share_age_list()
-
-        shares_sum = 0
         latest_share = trxStorage.get_lastest_share_type("Mgmt")
         if latest_share is None:
             print("No management shares found in the database")
@@ -296,74 +293,70 @@ def run():
         else:
             mngt_shares_sum = (latest_share["index"] + 1) / len(mgnt_shares) * 100
             print(f"Management shares sum: {int(mngt_shares_sum)}")
-        latest_data_timestamp = None
-
-        for op in data:
-            if op["status"] == "Valid":
-                share_type = op["share_type"]
-                if latest_data_timestamp is None:
-                    latest_data_timestamp = formatTimeString(op["timestamp"])
-                elif latest_data_timestamp < formatTimeString(op["timestamp"]):
-                    latest_data_timestamp = formatTimeString(op["timestamp"])
-                if share_type in ["DelegationLeased"]:
-                    continue
-                if isinstance(op["timestamp"], str):
-                    timestamp = formatTimeString(op["timestamp"])
-                else:
-                    timestamp = op["timestamp"]
-                if share_type in ["RemovedDelegation", "Delegation"]:
-                    if share_type == "Delegation":
-                        delegation[op["account"]] = op["vests"]
-                        delegation_timestamp[op["account"]] = timestamp
-                    else:
-                        delegation[op["account"]] = 0
-                        delegation_timestamp[op["account"]] = timestamp
-                    continue
-                if share_type in ["Mgmt", "MgmtTransfer"]:
-                    if not mngt_shares_assigned:
-                        for account in mgnt_shares:
-                            mngt_shares = mgnt_shares[account]
-                            if account not in member_data:
-                                member = Member(account, mngt_shares, timestamp)
-                                member.append_share_age(timestamp, mngt_shares)
-                                member_data[account] = member
-                            else:
-                                member_data[account]["latest_enrollment"] = timestamp
-                                member_data[account]["shares"] = mngt_shares
-                                member_data[account].append_share_age(timestamp, mngt_shares)
-                        mngt_shares_assigned = True
-                    continue
-                if share_type in ["ShareTransfer"]:
-                    continue
-                sponsor = op["sponsor"]
-                sponsee = json.loads(op["sponsee"])
-                shares = op["shares"]
-                if shares == 0:
-                    continue
-                if sponsor not in member_data:
-                    member = Member(sponsor, shares, timestamp)
-                    member.append_share_age(timestamp, shares)
-                    member_data[sponsor] = member
+
+        hooks = {
+            "on_sponsoring": lambda s, sponsor: memo_sponsoring(
+                transferMemos, memo_transfer_acc, s, sponsor
+            ),
+            "on_sponsoring_update": lambda s, sponsor, shares: memo_sponsoring_update_shares(
+                transferMemos, memo_transfer_acc, s, sponsor, shares
+            ),
+        }
+
+        if config_data.get("member_ledger_incremental", False):
+            # Only the trx added or changed since the last cycle are read, the
+            # shares are kept per member in the member_share_state table
+            ledgerStorage = MemberShareLedgerDB(db2)
+            ledgerStorage.create_table()
+            stateStorage = MemberShareStateDB(db2)
+            stateStorage.create_table()
+            cursorStorage = IngestCursorDB(db2)
+            cursorStorage.create_table()
+            new_trx = sync_ledger(trxStorage, ledgerStorage, cursorStorage)
+            states = load_share_state(stateStorage)
+            new_entries = update_share_state(
+                states,
+                trxStorage,
+                ledgerStorage,
+                stateStorage,
+                cursorStorage,
+                mgnt_shares,
+                members=member_data,
+                **hooks,
+            )
+            print(f"Member ledger: {new_trx} new trx, {new_entries} new share entries")
+
+            verify = verify_due(cursorStorage, config_data.get("member_ledger_verify_hours", 24))
+            if verify:
+                replayed = load_members(ShareAgeStore())
+                replay_trx(replayed, trxStorage.get_all_data_sorted(), mgnt_shares)
+
+            apply_share_state(member_data, states, store=store)
+            changes = collect_delegations(
+                trxStorage.get_share_type(["Delegation", "RemovedDelegation"])
+            )
+
+            if verify:
+                diff = compare_members(member_data, replayed)
+                if len(diff) > 0:
+                    print(
+                        f"Member ledger differs from the trx replay for {len(diff)} members "
+                        f"({', '.join(diff[:10])}), rebuilding it"
+                    )
+                    rebuild_ledger(trxStorage, ledgerStorage, cursorStorage)
+                    update_share_state(
+                        {}, trxStorage, ledgerStorage, stateStorage, cursorStorage, mgnt_shares
+                    )
+                    member_data = replayed
                 else:
-                    member_data[sponsor]["latest_enrollment"] = timestamp
-                    member_data[sponsor]["shares"] += shares
-                    member_data[sponsor].append_share_age(timestamp, shares)
-                if len(sponsee) == 0:
-                    continue
-                for s in sponsee:
-                    shares = sponsee[s]
-                    if s not in member_data:
-                        member = Member(s, shares, timestamp)
-                        member.append_share_age(timestamp, shares)
-                        member_data[s] = member
-                        memo_sponsoring(transferMemos, memo_transfer_acc, s, sponsor)
-                    else:
-                        member_data[s]["latest_enrollment"] = timestamp
-                        member_data[s]["shares"] += shares
-                        member_data[s].append_share_age(timestamp, shares)
-                        memo_sponsoring_update_shares(
-                            transferMemos, memo_transfer_acc, s, sponsor, member_data[s]["shares"]
-                        )
+                    print("Member ledger matches the trx replay")
+                cursorStorage.set(VERIFY_MODULE, "", {})
+        else:
+            changes = replay_trx(
+                member_data, trxStorage.get_all_data_sorted(), mgnt_shares, store=store, **hooks
+            )
+        delegation.update(changes[0])
+        delegation_timestamp.update(changes[1])
 
         # Add bonus shares from delegation
         for m in member_data:
@@ -379,8 +372,7 @@ def run():
                 )
 
         # Calculate share age
-        for m in member_data:
-            member_data[m].calc_share_age()
+        calc_share_ages(member_data)
 
         # Calculate total shares
         shares = 0
@@ -1,33 +1,55 @@
 import time
 from datetime import datetime, timedelta, timezone
 
-from nectar import Hive
 from nectar.account import Account
 from nectar.blockchain import Blockchain
 from nectar.comment import Comment
-from nectar.nodelist import NodeList
 
 from hive_sbi.hsbi.core import get_logger
 from hive_sbi.hsbi.member import Member
+from hive_sbi.hsbi.member_index import MemberIndex
 from hive_sbi.hsbi.transfer_ops_storage import PostsTrx
 
 logger = get_logger()
 
 
-def run():
-    from hive_sbi.hsbi.core import load_config, setup_database_connections, setup_storage_objects
-    from hive_sbi.hsbi.utils import measure_execution_time
+def vote(c, vote_percentage, voter, node_pool):
+    """Upvote a comment and wait for the vote, with the retry policy of node_pool
 
-    start_prep_time = time.time()
+    Returns (vote_sucessfull, vote_time, voted_after), voted_after is 300 s
+    when the vote could not be found.
+    """
+
+    def upvote():
+        if not Account(voter).has_voted(c):
+            c.upvote(vote_percentage, voter=voter)
+            time.sleep(6)
+        c.refresh()
+        for v in c.get_votes():
+            if voter == v["voter"]:
+                vote_time = v["time"] if "time" in v else v["last_update"]
+                return vote_time, (vote_time - c["created"]).total_seconds()
+        raise Exception(f"vote of {voter} not found on {c['authorperm']}")
 
-    # Load configuration
-    config_data = load_config()
+    try:
+        vote_time, voted_after = node_pool.call(c.blockchain, upvote)
+    except Exception as e:
+        print(e)
+        return False, None, 300
+    return True, vote_time, voted_after
 
-    # Setup database connections
-    db, db2 = setup_database_connections(config_data)
 
-    # Setup storage objects
-    storage = setup_storage_objects(db, db2)
+def run(ctx=None, check_cycle=True):
+    from hive_sbi.hsbi.context import HsbiContext
+    from hive_sbi.hsbi.utils import measure_execution_time
+
+    start_prep_time = time.time()
+
+    # Database connections and storage objects are shared by the modules
+    if ctx is None:
+        ctx = HsbiContext()
+    db = ctx.db
+    storage = ctx.storage
 
     # Get storage objects
     trxStorage = storage["trxStorage"]
@@ -36,18 +58,11 @@ def run():
     accStorage = storage["accountStorage"]
     keyStorage = storage["keyStorage"]
 
-    # Get blockchain setting
-    hive_blockchain = config_data.get("hive_blockchain", True)
-
     accounts = storage["accounts"]
 
-    # Setup Hive connection (fix for undefined 'hv')
-    nodes = NodeList()
-    try:
-        nodes.update_nodes()
-    except Exception as e:
-        logger.warning(f"could not update nodes: {str(e)}")
-    hv = Hive(node=nodes.get_nodes(hive=hive_blockchain))
+    # Setup Hive connection, the calls are retried by the node pool
+    hv = ctx.hive()
+    node_pool = ctx.node_pool
 
     conf_setup = storage["conf_setup"]
 
@@ -59,7 +74,7 @@ def run():
     comment_vote_divider = conf_setup["comment_vote_divider"]
     comment_vote_timeout_h = conf_setup["comment_vote_timeout_h"]
     upvote_delay_correction = 18
-    member_accounts = memberStorage.get_all_accounts()
+    member_accounts = MemberIndex.shared(memberStorage)
 
     nobroadcast = False
     # nobroadcast = True
@@ -145,15 +160,10 @@ def run():
             continue
         elif post_list[authorperm]["main_post"] == 0 and rshares < minimum_vote_threshold * 2:
             continue
-        cnt = 0
-        c = None
-        while c is None and cnt < 5:
-            cnt += 1
-            try:
-                c = Comment(authorperm, use_tags_api=True, blockchain_instance=hv)
-            except Exception:
-                c = None
-                hv.rpc.next()
+        try:
+            c = node_pool.call(hv, Comment, authorperm, use_tags_api=True, blockchain_instance=hv)
+        except Exception:
+            c = None
         if c is None:
             print(f"Error getting {authorperm}")
             continue
@@ -225,34 +235,7 @@ def run():
                 print("Comment Vote %s from %s with %.2f %%" % (author, voter, vote_percentage))
             elif voter is not None:
                 print("Comment Upvote %s from %s with %.2f %%" % (author, voter, vote_percentage))
-                vote_sucessfull = False
-                voted_after = 300
-                cnt = 0
-                vote_time = None
-                while not vote_sucessfull and cnt < 5:
-                    try:
-                        if not Account(voter).has_voted(c):
-                            c.upvote(vote_percentage, voter=voter)
-                            time.sleep(6)
-                            c.refresh()
-                            for v in c.get_votes():
-                                if voter == v["voter"]:
-                                    vote_sucessfull = True
-                                    if "time" in v:
-                                        vote_time = v["time"]
-                                        voted_after = (v["time"] - c["created"]).total_seconds()
-                                    else:
-                                        vote_time = v["last_update"]
-                                        voted_after = (
-                                            v["last_update"] - c["created"]
-                                        ).total_seconds()
-                    except Exception as e:
-                        print(e)
-                        time.sleep(6)
-                        if cnt > 0:
-                            c.blockchain.rpc.next()
-                        print("retry to vote %s" % c["authorperm"])
-                    cnt += 1
+                vote_sucessfull, vote_time, voted_after = vote(c, vote_percentage, voter, node_pool)
                 if vote_sucessfull:
                     print("Vote for %s at %s was sucessfully" % (author, str(vote_time)))
                     memberStorage.update_last_vote(author, vote_time)
@@ -316,29 +299,7 @@ def run():
                         print("Vote %s from %s with %.2f %%" % (author, voter, vote_percentage))
                     else:
                         print("Upvote %s from %s with %.2f %%" % (author, voter, vote_percentage))
-                        vote_sucessfull = False
-                        cnt = 0
-                        vote_time = None
-                        while not vote_sucessfull and cnt < 5:
-                            try:
-                                if not Account(voter).has_voted(c):
-                                    c.upvote(vote_percentage, voter=voter)
-                                    time.sleep(6)
-                                    c.refresh()
-                                    for v in c.get_votes():
-                                        if voter == v["voter"]:
-                                            vote_sucessfull = True
-                                            if "time" in v:
-                                                vote_time = v["time"]
-                                            else:
-                                                vote_time = v["last_update"]
-                            except Exception as e:
-                                print(e)
-                                time.sleep(6)
-                                if cnt > 0:
-                                    c.blockchain.rpc.next()
-                                print("retry to vote %s" % c["authorperm"])
-                            cnt += 1
+                        vote_sucessfull, vote_time, _ = vote(c, vote_percentage, voter, node_pool)
                         if vote_sucessfull:
                             print("Vote for %s at %s was sucessfully" % (author, str(vote_time)))
                             memberStorage.update_last_vote(author, vote_time)
@@ -363,34 +324,9 @@ def run():
                     print("Vote %s from %s with %.2f %%" % (author, voter, vote_percentage))
                 else:
                     print("Upvote %s from %s with %.2f %%" % (author, voter, vote_percentage))
-                    vote_sucessfull = False
-                    cnt = 0
-                    voted_after = 300
-                    vote_time = None
-                    while not vote_sucessfull and cnt < 5:
-                        try:
-                            if not Account(voter).has_voted(c):
-                                c.upvote(vote_percentage, voter=voter)
-                                time.sleep(6)
-                                c.refresh()
-                                for v in c.get_votes():
-                                    if voter == v["voter"]:
-                                        vote_sucessfull = True
-                                        if "time" in v:
-                                            vote_time = v["time"]
-                                            voted_after = (v["time"] - c["created"]).total_seconds()
-                                        else:
-                                            vote_time = v["last_update"]
-                                            voted_after = (
-                                                v["last_update"] - c["created"]
-                                            ).total_seconds()
-                        except Exception as e:
-                            print(e)
-                            time.sleep(6)
-                            if cnt > 0:
-                                c.blockchain.rpc.next()
-                            print("retry to vote %s" % c["authorperm"])
-                        cnt += 1
+                    vote_sucessfull, vote_time, voted_after = vote(
+                        c, vote_percentage, voter, node_pool
+                    )
                     if vote_sucessfull:
                         print("Vote for %s at %s was sucessfully" % (author, str(vote_time)))
                         memberStorage.update_last_vote(author, vote_time)
@@ -398,7 +334,9 @@ def run():
                     postTrx.update_voted(author, created, vote_sucessfull, voted_after)
 
             print("rshares_sum %d" % rshares_sum)
-    confStorage.update({"last_cycle": datetime.now(timezone.utc)})
+    # Only a cycle run moves last_cycle, the daemon also runs this module between the cycles
+    if check_cycle:
+        confStorage.update({"last_cycle": datetime.now(timezone.utc)})
     print(f"upvote_post_comment script run {measure_execution_time(start_prep_time):.2f} s")
 
 
@@ -1,4 +1,3 @@
-import json
 from datetime import datetime, timedelta, timezone
 
 from nectar import Hive
@@ -93,13 +92,13 @@ def run():
     for acc_name in accounts:
         print(f"Processing account: {acc_name}")
         comments_transfer = []
-        ops = accountTrx[acc_name].get_all(op_types=["transfer"])
+        ops = accountTrx[acc_name].iter_all(op_types=["transfer"])
         cnt = 0
         for o in ops:
             cnt += 1
             if cnt % 10 == 0:
-                print(f"{cnt}/{len(ops)}")
-            op = json.loads(o["op_dict"])
+                print(f"{cnt}")
+            op = o.op
             if op["memo"] == "":
                 continue
             try:
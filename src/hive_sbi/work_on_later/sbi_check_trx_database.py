@@ -66,8 +66,10 @@ def run():
             accountTrx[account] = AccountTrx(db, account)
 
     for account_name in accountTrx:
-        data = accountTrx[account_name].get_all()
-        print(f"Account {account_name} has {len(data)} entries")
+        count = 0
+        for _ in accountTrx[account_name].iter_all():
+            count += 1
+        print(f"Account {account_name} has {count} entries")
 
     print(
         f"Transaction database check completed in {measure_execution_time(start_time):.2f} seconds"
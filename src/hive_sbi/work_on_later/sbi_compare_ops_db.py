@@ -50,34 +50,25 @@ def run():
             accountTrx[account].create_table()
     accountTrx["sbi"] = AccountTrx(db, "sbi")
 
-    ops1 = accountTrx["steembasicincome"].get_all(op_types=["transfer", "delegate_vesting_shares"])
-    ops2 = accountTrx["sbi"].get_all(op_types=["transfer", "delegate_vesting_shares"])
-
-    print(f"Operations loaded: steembasicincome: {len(ops1)}, sbi: {len(ops2)}")
+    # Only the history indexes are kept in memory, the rows are streamed
+    index1 = set()
+    for op in accountTrx["steembasicincome"].iter_all(
+        op_types=["transfer", "delegate_vesting_shares"]
+    ):
+        index1.add(op.op["index"])
+    index2 = set()
+    for op in accountTrx["sbi"].iter_all(op_types=["transfer", "delegate_vesting_shares"]):
+        index2.add(op.op["index"])
+
+    print(f"Operations loaded: steembasicincome: {len(index1)}, sbi: {len(index2)}")
 
     # Find missing operations in sbi
-    missing_ops_sbi = []
-    for op in ops1:
-        found = False
-        for op2 in ops2:
-            if op["index"] == op2["index"]:
-                found = True
-                break
-        if not found:
-            missing_ops_sbi.append(op)
+    missing_ops_sbi = index1 - index2
 
     print(f"Missing operations from sbi: {len(missing_ops_sbi)}")
 
     # Find missing operations in steembasicincome
-    missing_ops_steembasicincome = []
-    for op in ops2:
-        found = False
-        for op2 in ops1:
-            if op["index"] == op2["index"]:
-                found = True
-                break
-        if not found:
-            missing_ops_steembasicincome.append(op)
+    missing_ops_steembasicincome = index2 - index1
 
     print(f"Missing operations from steembasicincome: {len(missing_ops_steembasicincome)}")
 
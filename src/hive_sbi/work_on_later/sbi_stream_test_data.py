@@ -72,7 +72,7 @@ if __name__ == "__main__":
         # Go trough all transfer ops
         cnt = 0
         cnt = 0
-        ops = accountTrx[account_name].get_all()
+        ops = accountTrx[account_name].iter_all()
         last_op_index = -1
         for op in ops:
             if op["op_acc_index"] - last_op_index != 1:
@@ -88,7 +88,7 @@ if __name__ == "__main__":
         account = Account(account)
         print("account %s" % account["name"])
         cnt = 0
-        ops = accountTrx[account_name].get_all()
+        ops = accountTrx[account_name].iter_all()
         last_op_index = -1
         for op in ops:
             if op["op_acc_index"] - last_op_index != 1:
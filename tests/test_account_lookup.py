@@ -0,0 +1,105 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import dataset
+
+from hive_sbi.hsbi.account_lookup import AccountLookup, is_valid_account_name
+from hive_sbi.hsbi.memo_parser import MemoParser
+from hive_sbi.hsbi.storage import AccountExistsDB
+
+EXISTING = {"alice", "bob", "carol", "steembasicincome"}
+
+
+class FixedAccountLookup(AccountLookup):
+    """Answers the lookups from EXISTING instead of a node"""
+
+    def __init__(self, **kwargs):
+        super().__init__(blockchain_instance=object(), **kwargs)
+        self.fetched = []
+
+    def _fetch(self, names):
+        self.rpc_calls += 1
+        self.fetched.append(list(names))
+        return {name: name in EXISTING for name in names}
+
+
+class Testcases(unittest.TestCase):
+    def setUp(self):
+        self.db = dataset.connect("sqlite:///:memory:")
+        self.storage = AccountExistsDB(self.db)
+
+    def test_account_names(self):
+        for name in ["alice", "a-b.c-d", "sbi10", "steembasicincome"]:
+            self.assertTrue(is_valid_account_name(name))
+        for name in ["al", "1alice", "alice-", "ab.alice", "thisnameistoolong", "bob!", ""]:
+            self.assertFalse(is_valid_account_name(name))
+
+    def test_cached_lookups(self):
+        lookup = FixedAccountLookup(storage=self.storage, maxsize=2)
+        self.assertEqual(
+            lookup.lookup(["alice", "dave", "alice", "x!"]),
+            {"alice": True, "dave": False, "x!": False},
+        )
+        self.assertEqual(lookup.fetched, [["alice", "dave"]])
+        self.assertTrue(lookup.exists("alice"))
+        self.assertEqual(lookup.rpc_calls, 1)
+
+        # A new process finds the names in the database
+        lookup = FixedAccountLookup(storage=self.storage)
+        self.assertFalse(lookup.exists("dave"))
+        self.assertEqual(lookup.rpc_calls, 0)
+
+        # Missing accounts expire sooner, they may be created later
+        table = self.db[AccountExistsDB.__tablename__]
+        day_ago = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=1)
+        table.update({"name": "dave", "checked_at": day_ago}, ["name"])
+        table.update({"name": "alice", "checked_at": day_ago}, ["name"])
+        lookup = FixedAccountLookup(storage=self.storage)
+        lookup.lookup(["alice", "dave"])
+        self.assertEqual(lookup.fetched, [["dave"]])
+
+    def test_deferred_writes(self):
+        lookup = FixedAccountLookup(storage=self.storage, defer_writes=True)
+        lookup.lookup(["alice", "dave"])
+        # The lookup did not write, the names are written by flush
+        table = self.db[AccountExistsDB.__tablename__]
+        self.assertEqual(table.count(), 0)
+        self.assertTrue(lookup.exists("alice"))
+        lookup.flush()
+        self.assertEqual(table.count(), 2)
+        self.assertEqual(lookup.pending, {})
+        self.assertEqual(lookup.rpc_calls, 1)
+
+    def test_memo_parser_does_one_lookup(self):
+        lookup = FixedAccountLookup()
+        parser = MemoParser(blockchain_instance=object(), account_lookup=lookup)
+        self.assertEqual(
+            parser.parse_memo("@alice @bob! https://steemit.com/@carol", 3, "steembasicincome"),
+            ("steembasicincome", {"alice": 1, "bob": 1, "carol": 1}, [], False),
+        )
+        self.assertEqual(
+            parser.parse_memo("alice:bob 2", 2, "steembasicincome"),
+            ("alice", {"bob": 2}, [], False),
+        )
+        self.assertEqual(
+            parser.parse_memo("dave", 1, "steembasicincome"),
+            ("steembasicincome", {}, ["dave"], True),
+        )
+        # The names of the second memo were cached by the first one
+        self.assertEqual(lookup.rpc_calls, 2)
+        parser.parse_memo("@alice @bob", 2, "steembasicincome")
+        self.assertEqual(lookup.rpc_calls, 2)
+
+    def test_memo_parser_prefetch(self):
+        lookup = FixedAccountLookup()
+        parser = MemoParser(blockchain_instance=object(), account_lookup=lookup)
+        memos = ["@alice @bob", "alice:carol 2", "'dave'", "@alice"]
+        parser.prefetch(memos)
+        self.assertEqual(lookup.fetched, [["alice", "bob", "carol", "dave"]])
+        for memo in memos:
+            parser.parse_memo(memo, 2, "steembasicincome")
+        self.assertEqual(lookup.rpc_calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import random
+import unittest
+
+from nectar import Hive
+from nectar.amount import Amount
+
+from hive_sbi.hsbi.amount import (
+    HIVE_ASSETS,
+    amount_value,
+    asset_table,
+    format_amount,
+    parse_amount,
+)
+
+
+class Testcases(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.hv = Hive(offline=True)
+
+    def test_asset_table(self):
+        self.assertEqual(asset_table(self.hv), HIVE_ASSETS)
+
+    def test_matches_amount(self):
+        random.seed(15)
+        values = ["0.001 HIVE", "1.000 HBD", "-2.500 HIVE", "123456.789 HIVE", "1.000000 VESTS"]
+        for _ in range(200):
+            nai, precision = random.choice(
+                [("@@000000021", 3), ("@@000000013", 3), ("@@000000037", 6)]
+            )
+            satoshis = random.randint(0, 10**12)
+            values.append({"amount": str(satoshis), "precision": precision, "nai": nai})
+            values.append([str(satoshis), precision, nai])
+            values.append(str(Amount(values[-2], blockchain_instance=self.hv)))
+        for value in values:
+            amount = Amount(value, blockchain_instance=self.hv)
+            satoshis, symbol = parse_amount(value)
+            self.assertEqual(symbol, amount.symbol)
+            self.assertEqual(amount_value(satoshis, symbol), amount.amount)
+            self.assertEqual(float(amount_value(satoshis, symbol)), float(amount))
+            self.assertEqual(format_amount(satoshis, symbol), str(amount))
+
+    def test_invalid(self):
+        for value in ["1.000 ABC", "1.0001 HIVE", {"amount": "1", "nai": "@@1", "precision": 3}, 1]:
+            with self.assertRaises(ValueError):
+                parse_amount(value)
+
+
+if __name__ == "__main__":
+    unittest.main()
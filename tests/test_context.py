@@ -0,0 +1,45 @@
+import contextlib
+import io
+import unittest
+
+from hive_sbi.hsbi.context import HsbiContext
+
+
+class Testcases(unittest.TestCase):
+    def setUp(self):
+        self.ctx = HsbiContext(
+            config_data={
+                "databaseConnector": "sqlite:///:memory:",
+                "databaseConnector2": "sqlite:///:memory:",
+                "accounts": ["steembasicincome"],
+                "other_accounts": ["sbi2"],
+            }
+        )
+        # init_database prints the state of every table
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.ctx.init_database()
+
+    def test_setup_is_shared(self):
+        db, db2 = self.ctx.db, self.ctx.db2
+        storage = self.ctx.storage
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.ctx.init_database()
+        self.assertEqual(out.getvalue(), "")
+        self.assertIs(self.ctx.db, db)
+        self.assertIs(self.ctx.db2, db2)
+        self.assertIs(self.ctx.storage, storage)
+        self.assertIs(storage["memberStorage"].db, db2)
+        self.assertEqual(storage["accounts"], ["steembasicincome"])
+        self.assertEqual(storage["other_accounts"], ["sbi2"])
+
+    def test_refresh(self):
+        storage = self.ctx.storage
+        self.assertEqual(storage["conf_setup"]["share_cycle_min"], 144)
+        storage["confStorage"].update({"share_cycle_min": 100})
+        self.assertEqual(storage["conf_setup"]["share_cycle_min"], 144)
+        self.assertIs(self.ctx.refresh(), storage)
+        self.assertEqual(storage["conf_setup"]["share_cycle_min"], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from hive_sbi.hsbi.context import HsbiContext
+from hive_sbi.hsbi.daemon import Daemon
+
+
+class RecordingDaemon(Daemon):
+    def __init__(self, ctx, fail=False, **kwargs):
+        super().__init__(ctx, **kwargs)
+        self.runs = []
+        self.fail = fail
+
+    def run_cycle(self):
+        self.runs.append("cycle")
+        if self.fail:
+            raise ConnectionError("node down")
+        self.ctx.storage["confStorage"].update({"last_cycle": datetime.now(timezone.utc)})
+
+    def run_stream(self):
+        self.runs.append("stream")
+
+
+class Testcases(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        node_cache_file = os.path.join(self.tmp.name, "node_cache.json")
+        with open(node_cache_file, "w") as f:
+            json.dump({"updated": time.time(), "nodes": ["https://api.a"]}, f)
+        self.ctx = HsbiContext(
+            config_data={
+                "databaseConnector": "sqlite:///:memory:",
+                "databaseConnector2": "sqlite:///:memory:",
+                "node_cache_file": node_cache_file,
+                "cycle_stamp_file": os.path.join(self.tmp.name, "cycle_stamp.json"),
+            }
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.ctx.init_database()
+        self.confStorage = self.ctx.storage["confStorage"]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def set_last_cycle(self, minutes_ago):
+        last_cycle = datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)
+        self.confStorage.update({"last_cycle": last_cycle, "share_cycle_min": 144})
+
+    def test_sleeps_until_next_run(self):
+        self.set_last_cycle(140)
+        daemon = RecordingDaemon(self.ctx, stream_minutes=2, max_sleep_minutes=60)
+        self.assertEqual(daemon.step(now=1000), 2 * 60)
+        self.assertEqual(daemon.runs, ["stream"])
+        self.assertEqual(daemon.step(now=1060), 60)
+        self.assertEqual(daemon.runs, ["stream"])
+
+        daemon.stream_minutes = 10
+        self.assertAlmostEqual(daemon.step(now=1200), 4 * 60, delta=5)
+        self.assertEqual(daemon.runs, ["stream", "stream"])
+
+        # The due cycle runs before the stream modules
+        self.set_last_cycle(145)
+        self.assertEqual(daemon.step(now=1900), 0)
+        self.assertEqual(daemon.runs, ["stream", "stream", "cycle"])
+        self.assertAlmostEqual(daemon.step(now=1900), 10 * 60, delta=1)
+        self.assertEqual(daemon.runs, ["stream", "stream", "cycle", "stream"])
+
+    def test_failed_cycle_is_retried_later(self):
+        self.set_last_cycle(150)
+        daemon = RecordingDaemon(self.ctx, fail=True, stream_minutes=5, retry_minutes=10)
+        self.assertEqual(daemon.step(now=1000), 0)
+        self.assertEqual(daemon.runs, ["cycle"])
+        self.assertEqual(daemon.step(now=1000), 5 * 60)
+        self.assertEqual(daemon.runs, ["cycle", "stream"])
+        daemon.step(now=1600)
+        self.assertEqual(daemon.runs, ["cycle", "stream", "cycle"])
+
+    def test_stream_run_keeps_last_cycle(self):
+        calls = []
+
+        def upvote_run(ctx=None, check_cycle=True):
+            # Like sbi_upvote_post_comment, which also updates the configuration
+            calls.append(check_cycle)
+            confStorage = ctx.storage["confStorage"]
+            confStorage.update({"minimum_vote_threshold": 5})
+            if check_cycle:
+                confStorage.update({"last_cycle": datetime.now(timezone.utc)})
+
+        self.set_last_cycle(140)
+        daemon = Daemon(self.ctx, stream_minutes=10)
+        with (
+            mock.patch("hive_sbi.sbi_upvote_post_comment.run", upvote_run),
+            mock.patch("hive_sbi.sbi_stream_post_comment.run", lambda ctx, check_cycle: None),
+            contextlib.redirect_stdout(io.StringIO()),
+        ):
+            # The next cycle stays 4 min away, not share_cycle_min after the stream run
+            self.assertAlmostEqual(daemon.step(now=1000), 4 * 60, delta=5)
+            self.assertEqual(calls, [False])
+            self.assertAlmostEqual(daemon.step(now=1600), 4 * 60, delta=5)
+            self.assertEqual(calls, [False, False])
+
+        # 5 min later the cycle is due and starts
+        conf_setup = self.ctx.refresh()["conf_setup"]
+        self.assertEqual(conf_setup["minimum_vote_threshold"], 5)
+        self.set_last_cycle(145)
+        with mock.patch.object(daemon, "run_cycle") as run_cycle:
+            daemon.step(now=1900)
+        run_cycle.assert_called_once()
+
+    def test_stop_during_cycle(self):
+        daemon = Daemon(self.ctx)
+        started = []
+
+        def run_module(module, ctx):
+            started.append(module)
+            if module == "transfer":
+                # SIGTERM while the module runs
+                daemon.stop()
+
+        with mock.patch("hive_sbi.hsbi.runner.run_module", run_module):
+            daemon.run_cycle()
+        self.assertEqual(started, ["store_ops_db", "transfer"])
+
+
+if __name__ == "__main__":
+    unittest.main()
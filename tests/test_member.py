@@ -0,0 +1,110 @@
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from hive_sbi.hsbi import member as member_module
+from hive_sbi.hsbi.member import Member, ShareAgeIndex, ShareAgeStore, calc_share_ages
+
+
+class Testcases(unittest.TestCase):
+    def setUp(self):
+        self.now = datetime(2024, 6, 1, tzinfo=timezone.utc)
+        self.store = ShareAgeStore()
+        self.member_data = {}
+        for n, account in enumerate(["alice", "bob", "carol"]):
+            member = Member(account, store=self.store)
+            for days in range(n + 1):
+                member.append_share_age(self.now - timedelta(days=10 * days + 1), days + 1)
+            self.member_data[account] = member
+        # A naive timestamp is taken as UTC and zero shares are skipped
+        self.member_data["alice"].append_share_age(datetime(2024, 5, 1), 2)
+        self.member_data["bob"].append_share_age(self.now, 0)
+
+    def test_calc_share_ages(self):
+        calc_share_ages(self.member_data, now=self.now)
+        self.assertEqual(self.member_data["alice"]["total_share_days"], 1 + 31 * 2)
+        self.assertEqual(self.member_data["alice"]["avg_share_age"], (1 + 31 * 2) / 3)
+        self.assertEqual(self.member_data["bob"].shares_list, [1, 2])
+        self.assertEqual(self.member_data["bob"].share_age_list, [1, 11])
+        self.assertEqual(self.member_data["carol"]["total_share_days"], 1 + 11 * 2 + 21 * 3)
+        for account in self.member_data:
+            member = self.member_data[account]
+            expected = dict(member)
+            member.calc_share_age(now=self.now)
+            self.assertEqual(dict(member), expected)
+
+    def test_reset_and_until(self):
+        carol = self.member_data["carol"]
+        carol.calc_share_age_until(self.now - timedelta(days=5), now=self.now)
+        self.assertEqual(carol["total_share_days"], 11 * 2 + 21 * 3)
+        self.assertEqual(carol["avg_share_age"], (11 * 2 + 21 * 3) / 2)
+
+        self.member_data["bob"].reset_share_age_list()
+        self.assertEqual(self.member_data["bob"].shares_list, [])
+        self.member_data["bob"].append_share_age(self.now, 5)
+        calc_share_ages(self.member_data, now=self.now)
+        self.assertEqual(self.member_data["bob"]["total_share_days"], 0)
+        self.assertEqual(self.member_data["bob"].share_timestamp, [self.now])
+        self.assertEqual(carol.shares_list, [1, 2, 3])
+
+    def test_reset_does_not_grow_store(self):
+        # Like the daemon, which loads the members into the same store every cycle
+        for _ in range(50):
+            for account in ["alice", "bob", "carol"]:
+                member = Member(account, store=self.store)
+                member.append_share_age(self.now - timedelta(days=3), 2)
+                member.append_share_age(self.now - timedelta(days=1), 1)
+                self.member_data[account] = member
+        self.assertLessEqual(len(self.store.member), 12)
+        self.assertLessEqual(self.store.slot_count, 6)
+        calc_share_ages(self.member_data, now=self.now)
+        for member in self.member_data.values():
+            self.assertEqual(member.shares_list, [2, 1])
+            self.assertEqual(member["total_share_days"], 3 * 2 + 1)
+
+    @unittest.skipIf(member_module.np is None, "numpy is not installed")
+    def test_numpy_share_days_match_loop(self):
+        random.seed(10)
+        for n in range(200):
+            member = Member(f"member{n}", store=self.store)
+            for _ in range(random.randint(0, 5)):
+                seconds = random.randint(-86400, 86400 * 1000)
+                member.append_share_age(
+                    self.now - timedelta(seconds=seconds), random.randint(1, 50)
+                )
+        self.store.reset("member7")
+        vectorized = self.store.share_days(self.now)
+        with mock.patch.object(member_module, "np", None):
+            self.assertEqual(self.store.share_days(self.now), vectorized)
+
+    def test_share_age_index_matches_scan(self):
+        for n in range(20):
+            member = Member(f"member{n}", store=self.store)
+            member.append_share_age(self.now - timedelta(days=n % 7), 1)
+            self.member_data[member["account"]] = member
+        index = ShareAgeIndex(self.member_data, now=self.now)
+        selected = []
+        while True:
+            # The scan of all members, ties go to the first member
+            expected = None
+            max_avg_share_age = 0
+            for m in self.member_data:
+                if max_avg_share_age < self.member_data[m]["avg_share_age"]:
+                    max_avg_share_age = self.member_data[m]["avg_share_age"]
+                    expected = m
+            account = index.highest()
+            self.assertEqual(account, expected)
+            if account is None:
+                break
+            selected.append(account)
+            index.set(account, 0)
+            if account == "bob" and selected.count("bob") == 1:
+                self.member_data["bob"].append_share_age(self.now - timedelta(days=3), 1)
+                index.update("bob", now=self.now)
+        self.assertEqual(selected[:3], ["alice", "carol", "bob"])
+        self.assertEqual(selected.count("bob"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+import dataset
+
+from hive_sbi.hsbi.member_index import MemberIndex, drop_shared
+from hive_sbi.hsbi.storage import MemberDB
+
+
+class Testcases(unittest.TestCase):
+    def setUp(self):
+        self.db = dataset.connect("sqlite:///:memory:")
+        self.memberStorage = MemberDB(self.db)
+        for account in ["alice", "bob"]:
+            self.memberStorage.add({"account": account, "shares": 1})
+
+    def tearDown(self):
+        drop_shared(self.db)
+
+    def test_shared_index_follows_member_table(self):
+        index = MemberIndex.shared(self.memberStorage)
+        self.assertIs(MemberIndex.shared(MemberDB(self.db)), index)
+        self.assertEqual(list(index), ["alice", "bob"])
+        self.assertIn("alice", index)
+        self.assertNotIn("carol", index)
+
+        changes = []
+        index.subscribe(lambda added, removed: changes.append((added, removed)))
+        self.memberStorage.add_batch(
+            [{"account": "carol", "shares": 1}, {"account": "alice", "shares": 2}]
+        )
+        self.memberStorage.delete("bob")
+        self.memberStorage.update({"account": "alice", "shares": 3})
+        self.assertEqual(list(index), ["alice", "carol"])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(changes, [(["carol"], []), ([], ["bob"])])
+        self.assertEqual(sorted(self.memberStorage.get_all_accounts()), list(index))
+
+    def test_update_while_iterating(self):
+        index = MemberIndex(f"member{n}" for n in range(5000))
+        # Like sbi_build_member_db, which deletes the members one at a time
+        for account in index:
+            self.assertTrue(index.update(removed=[account]))
+        self.assertEqual(len(index), 0)
+        self.assertFalse(index.update(removed=["member1"]))
+
+        index.update(added=["alice", "bob", "carol"])
+        self.assertTrue(index.update(added=["bob", "dave"], removed=["bob"]))
+        self.assertEqual(list(index), ["alice", "carol", "bob", "dave"])
+        self.assertFalse(index.update(added=["alice"]))
+
+    def test_other_database_has_own_index(self):
+        db = dataset.connect("sqlite:///:memory:")
+        MemberDB(db).add({"account": "dave", "shares": 1})
+        self.assertEqual(list(MemberIndex.shared(MemberDB(db))), ["dave"])
+        self.assertEqual(list(MemberIndex.shared(self.memberStorage)), ["alice", "bob"])
+        drop_shared(db)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import json
+import unittest
+from datetime import datetime
+
+import dataset
+
+from hive_sbi.hsbi.member_ledger import (
+    apply_share_entries,
+    apply_share_state,
+    compare_members,
+    load_share_state,
+    rebuild_ledger,
+    replay_trx,
+    sync_ledger,
+    update_share_state,
+)
+from hive_sbi.hsbi.storage import IngestCursorDB, MemberShareLedgerDB, MemberShareStateDB, TrxDB
+
+MGNT_SHARES = {"boss": 4, "holger": 1}
+
+
+def trx_row(index, source, sponsor, shares, sponsee=None, share_type="Standard", vests=0.0):
+    return {
+        "index": index,
+        "source": source,
+        "memo": "",
+        "account": sponsor,
+        "sponsor": sponsor,
+        "sponsee": json.dumps(sponsee or {}),
+        "shares": shares,
+        "vests": vests,
+        "timestamp": datetime(2024, 1, 1 + index % 28, index % 24),
+        "status": "Valid",
+        "share_type": share_type,
+    }
+
+
+class Testcases(unittest.TestCase):
+    def setUp(self):
+        self.db = dataset.connect("sqlite:///:memory:")
+        self.trxStorage = TrxDB(self.db)
+        self.ledgerStorage = MemberShareLedgerDB(self.db)
+        self.ledgerStorage.create_table()
+        self.cursorStorage = IngestCursorDB(self.db)
+        self.cursorStorage.create_table()
+        self.stateStorage = MemberShareStateDB(self.db)
+        self.stateStorage.create_table()
+        self.add_rows(
+            [
+                trx_row(3, "sbi2", "alice", 2),
+                trx_row(0, "mgmt", "boss", 4, share_type="Mgmt"),
+                trx_row(1, "sbi", "alice", 5, {"bob": 2, "carol": 1}),
+                trx_row(2, "sbi", "boss", 3),
+                trx_row(4, "sbi", "dave", 0, share_type="Delegation", vests=1000.0),
+                trx_row(5, "sbi", "erin", 7, share_type="ShareTransfer"),
+                dict(trx_row(6, "sbi", "frank", 9), status="Refunded"),
+                trx_row(7, "sbi", "bob", 1, {"alice": 1}),
+            ]
+        )
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.trxStorage.add(row)
+
+    def replayed(self):
+        member_data = {}
+        delegation = replay_trx(member_data, self.trxStorage.get_all_data_sorted(), MGNT_SHARES)
+        return member_data, delegation
+
+    def from_ledger(self):
+        member_data = {}
+        apply_share_entries(member_data, self.ledgerStorage.get_all(), MGNT_SHARES)
+        return member_data
+
+    def update_state(self, **hooks):
+        sync_ledger(self.trxStorage, self.ledgerStorage, self.cursorStorage)
+        states = load_share_state(self.stateStorage)
+        count = update_share_state(
+            states,
+            self.trxStorage,
+            self.ledgerStorage,
+            self.stateStorage,
+            self.cursorStorage,
+            MGNT_SHARES,
+            **hooks,
+        )
+        return count
+
+    def from_state(self):
+        member_data = {}
+        apply_share_state(member_data, load_share_state(self.stateStorage))
+        return member_data
+
+    def test_ledger_matches_replay(self):
+        self.assertEqual(sync_ledger(self.trxStorage, self.ledgerStorage, self.cursorStorage), 8)
+        member_data, delegation = self.replayed()
+        self.assertEqual(member_data["alice"]["shares"], 8)
+        self.assertEqual(member_data["boss"]["shares"], 7)
+        self.assertNotIn("frank", member_data)
+        self.assertNotIn("erin", member_data)
+        self.assertEqual(delegation[0], {"dave": 1000.0})
+        self.assertEqual(compare_members(self.from_ledger(), member_data), [])
+
+    def test_only_new_trx_are_synced(self):
+        sync_ledger(self.trxStorage, self.ledgerStorage, self.cursorStorage)
+        self.add_rows([trx_row(8, "sbi", "carol", 4), trx_row(0, "sbi3", "gina", 1)])
+        self.assertEqual(
+            sync_ledger(self.trxStorage, self.ledgerStorage, self.cursorStorage, chunk_size=1), 2
+        )
+        self.assertEqual(sync_ledger(self.trxStorage, self.ledgerStorage, self.cursorStorage), 0)
+        member_data, _ = self.replayed()
+        self.assertEqual(member_data["carol"]["shares"], 5)
+        self.assertEqual(compare_members(self.from_ledger(), member_data), [])
+
+    def test_changed_trx_are_detected_and_rebuilt(self):
+        sync_ledger(self.trxStorage, self.ledgerStorage, self.cursorStorage)
+        self.db["trx"].update(
+            {"index": 1, "source": "sbi", "status": "Refunded"}, ["index", "source"]
+        )
+        member_data, _ = self.replayed()
+        self.assertEqual(
+            compare_members(self.from_ledger(), member_data), ["alice", "bob", "carol"]
+        )
+        rebuild_ledger(self.trxStorage, self.ledgerStorage, self.cursorStorage)
+        self.assertEqual(compare_members(self.from_ledger(), member_data), [])
+
+    def test_state_matches_replay(self):
+        self.assertEqual(self.update_state(), 8)
+        member_data, _ = self.replayed()
+        self.assertEqual(self.from_state()["boss"]["shares"], 7)
+        self.assertEqual(compare_members(self.from_state(), member_data), [])
+        self.assertEqual(self.update_state(), 0)
+        self.assertEqual(compare_members(self.from_state(), member_data), [])
+
+    def test_only_new_entries_are_applied(self):
+        self.update_state()
+        self.add_rows(
+            [
+                trx_row(8, "sbi", "carol", 4, {"hank": 2, "bob": 1}),
+                trx_row(9, "mgmt", "boss", 4, share_type="Mgmt"),
+                # Sorts before the entries alice already got
+                trx_row(0, "sbi3", "alice", 1),
+            ]
+        )
+        calls = []
+        count = self.update_state(
+            on_sponsoring=lambda s, sponsor: calls.append((s, sponsor)),
+            on_sponsoring_update=lambda s, sponsor, shares: calls.append((s, sponsor, shares)),
+        )
+        self.assertEqual(count, 5)
+        self.assertEqual(calls, [("hank", "carol"), ("bob", "carol", 4)])
+        member_data, _ = self.replayed()
+        self.assertEqual(compare_members(self.from_state(), member_data), [])
+
+    def test_changed_trx_update_the_state(self):
+        self.update_state()
+        self.trxStorage.update_sponsee_index(1, "sbi", json.dumps({"bob": 3}), "Valid")
+        self.trxStorage.update_sponsor_index(2, "sbi", "boss", "Refunded")
+        self.trxStorage.delete(7, "sbi")
+        self.assertEqual(self.update_state(), 0)
+        member_data, _ = self.replayed()
+        self.assertEqual(member_data["bob"]["shares"], 3)
+        self.assertNotIn("carol", member_data)
+        self.assertEqual(compare_members(self.from_state(), member_data), [])
+        self.assertEqual(self.db["trx_change"].count(), 0)
+
+    def test_rebuilt_ledger_rebuilds_the_state(self):
+        self.update_state()
+        rebuild_ledger(self.trxStorage, self.ledgerStorage, self.cursorStorage)
+        self.assertEqual(self.update_state(), 8)
+        member_data, _ = self.replayed()
+        self.assertEqual(compare_members(self.from_state(), member_data), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
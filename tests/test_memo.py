@@ -1,6 +1,28 @@
 import unittest
 
-from hive_sbi.hsbi.memo_parser import MemoParser
+from nectar.exceptions import MissingKeyError
+from nectarbase import memo as BtsMemo
+from nectargraphenebase.account import PrivateKey
+
+from hive_sbi.hsbi.memo_decryptor import MemoDecryptor
+from hive_sbi.hsbi.memo_parser import MemoParser, tokenize
+
+
+class KeyWallet:
+    def __init__(self, keys):
+        self.keys = {str(key.pubkey): str(key) for key in keys}
+
+    def getPrivateKeyForPublicKey(self, pub):
+        if pub not in self.keys:
+            raise MissingKeyError
+        return self.keys[pub]
+
+
+class WalletHive:
+    prefix = "STM"
+
+    def __init__(self, keys):
+        self.wallet = KeyWallet(keys)
 
 
 class Testcases(unittest.TestCase):
@@ -205,3 +227,69 @@ class Testcases(unittest.TestCase):
             },
         )
         self.assertFalse(account_error)
+
+    def test_tokenize(self):
+        words = "3 for @bob! x2 https://steemit.com/@'carol' @alice:@bob hi@dave. it's ab".split(
+            " "
+        )
+        tokens = tokenize(words, ["for"])
+        self.assertEqual(
+            [(token.kind, token.names, token.number) for token in tokens],
+            [
+                ("number", (), 3),
+                ("filler", (), None),
+                ("account", ("bob",), None),
+                ("number", (), 2),
+                ("url_account", ("carol",), None),
+                ("pair", ("alice", "bob"), None),
+                ("embedded_account", ("dave",), None),
+                ("word", ("it's",), None),
+                ("skip", (), None),
+            ],
+        )
+
+    def test_memo_decryptor(self):
+        sbi = PrivateKey()
+        others = [PrivateKey(), PrivateKey()]
+        memos = []
+        for n in range(6):
+            other = others[n % 2]
+            message = f"#memo {n}"
+            if n < 3:
+                memos.append(BtsMemo.encode_memo(sbi, other.pubkey, str(n + 1), message))
+            else:
+                memos.append(BtsMemo.encode_memo(other, sbi.pubkey, str(n + 1), message))
+        decryptor = MemoDecryptor(blockchain_instance=WalletHive([sbi]))
+        expected = [BtsMemo.decode_memo(sbi, memo) for memo in memos]
+        self.assertEqual([decryptor.decrypt("a", "b", memo) for memo in memos], expected)
+        self.assertEqual(len(decryptor.secrets), 2)
+
+        decryptor = MemoDecryptor(blockchain_instance=WalletHive([sbi]))
+        result = decryptor.decrypt_batch([("a", "b", memo) for memo in memos])
+        self.assertEqual([result[memo] for memo in memos], expected)
+        self.assertEqual(len(decryptor.secrets), 2)
+        self.assertEqual(decryptor.decrypt("a", "b", memos[0]), expected[0])
+
+        decryptor = MemoDecryptor(blockchain_instance=WalletHive([]))
+        self.assertEqual(decryptor.decrypt_batch([("a", "b", memos[0])]), {})
+        with self.assertRaises(MissingKeyError):
+            decryptor.decrypt("a", "b", memos[0])
+
+    def test_memo_decryptor_matches_nectar(self):
+        # decode_memo repeats the steps of nectar's decode_memo, for all padding and varint lengths
+        sbi, other = PrivateKey(), PrivateKey()
+        memos = [
+            BtsMemo.encode_memo(other, sbi.pubkey, str(n + 1), "#" + "x" * length)
+            for n, length in enumerate([0, 1, 14, 15, 16, 17, 31, 126, 127, 128, 300])
+        ]
+        expected = [BtsMemo.decode_memo(sbi, memo) for memo in memos]
+        with MemoDecryptor(blockchain_instance=WalletHive([sbi]), processes=2) as decryptor:
+            result = decryptor.decrypt_batch([("a", "b", memo) for memo in memos])
+            self.assertEqual([result[memo] for memo in memos], expected)
+            pool = decryptor.pool()
+            # Another sender, its secret is derived in the same pool
+            others = [PrivateKey(), PrivateKey()]
+            memos = [BtsMemo.encode_memo(o, sbi.pubkey, "1", "#memo") for o in others]
+            self.assertEqual(len(decryptor.decrypt_batch([("a", "b", m) for m in memos])), 2)
+            self.assertIs(decryptor.pool(), pool)
+        self.assertIsNone(decryptor._pool)
@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from nectar.exceptions import ContentDoesNotExistsException
+
+from hive_sbi.hsbi.node_pool import NodePool, NodeSemaphores, RetryPolicy
+
+NODES = ["https://api.a", "https://api.b", "https://api.c"]
+
+
+class RPC:
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.url = nodes[0]
+
+    def next(self):
+        self.url = self.nodes[(self.nodes.index(self.url) + 1) % len(self.nodes)]
+
+
+class Client:
+    def __init__(self, nodes):
+        self.rpc = RPC(nodes)
+
+
+class Testcases(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmp.name, "node_cache.json")
+        with open(self.cache_file, "w") as f:
+            json.dump({"updated": time.time(), "nodes": NODES}, f)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_retry_policy(self):
+        policy = RetryPolicy(tries=4, delay=0.5, factor=3, max_delay=2)
+        self.assertEqual(policy.delays(), [0.5, 1.5, 2])
+
+        policy = RetryPolicy(tries=3, delay=0)
+        calls = []
+
+        def fail_twice():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ValueError("node error")
+            return "ok"
+
+        errors = []
+        self.assertEqual(policy.call(fail_twice, on_error=errors.append), "ok")
+        self.assertEqual(len(errors), 2)
+
+        def fail():
+            calls.append(1)
+            raise ValueError("node error")
+
+        calls.clear()
+        with self.assertRaises(ValueError):
+            policy.call(fail)
+        self.assertEqual(len(calls), 3)
+
+        def missing():
+            calls.append(1)
+            raise ContentDoesNotExistsException("@a/b")
+
+        calls.clear()
+        with self.assertRaises(ContentDoesNotExistsException):
+            policy.call(missing)
+        self.assertEqual(len(calls), 1)
+
+    def test_nodes_ordered_by_health(self):
+        pool = NodePool(cache_file=self.cache_file)
+        self.assertEqual(pool.nodes(), NODES)
+        pool.record("https://api.c", latency=0.1)
+        pool.record("https://api.b", latency=0.5)
+        self.assertEqual(pool.nodes(), ["https://api.c", "https://api.b", "https://api.a"])
+        for _ in range(5):
+            pool.record("https://api.c", error=True)
+        self.assertEqual(pool.nodes(), ["https://api.b", "https://api.a", "https://api.c"])
+
+        pool.record("https://api.b", latency=1.5)
+        self.assertAlmostEqual(pool.stats["https://api.b"]["latency"], 0.2 * 1.5 + 0.8 * 0.5)
+
+        # The statistics are kept in the cache file, the node list is not updated again
+        pool.save()
+        cached = NodePool(cache_file=self.cache_file)
+        self.assertEqual(cached.updated, pool.updated)
+        self.assertEqual(cached.nodes(), pool.nodes())
+
+    def test_call_switches_node(self):
+        pool = NodePool(cache_file=self.cache_file, retry=RetryPolicy(tries=3, delay=0))
+        hv = Client(NODES)
+
+        def get():
+            if hv.rpc.url == "https://api.a":
+                raise ConnectionError("node down")
+            return hv.rpc.url
+
+        self.assertEqual(pool.call(hv, get), "https://api.b")
+        self.assertGreater(pool.stats["https://api.a"]["errors"], 0)
+        self.assertIsNotNone(pool.stats["https://api.b"]["latency"])
+        self.assertEqual(pool.nodes()[0], "https://api.b")
+
+    def test_node_semaphores(self):
+        semaphores = NodeSemaphores(NODES, 1)
+        self.assertIs(semaphores.get("https://api.a"), semaphores.get("https://api.a"))
+        # A node missing from the list is capped as well
+        node = semaphores.get("https://api.d")
+        self.assertIs(semaphores.get("https://api.d"), node)
+        self.assertTrue(node.acquire(blocking=False))
+        self.assertFalse(semaphores.get("https://api.d").acquire(blocking=False))
+        node.release()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from hive_sbi.hsbi.cycle import read_cycle_stamp, write_cycle_stamp
+from hive_sbi.hsbi.runner import cycle_not_due
+
+
+class Testcases(unittest.TestCase):
+    def test_cycle_stamp(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            stamp_file = os.path.join(tmp, "cycle_stamp.json")
+            config_data = {"cycle_stamp_file": stamp_file}
+            self.assertIsNone(read_cycle_stamp(stamp_file))
+            self.assertFalse(cycle_not_due(config_data))
+
+            last_cycle = datetime.now(timezone.utc) - timedelta(minutes=100)
+            write_cycle_stamp({"last_cycle": last_cycle, "share_cycle_min": 144}, stamp_file)
+            self.assertAlmostEqual(read_cycle_stamp(stamp_file), 44, delta=0.1)
+            self.assertTrue(cycle_not_due(config_data))
+
+            # A due cycle and an old stamp go on to the database
+            write_cycle_stamp({"last_cycle": None, "share_cycle_min": 144}, stamp_file)
+            self.assertFalse(cycle_not_due(config_data))
+            with open(stamp_file, "w") as f:
+                json.dump({"next_cycle": time.time() + 3600, "checked": time.time() - 900}, f)
+            self.assertIsNone(read_cycle_stamp(stamp_file, max_age_minutes=10))
+            self.assertFalse(cycle_not_due(config_data))
+
+    def test_runner_import_is_light(self):
+        # The runner module must not import dataset or nectar, see main
+        code = "import sys, hive_sbi.hsbi.runner; print(sorted({'dataset', 'nectar'} & set(sys.modules)))"
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        self.assertEqual(result.stdout.strip(), "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import unittest
+from datetime import datetime, timezone
+
+import dataset
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from hive_sbi.hsbi.member import Member, ShareAgeStore
+from hive_sbi.hsbi.storage import (
+    IngestCursorDB,
+    MemberDB,
+    MemoExclusionDB,
+    TransactionMemoDB,
+    TrxDB,
+    WriteBuffer,
+    bulk_upsert,
+)
+
+
+def trx_row(index, account="alice", shares=1, share_type="Standard"):
+    return {
+        "index": index,
+        "source": "hivesbincome",
+        "memo": "",
+        "account": account,
+        "sponsor": account,
+        "sponsee": "{}",
+        "shares": shares,
+        "vests": 0.0,
+        "timestamp": "2024-01-01T00:00:%02d" % index,
+        "status": "Valid",
+        "share_type": share_type,
+    }
+
+
+class Testcases(unittest.TestCase):
+    def setUp(self):
+        self.db = dataset.connect("sqlite:///:memory:")
+        self.trxStorage = TrxDB(self.db)
+        self.transactionStorage = TransactionMemoDB(self.db)
+        # create the table and its columns outside of the buffered transaction
+        self.trxStorage.add(trx_row(0))
+
+    def test_write_buffer_commits_all_rows(self):
+        with WriteBuffer(self.transactionStorage, self.trxStorage):
+            for i in range(1, 6):
+                self.trxStorage.add(trx_row(i))
+            self.transactionStorage.add({"index": 1, "sender": "bob", "memo": ""})
+        self.assertIsNone(self.trxStorage.writer)
+        self.assertEqual(len(self.trxStorage.get_all_op_index("hivesbincome")), 6)
+        self.assertEqual(len(self.transactionStorage.get_sender("bob")), 1)
+
+    def test_write_buffer_rolls_back_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with WriteBuffer(self.trxStorage):
+                self.trxStorage.add(trx_row(1))
+                self.trxStorage.flush_writer()
+                self.trxStorage.add(trx_row(2))
+                raise RuntimeError("crash while parsing")
+        self.assertEqual(self.trxStorage.get_all_op_index("hivesbincome"), [0])
+
+    def test_write_buffer_reads_own_rows(self):
+        with WriteBuffer(self.trxStorage):
+            self.trxStorage.add(trx_row(1, account="bob", shares=-5, share_type="SBD"))
+            trx = self.trxStorage.get_SBD_transfer("bob", 5, "2024-01-02T00:00:00")
+        self.assertIsNotNone(trx)
+        self.assertEqual(trx["index"], 1)
+
+    def test_cursor_is_rolled_back_with_the_rows(self):
+        cursorStorage = IngestCursorDB(self.db)
+        cursorStorage.create_table()
+        cursorStorage.set("transfer", "hivesbincome", {"op_acc_index": 0})
+        with self.assertRaises(RuntimeError):
+            with WriteBuffer(self.trxStorage):
+                self.trxStorage.add(trx_row(1))
+                cursorStorage.set("transfer", "hivesbincome", {"op_acc_index": 1})
+                raise RuntimeError("crash while parsing")
+        self.assertEqual(cursorStorage.get("transfer", "hivesbincome")["op_acc_index"], 0)
+        with WriteBuffer(self.trxStorage):
+            self.trxStorage.add(trx_row(1))
+            cursorStorage.set("transfer", "hivesbincome", {"op_acc_index": 1})
+        self.assertEqual(cursorStorage.get("transfer", "hivesbincome")["op_acc_index"], 1)
+        self.assertEqual(self.trxStorage.get_latest_op_index("hivesbincome")["index"], 1)
+        self.assertIsNone(cursorStorage.get("store_ops_db", "hivesbincome"))
+
+    def test_cursor_key_is_unique(self):
+        cursorStorage = IngestCursorDB(self.db)
+        cursorStorage.create_table()
+        cursorStorage.create_table()
+        cursorStorage.set("transfer", "hivesbincome", {"op_acc_index": 0})
+        cursorStorage.set("transfer", "hivesbincome", {"op_acc_index": 1})
+        cursorStorage.set("transfer", "sbi2", {"op_acc_index": 0})
+        table = self.db[IngestCursorDB.__tablename__]
+        self.assertEqual(table.count(module="transfer", account="hivesbincome"), 1)
+        self.assertEqual(cursorStorage.get("transfer", "hivesbincome")["op_acc_index"], 1)
+        with self.assertRaises(IntegrityError):
+            table.insert({"module": "transfer", "account": "sbi2", "op_acc_index": 2})
+        self.assertEqual(table.count(), 2)
+
+    def test_delete_excluded_transfers(self):
+        exclusionStorage = MemoExclusionDB(self.db)
+        exclusionStorage.create_table()
+        exclusionStorage.add("bob", "sender")
+        exclusionStorage.delete("sbi10", "to")
+        exclusions = exclusionStorage.get()
+        self.assertEqual(exclusions["sender"], {"dtube.rewards", "reward.app", "bob"})
+        self.assertEqual(exclusions["to"], {"sbi%d" % i for i in range(2, 10)})
+
+        for i, (sender, to) in enumerate(
+            [("bob", "hivesbi1"), ("alice", "sbi3"), ("alice", "sbi10"), ("carol", "hivesbi1")]
+        ):
+            self.transactionStorage.add({"index": i, "sender": sender, "to": to, "memo": ""})
+        self.assertEqual(
+            self.transactionStorage.create_indexes(),
+            ["ix_transaction_memo_sender", "ix_transaction_memo_to"],
+        )
+        self.transactionStorage.delete_excluded(exclusions)
+        rows = [(trx["sender"], trx["to"]) for trx in self.transactionStorage.get_all()]
+        self.assertEqual(rows, [("alice", "sbi10"), ("carol", "hivesbi1")])
+
+    def test_member_load_all(self):
+        memberStorage = MemberDB(self.db)
+        self.assertEqual(memberStorage.load_all(), {})
+        accounts = ["member%d" % i for i in range(7)]
+        memberStorage.add_batch(
+            [{"account": a, "shares": i, "avg_share_age": i / 2} for i, a in enumerate(accounts)]
+        )
+        store = ShareAgeStore()
+        members = memberStorage.load_all(store=store)
+        self.assertEqual(list(members), accounts)
+        for account in accounts:
+            self.assertIsInstance(members[account], Member)
+            self.assertIs(members[account].store, store)
+            self.assertEqual(dict(members[account]), dict(memberStorage.get(account)))
+
+        members = memberStorage.load_all(columns=["avg_share_age", "missing"])
+        self.assertEqual(dict(members["member3"]), {"account": "member3", "avg_share_age": 1.5})
+
+        rows = memberStorage.get_many(["member5", "member1", "nobody"], ["shares"], chunk_size=1)
+        self.assertEqual(
+            rows,
+            {
+                "member1": {"account": "member1", "shares": 1},
+                "member5": {"account": "member5", "shares": 5},
+            },
+        )
+
+    def test_bulk_upsert(self):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            # Statements on the table, not the schema inspection
+            if "member" in statement and not statement.startswith("PRAGMA"):
+                statements.append((statement.split(" ")[0], executemany))
+                conflicts.append("ON CONFLICT" in statement)
+
+        conflicts = []
+
+        for primary_id in ["account", "id"]:
+            db = dataset.connect("sqlite:///:memory:")
+            if primary_id == "account":
+                db.create_table("member", primary_id="account", primary_type=db.types.string(16))
+            else:
+                db.create_table("member")
+            table = db["member"]
+            table.insert({"account": "alice", "shares": 1, "last_post": datetime(2023, 1, 1)})
+            rows = [
+                {
+                    "account": "alice",
+                    "shares": 1,
+                    "last_post": datetime(2024, 1, 1, tzinfo=timezone.utc),
+                },
+                {"account": "bob", "shares": 2, "last_post": None},
+                {"account": "carol", "shares": 3, "last_post": None},
+            ]
+            event.listen(db.engine, "before_cursor_execute", count)
+            del statements[:]
+            del conflicts[:]
+            self.assertEqual(bulk_upsert(db, "member", rows, ["account"]), 3)
+            # One SELECT, one INSERT for bob and carol, one UPDATE of last_post
+            self.assertEqual(
+                sorted(statements), [("INSERT", True), ("SELECT", False), ("UPDATE", False)]
+            )
+            # The insert is an upsert when the keys are unique
+            self.assertEqual(any(conflicts), primary_id == "account")
+
+            # Unchanged rows are not written again
+            rows[2]["shares"] = 4
+            rows.append({"account": "carol", "bonus_shares": 1})
+            del statements[:]
+            self.assertEqual(bulk_upsert(db, "member", rows, ["account"]), 1)
+            # bonus_shares is a new column, both rows of carol make one UPDATE
+            self.assertEqual(
+                sorted(statements), [("ALTER", False), ("SELECT", False), ("UPDATE", False)]
+            )
+            event.remove(db.engine, "before_cursor_execute", count)
+
+            stored = {row["account"]: row for row in table.all()}
+            self.assertEqual(list(stored), ["alice", "bob", "carol"])
+            self.assertEqual(stored["alice"]["last_post"], datetime(2024, 1, 1))
+            self.assertEqual(stored["carol"]["shares"], 4)
+            self.assertEqual(stored["carol"]["bonus_shares"], 1)
+            self.assertIsNone(stored["bob"]["bonus_shares"])
+
+
+if __name__ == "__main__":
+    unittest.main()
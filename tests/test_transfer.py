@@ -0,0 +1,62 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from hive_sbi.sbi_transfer import prepared_ops
+
+
+class Op(dict):
+    @property
+    def op(self):
+        return {"type": "delegate_vesting_shares"}
+
+
+class AccountHist:
+    def __init__(self, name):
+        self.account = {"name": name}
+        self.batches = []
+
+    def prepare_transfers(self, ops):
+        self.batches.append(len(ops))
+
+
+def account_ops(count, start, step):
+    for n in range(count):
+        timestamp = start + timedelta(seconds=n * step)
+        yield Op(timestamp=timestamp, op_acc_index=n)
+
+
+class Testcases(unittest.TestCase):
+    def test_prepared_ops_in_batches(self):
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        hists = [AccountHist("steembasicincome"), AccountHist("sbi2")]
+        ops = [account_ops(25, start, 2), account_ops(10, start, 3)]
+        read = [0, 0]
+
+        def counted(position):
+            for op in ops[position]:
+                read[position] += 1
+                yield op
+
+        last_ops = {}
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            prepared = [
+                prepared_ops(executor, hists[n], counted(n), n, 0, {}, last_ops, batch_size=4)
+                for n in range(2)
+            ]
+            parsed = []
+            for position in range(2):
+                for json_op in prepared[position]:
+                    # At most the current and the next batch of an account are read
+                    self.assertLessEqual(read[position], (json_op["index"] // 4 + 2) * 4)
+                    parsed.append((position, json_op["index"]))
+
+        self.assertEqual(parsed, [(0, n) for n in range(25)] + [(1, n) for n in range(10)])
+        self.assertEqual(hists[0].batches, [4, 4, 4, 4, 4, 4, 1])
+        self.assertEqual(hists[1].batches, [4, 4, 2])
+        self.assertEqual(last_ops[0]["op_acc_index"], 24)
+        self.assertEqual(last_ops[1]["op_acc_index"], 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import base64
+import json
+import unittest
+import zlib
+from datetime import datetime
+from functools import partial
+
+import dataset
+
+from hive_sbi.hsbi.compact_ops import convert_ops
+from hive_sbi.hsbi.storage import IngestCursorDB
+from hive_sbi.hsbi.transfer_ops_storage import (
+    COMPACT_PREFIX,
+    COMPACT_ZDICT,
+    AccountTrx,
+    decode_op_dict,
+    encode_op_dict,
+)
+
+
+def ops_row(index, op_type):
+    return {
+        "virtual_op": 0,
+        "op_acc_index": index,
+        "op_acc_name": "alice",
+        "block": 1000 + index,
+        "trx_in_block": 0,
+        "op_in_trx": 0,
+        "timestamp": "2024-01-01T00:00:00",
+        "type": op_type,
+        "op_dict": json.dumps({"type": op_type, "index": index}),
+    }
+
+
+def history_op(index):
+    return {
+        "from": "bob",
+        "to": "alice",
+        "amount": {"amount": "1000", "precision": 3, "nai": "@@000000021"},
+        "memo": "@bob",
+        "trx_id": "6a1b7c0e4b4f0c5e2b3a4f5d6c7b8a9e0f1d2c3b",
+        "block": 1000 + index,
+        "trx_in_block": 3,
+        "op_in_trx": 0,
+        "virtual_op": 0,
+        "timestamp": "2024-01-01T00:00:00",
+        "account": "alice",
+        "type": "transfer",
+        "_id": "f3a2b1c0d9e8f7a6b5c4d3e2f1a0b9c8d7e6f5a4",
+        "index": index,
+    }
+
+
+class Testcases(unittest.TestCase):
+    def setUp(self):
+        self.db = dataset.connect("sqlite:///:memory:")
+        self.accountTrx = AccountTrx(self.db, "alice")
+        types = ["transfer", "vote", "delegate_vesting_shares"]
+        self.accountTrx.add_batch([ops_row(i, types[i % 3]) for i in range(25)])
+
+    def test_iter_all_matches_get_all(self):
+        for chunk_size in [1, 2, 7, 16, 100]:
+            ops = list(
+                self.accountTrx.iter_all(
+                    op_types=["transfer", "delegate_vesting_shares"],
+                    start_index=5,
+                    chunk_size=chunk_size,
+                )
+            )
+            expected = self.accountTrx.get_all(
+                op_types=["transfer", "delegate_vesting_shares"], start_index=5
+            )
+            self.assertEqual(
+                [op["op_acc_index"] for op in ops], [op["op_acc_index"] for op in expected]
+            )
+        self.assertEqual(len(list(self.accountTrx.iter_all(chunk_size=5))), 25)
+
+    def test_op_dict_is_decoded_lazily(self):
+        op = next(self.accountTrx.iter_all(start_index=3))
+        self.assertFalse(hasattr(op, "_op"))
+        self.assertEqual(op.op, {"type": "transfer", "index": 3})
+        self.assertIs(op.op, op.op)
+
+    def test_add_batch_moves_cursor(self):
+        cursorStorage = IngestCursorDB(self.db)
+        cursorStorage.create_table()
+        self.accountTrx.add_batch(
+            [ops_row(25, "vote"), ops_row(26, "transfer")],
+            cursor=partial(cursorStorage.set, "store_ops_db", "alice"),
+        )
+        cursor = cursorStorage.get("store_ops_db", "alice")
+        self.assertEqual(cursor["op_acc_index"], 26)
+        self.assertEqual(cursor["block"], 1026)
+        self.assertEqual(cursor["op_acc_index"], self.accountTrx.get_latest_index()["op_acc_index"])
+
+    def test_compact_op_dict_round_trip(self):
+        row = ops_row(30, "transfer")
+        row["timestamp"] = datetime(2024, 1, 1)
+        row["op_dict"] = json.dumps(history_op(30))
+        op_dict = encode_op_dict(row)
+        self.assertTrue(op_dict.startswith(COMPACT_PREFIX))
+        self.assertLess(len(op_dict), len(row["op_dict"]))
+        self.assertEqual(decode_op_dict(dict(row, op_dict=op_dict)), history_op(30))
+        # A field which differs from its column is kept
+        row["op_dict"] = json.dumps(dict(history_op(30), trx_in_block=300))
+        self.assertEqual(
+            decode_op_dict(dict(row, op_dict=encode_op_dict(row)))["trx_in_block"], 300
+        )
+
+    def test_compact_op_dict_drops_string_timestamp(self):
+        # Rows of store_ops_db hold the timestamp string of the op before they are written
+        row = ops_row(31, "transfer")
+        row["op_dict"] = json.dumps(history_op(31))
+        op_dict = encode_op_dict(row)
+        decompressor = zlib.decompressobj(zdict=COMPACT_ZDICT)
+        data = base64.b64decode(op_dict[len(COMPACT_PREFIX) :])
+        mask, op = json.loads(decompressor.decompress(data) + decompressor.flush())
+        self.assertNotIn("timestamp", op)
+        # All columns but trx_in_block, which differs from the op
+        self.assertEqual(mask, 0b1111101)
+        self.assertEqual(decode_op_dict(dict(row, op_dict=op_dict)), history_op(31))
+        # Read back from the database the column is a datetime
+        row["timestamp"] = datetime(2024, 1, 1)
+        self.assertEqual(decode_op_dict(dict(row, op_dict=op_dict)), history_op(31))
+
+    def test_compact_ops_are_decoded_transparently(self):
+        accountTrx = AccountTrx(self.db, "bob", compact=True)
+        rows = []
+        for index in range(3):
+            row = ops_row(index, "transfer")
+            row["timestamp"] = datetime(2024, 1, 1)
+            row["op_dict"] = json.dumps(history_op(index))
+            rows.append(row)
+        accountTrx.add_batch(rows)
+        ops = accountTrx.get_all()
+        self.assertEqual(json.loads(ops[0]["op_dict"]), history_op(0))
+        self.assertEqual([op.op for op in accountTrx.iter_all()], [history_op(i) for i in range(3)])
+
+        self.assertEqual(convert_ops(accountTrx, expand=True)[0], 3)
+        self.assertEqual(convert_ops(accountTrx, expand=True)[0], 0)
+        self.assertFalse(next(accountTrx.iter_all())["op_dict"].startswith(COMPACT_PREFIX))
+        self.assertEqual(convert_ops(accountTrx)[0], 3)
+        self.assertEqual([op.op for op in accountTrx.iter_all()], [history_op(i) for i in range(3)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Benchmark of the setup overhead of one run_all cycle
+
+Repeats the setup the nine modules of run_all did before HsbiContext (each
+run_module and each module run() loading the config, connecting both
+databases and reading the storage data) and the setup with one shared
+context. The modules themselves are not run. New database connections are
+counted on the connection pools. The node list is only updated with
+--nodes, it needs a connection to the Hive API.
+
+    python utils/bench_cycle_setup.py [repeat] [--nodes]
+"""
+
+import contextlib
+import io
+import logging
+import sys
+import time
+
+from nectar.nodelist import NodeList
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from hive_sbi.hsbi.context import HsbiContext
+from hive_sbi.hsbi.core import load_config, setup_database_connections, setup_storage_objects
+from hive_sbi.hsbi.init_db import init_database
+
+MODULES = 9
+
+connects = 0
+
+
+@event.listens_for(Pool, "connect")
+def count_connect(dbapi_connection, connection_record):
+    global connects
+    connects += 1
+
+
+def setup_before(update_nodes):
+    for _ in range(MODULES):
+        # run_module
+        config_data = load_config()
+        init_database(config_file="config.json")
+        db, db2 = setup_database_connections(config_data)
+        setup_storage_objects(db, db2)
+        # run() of the module
+        config_data = load_config()
+        db, db2 = setup_database_connections(config_data)
+        setup_storage_objects(db, db2)
+        if update_nodes:
+            nodes = NodeList()
+            nodes.update_nodes()
+            nodes.get_nodes(hive=config_data.get("hive_blockchain", True))
+
+
+def setup_after(update_nodes):
+    ctx = HsbiContext()
+    for _ in range(MODULES):
+        # run_module
+        ctx.init_database()
+        ctx.refresh()
+        # run() of the module
+        ctx.storage
+        if update_nodes:
+            ctx.nodes
+
+
+def measure(setup, repeat, update_nodes):
+    global connects
+    best = None
+    for _ in range(repeat):
+        connects = 0
+        start = time.perf_counter()
+        # init_database prints the state of every table
+        with contextlib.redirect_stdout(io.StringIO()):
+            setup(update_nodes)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, connects
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    repeat = int(args[0]) if args else 5
+    update_nodes = "--nodes" in sys.argv
+    # load_config logs every load
+    logging.disable(logging.INFO)
+    print(f"setup of {MODULES} modules, best of {repeat} runs")
+    for name, setup in [("before", setup_before), ("context", setup_after)]:
+        best, count = measure(setup, repeat, update_nodes)
+        print(f"{name:8s} {best * 1e3:9.1f} ms  {count:3d} connects")
+
+
+if __name__ == "__main__":
+    main()
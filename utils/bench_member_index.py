@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of member membership tests, list against MemberIndex
+
+The per-op cost of a list grows with the number of members, the one of
+MemberIndex stays flat. No database or node is needed.
+
+    python utils/bench_member_index.py [ops] [repeat]
+"""
+
+import random
+import sys
+import time
+
+from hive_sbi.hsbi.member_index import MemberIndex
+
+
+def best_time(members, authors, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = 0
+        for author in authors:
+            if author in members:
+                found += 1
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    n_ops = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    random.seed(18)
+    print(f"{n_ops} ops, best of {repeat} runs")
+    print(f"{'members':>8} {'list':>12} {'MemberIndex':>12}")
+    for n_members in [1000, 10000, 100000]:
+        accounts = ["member%d" % i for i in range(n_members)]
+        # Half of the streamed ops are by members, as in a busy block range
+        authors = [
+            random.choice(accounts) if random.random() < 0.5 else "other%d" % i
+            for i in range(n_ops)
+        ]
+        list_time = best_time(accounts, authors, repeat)
+        index_time = best_time(MemberIndex(accounts), authors, repeat)
+        print(
+            f"{n_members:8d} {list_time * 1e6 / n_ops:9.3f} us {index_time * 1e6 / n_ops:9.3f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of the memo parser over the memos of the trx table
+
+The account lookups are answered offline, every name which can be an account
+name counts as existing, so only tokenizing and parsing are measured.
+
+    python utils/bench_memo_parser.py [limit] [repeat]
+"""
+
+import contextlib
+import io
+import sys
+import time
+
+from hive_sbi.hsbi.account_lookup import AccountLookup, is_valid_account_name
+from hive_sbi.hsbi.core import load_config, setup_database_connections
+from hive_sbi.hsbi.memo_parser import MemoParser, tokenize
+from hive_sbi.hsbi.storage import TrxDB
+
+
+class OfflineAccountLookup(AccountLookup):
+    """Every valid account name exists, no node is asked"""
+
+    def __init__(self):
+        super().__init__(blockchain_instance=object())
+
+    def _fetch(self, names):
+        self.rpc_calls += 1
+        return {name: is_valid_account_name(name) for name in names}
+
+
+def load_memos(limit=None):
+    """Returns (memo, shares, account) of the trx rows with a memo"""
+    config_data = load_config()
+    db, db2 = setup_database_connections(config_data)
+    table = db2[TrxDB.__tablename__]
+    memos = []
+    for trx in table.find(order_by=["index", "source"], _streamed=True):
+        memo = trx["memo"]
+        if memo is None or len(memo.strip().replace("'", "")) == 0:
+            continue
+        memos.append((memo, max(int(trx["shares"] or 1), 1), trx["account"]))
+        if limit is not None and len(memos) >= limit:
+            break
+    return memos
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    memos = load_memos(limit)
+    if len(memos) == 0:
+        print("No memos found in the trx table")
+        return
+    print(f"{len(memos)} memos, best of {repeat} runs")
+
+    parser = MemoParser(blockchain_instance=object(), account_lookup=OfflineAccountLookup())
+    words = [
+        memo.strip().lower().replace(",", "  ").replace('"', "").split(" ") for memo, _, _ in memos
+    ]
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for words_memo in words:
+            tokenize(words_memo, parser.allowed_memo_words)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"tokenize:   {best * 1e6 / len(memos):8.2f} us/memo")
+
+    def parse_all():
+        # parse_memo prints every name which is not an account
+        with contextlib.redirect_stdout(io.StringIO()):
+            for memo, shares, account in memos:
+                parser.parse_memo(memo, shares, account)
+
+    # The first run fills the lookup cache, it is not counted
+    parse_all()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse_all()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"parse_memo: {best * 1e6 / len(memos):8.2f} us/memo")
+    print(f"lookups:    {parser.account_lookup.rpc_calls}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Benchmark of the share ages of all members, per member against ShareAgeStore
+
+"per member" repeats the Member code before ShareAgeStore: every share entry
+computes its age against its own datetime.now() when it is added, and each
+member sums its lists in calc_share_age. "store" appends the entries to one
+ShareAgeStore and runs calc_share_ages, with numpy when it is installed and
+with the Python loop of share_days. The members are created before the
+clock starts, the garbage collector is off while the clock runs. No
+database or node is needed.
+
+    python utils/bench_share_age.py [members] [repeat]
+"""
+
+import gc
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from hive_sbi.hsbi import member as member_module
+from hive_sbi.hsbi.member import Member, ShareAgeStore, calc_share_ages
+
+
+class PerMember(dict):
+    """The share age code of Member before ShareAgeStore"""
+
+    def __init__(self, account):
+        super().__init__(account=account, total_share_days=0, avg_share_age=0.0)
+        self.share_age_list = []
+        self.shares_list = []
+        self.share_timestamp = []
+
+    def append_share_age(self, timestamp, shares):
+        if shares == 0:
+            return
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        age = (datetime.now(timezone.utc)) - (timestamp)
+        share_age = int(age.total_seconds() / 60 / 60 / 24)
+        self.share_age_list.append(share_age)
+        self.shares_list.append(shares)
+        self.share_timestamp.append(timestamp)
+
+    def calc_share_age(self):
+        total_share_days = 0
+        if len(self.share_age_list) == 0:
+            self["total_share_days"] = total_share_days
+            self["avg_share_age"] = total_share_days
+            return
+        for i in range(len(self.share_age_list)):
+            total_share_days += self.share_age_list[i] * self.shares_list[i]
+        self["total_share_days"] = total_share_days
+        if sum(self.shares_list) > 0:
+            self["avg_share_age"] = total_share_days / sum(self.shares_list)
+        else:
+            self["avg_share_age"] = total_share_days
+
+
+def per_member(entries):
+    """Returns the seconds to add the share entries and sum the share days, and
+    the seconds of the calc_share_age calls alone"""
+    member_data = {account: PerMember(account) for account in entries}
+    start = time.perf_counter()
+    for account, member_entries in entries.items():
+        member = member_data[account]
+        for timestamp, shares in member_entries:
+            member.append_share_age(timestamp, shares)
+    calc_start = time.perf_counter()
+    for member in member_data.values():
+        member.calc_share_age()
+    end = time.perf_counter()
+    return end - start, end - calc_start
+
+
+def store(entries):
+    """Returns the seconds to add the share entries and sum the share days, and
+    the seconds of calc_share_ages alone"""
+    share_age_store = ShareAgeStore()
+    member_data = {account: Member(account, store=share_age_store) for account in entries}
+    start = time.perf_counter()
+    for account, member_entries in entries.items():
+        member = member_data[account]
+        for timestamp, shares in member_entries:
+            member.append_share_age(timestamp, shares)
+    calc_start = time.perf_counter()
+    calc_share_ages(member_data)
+    end = time.perf_counter()
+    return end - start, end - calc_start
+
+
+def best_time(func, entries, repeat):
+    # Like timeit, without garbage collection, whose pauses grow with the
+    # share entries the benchmark holds
+    gc.disable()
+    try:
+        runs = [func(entries) for _ in range(repeat)]
+    finally:
+        gc.enable()
+    return min(total for total, _ in runs), min(share_ages for _, share_ages in runs)
+
+
+def main():
+    n_members = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    random.seed(10)
+    now = datetime.now(timezone.utc)
+    entries = {
+        "member%d" % n: [
+            (now - timedelta(seconds=random.randint(0, 86400 * 2000)), random.randint(1, 100))
+            for _ in range(random.randint(1, 20))
+        ]
+        for n in range(n_members)
+    }
+    n_entries = sum(len(member_entries) for member_entries in entries.values())
+    print(f"{n_members} members, {n_entries} share entries, best of {repeat} runs")
+    print(f"{'':>24} {'total':>10} {'share ages':>12}")
+    total, share_ages = best_time(per_member, entries, repeat)
+    print(f"{'per member':>24} {total:9.3f}s {share_ages:11.3f}s")
+    modes = [("store, Python loop", None)]
+    if member_module.np is not None:
+        modes.insert(0, ("store, numpy", member_module.np))
+    for name, np in modes:
+        with mock.patch.object(member_module, "np", np):
+            total, share_ages = best_time(store, entries, repeat)
+        print(f"{name:>24} {total:9.3f}s {share_ages:11.3f}s")
+
+
+if __name__ == "__main__":
+    main()